@@ -1,6 +1,8 @@
 from pathlib import Path
 import os
 
+import dj_database_url
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # ── SECURITY (use env vars in prod) ─────────────────────────────────────────────
@@ -22,27 +24,40 @@ INSTALLED_APPS = [
     # Local apps
     "material",
     "users",
+    "tasks",
+    "mailer",
 ]
 
 MIDDLEWARE = [
+    "material.metrics.request_metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware", 
+    "material.replicas.replica_routing_middleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "material.metrics.view_timing_middleware",
 ]
 
 
 ROOT_URLCONF = "elda7e7a.urls"
+
+# "wsgi" (sync gunicorn workers) or "asgi" (uvicorn workers; the homepage,
+# level pages and Q&A use material.async_views). Read by gunicorn.conf.py too.
+# Under ASGI, WhiteNoise is the only sync-only middleware and costs one thread
+# hop per request. Live Q&A events need a shared cache (see Cache below).
+# hop per request.
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
 WSGI_APPLICATION = "elda7e7a.wsgi.application"
 SITE_ID = 1
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that also times rendering for material.metrics.
+        "BACKEND": "material.metrics.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -59,13 +74,100 @@ TEMPLATES = [
 ]
 
 # ── Database ───────────────────────────────────────────────────────────────────
+# Connections are reused for DATABASE_CONN_MAX_AGE seconds (checked before each
+# request reuses them) instead of being opened for every request.
+DATABASE_CONN_MAX_AGE = int(os.getenv("DATABASE_CONN_MAX_AGE", "600"))
+# Postgres only: "pool" keeps a bounded psycopg pool per process (size it to
+# the threads a worker runs); "external" is for PgBouncer in transaction mode,
+# which pools across processes instead. See material.dbpool for the stats.
+DATABASE_POOL = os.getenv("DATABASE_POOL", "")
+DATABASE_POOL_MIN_SIZE = int(os.getenv("DATABASE_POOL_MIN_SIZE", "1"))
+DATABASE_POOL_MAX_SIZE = int(os.getenv("DATABASE_POOL_MAX_SIZE", "4"))
+# Seconds a request waits for a pooled connection before failing.
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "10"))
+
+
+def database(url, **extra):
+    config = dj_database_url.parse(url, conn_max_age=DATABASE_CONN_MAX_AGE, conn_health_checks=True)
+    if config["ENGINE"] == "django.db.backends.postgresql":
+        if DATABASE_POOL == "pool":
+            # The pool decides how long connections live.
+            config["CONN_MAX_AGE"] = 0
+            config["OPTIONS"]["pool"] = {
+                "min_size": DATABASE_POOL_MIN_SIZE,
+                "max_size": DATABASE_POOL_MAX_SIZE,
+                "timeout": DATABASE_POOL_TIMEOUT,
+            }
+        elif DATABASE_POOL == "external":
+            # Transaction pooling hands each transaction a different server
+            # connection, so nothing may outlive one.
+            config["DISABLE_SERVER_SIDE_CURSORS"] = True
+            config["OPTIONS"]["prepare_threshold"] = None
+    return {**config, **extra}
+
+
+# The primary comes from DATABASE_URL (this SQLite file by default).
 DATABASES = {
+    "default": database(os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR / 'db.sqlite3'}")),
+}
+# Comma-separated read replica URLs, e.g.
+# DATABASE_REPLICA_URLS=postgres://app@replica1/elda7e7a,postgres://app@replica2/elda7e7a
+# The homepage, level pages and profile read from them (material.replicas);
+# locally, a copy of db.sqlite3 works: DATABASE_REPLICA_URLS=sqlite:////tmp/replica.sqlite3
+DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, os.getenv("DATABASE_REPLICA_URLS", "").split(",")), start=1):
+    alias = f"replica_{number}"
+    DATABASES[alias] = database(url.strip(), TEST={"MIRROR": "default"})
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ["material.replicas.ReplicaRouter"]
+# Clients that wrote read from the primary for this long, so they see their
+# own changes before replication catches up.
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "10"))
+# Postgres replicas further behind than this are skipped.
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+
+# ── Cache ──────────────────────────────────────────────────────────────────────
+# Quiz answer keys, the leaderboard and other derived data are versioned in the
+# cache, so every web and worker process must see the same one. Outside DEBUG
+# the default is a file cache shared by the processes on this host; for several
+# hosts point it at Redis:
+# DJANGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# DJANGO_CACHE_LOCATION=redis://cache:6379/0
+# A process-local cache is refused by `manage.py check` (material.checks) once
+# more than one process would use it.
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": os.getenv(
+            "DJANGO_CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache"
+            if DEBUG
+            else "django.core.cache.backends.filebased.FileBasedCache",
+        ),
+        "LOCATION": os.getenv("DJANGO_CACHE_LOCATION", "elda7e7a" if DEBUG else "/var/tmp/elda7e7a_cache"),
     }
 }
 
+# ── Scores ─────────────────────────────────────────────────────────────────────
+# "inline": points are applied to StudentHonor as they are awarded.
+# "deferred": points are only appended to the ScoreEvent ledger and folded in by
+# `manage.py materialize_scores --loop 5` (the Procfile's "scores" process), so
+# concurrent submissions never wait on the same StudentHonor row. Development
+# has no such process and stays inline.
+SCORE_LEDGER_MODE = os.getenv("SCORE_LEDGER_MODE", "inline" if DEBUG else "deferred")
+
+# ── Background tasks ───────────────────────────────────────────────────────────
+# Tasks are queued in the database and run by `manage.py run_worker`. With
+# TASKS_EAGER=1 they run in-process right after the enqueuing transaction
+# commits, so development works without a worker.
+TASKS_EAGER = os.getenv("TASKS_EAGER", "1" if DEBUG else "0") == "1"
+
+# ── Metrics ────────────────────────────────────────────────────────────────────
+# Per-request SQL, render and view timings (material.metrics), sent to the
+# browser as a Server-Timing header and scraped from /metrics by Prometheus
+# with "Authorization: Bearer $METRICS_TOKEN" (staff can open it logged in).
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 # ── Password Validation ────────────────────────────────────────────────────────
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -87,6 +189,19 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Browsers may reuse media for this long; ETag/Last-Modified revalidate after.
+MEDIA_CACHE_MAX_AGE = int(os.getenv("MEDIA_CACHE_MAX_AGE", str(60 * 60 * 24 * 30)))
+# "" streams files from Django; "x-accel-redirect" (nginx) or "x-sendfile"
+# (Apache/lighttpd) lets the proxy send them. For nginx, MEDIA_OFFLOAD_PREFIX
+# must be an `internal` location aliased to MEDIA_ROOT.
+MEDIA_OFFLOAD = os.getenv("MEDIA_OFFLOAD", "")
+MEDIA_OFFLOAD_PREFIX = os.getenv("MEDIA_OFFLOAD_PREFIX", "/protected-media/")
+
+# Resumable uploads (books, recordings) are assembled here before being moved
+# into MEDIA_ROOT; keep it on the same filesystem so the move is a rename.
+UPLOAD_STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", str(BASE_DIR / "upload_staging"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(2 * 1024 ** 3)))
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -100,6 +215,10 @@ EMAIL_BACKEND = os.getenv(
     "DJANGO_EMAIL_BACKEND",
     "django.core.mail.backends.console.EmailBackend"
 )
+# Mail is queued in mailer.OutboxMessage and sent in batches over one
+# connection; cap the send rate (messages/second, 0 = unlimited) to stay
+# under the SMTP provider's limits.
+MAIL_RATE_LIMIT = float(os.getenv("MAIL_RATE_LIMIT", "0"))
 
 # ── Security headers for prod (safe defaults) ──────────────────────────────────
 SECURE_BROWSER_XSS_FILTER = True
@@ -1,7 +1,10 @@
 from django.contrib import admin
-from django.urls import path, include
+import re
+
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from material.media import serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -9,5 +12,8 @@ urlpatterns = [
     path("users/", include(("users.urls", "users"), namespace="users")),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploaded media is served by the app in every environment (with Range and
+# caching support); set MEDIA_OFFLOAD to hand the transfer to nginx/Apache.
+urlpatterns += [
+    re_path(rf"^{re.escape(settings.MEDIA_URL.lstrip('/'))}(?P<path>.+)$", serve_media, name="media"),
+]
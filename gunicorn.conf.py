@@ -0,0 +1,18 @@
+"""
+Gunicorn settings for both deployment modes:
+
+    SERVER_MODE=wsgi  sync workers running elda7e7a.wsgi (default)
+    SERVER_MODE=asgi  uvicorn workers running elda7e7a.asgi
+
+Worker count comes from WEB_CONCURRENCY, as before.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "elda7e7a.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "elda7e7a.wsgi:application"
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mailer.outbox import BATCH_SIZE, deliver_pending
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox mail over one reused connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--rate", type=float,
+                            help="Messages per second (default: MAIL_RATE_LIMIT).")
+        parser.add_argument("--loop", type=float, metavar="SECONDS",
+                            help="Keep running, checking the outbox every SECONDS.")
+
+    def handle(self, *args, **options):
+        while True:
+            stats = deliver_pending(options["batch_size"], rate=options["rate"])
+            if stats["batches"] or not options["loop"]:
+                self.stdout.write(
+                    "Sent {sent}, retried {retried}, failed {failed} in {seconds:.2f}s "
+                    "({per_second:.1f} msg/s).".format(**stats)
+                )
+            if not options["loop"]:
+                return
+            time.sleep(options["loop"])
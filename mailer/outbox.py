@@ -0,0 +1,145 @@
+"""
+Persistent outbox for outgoing mail. Views call ``queue_mail``; the message is
+stored with the request's transaction and delivered later by ``deliver_pending``
+over one reused backend connection, optionally rate limited.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from tasks.models import Task
+from tasks.queue import backoff
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+LOCK_TIMEOUT = 10 * 60
+
+
+def queue_mail(subject, body, to, html=False, from_email=""):
+    """Store a message for delivery once the current transaction commits."""
+    message = OutboxMessage.objects.create(
+        subject=subject, body=body, html=html, from_email=from_email or "", to=list(to),
+    )
+    transaction.on_commit(schedule_delivery)
+    return message
+
+
+def schedule_delivery(delay=None):
+    """Queue a delivery task in ``delay`` seconds unless one is already due by then."""
+    from .tasks import deliver_outbox
+
+    due = timezone.now() + timedelta(seconds=delay or 0)
+    if not Task.objects.filter(name=deliver_outbox.name, status=Task.QUEUED, run_after__lte=due).exists():
+        deliver_outbox.enqueue(delay=delay)
+
+
+def next_send_after():
+    """When the earliest queued message (possibly waiting out a backoff) is due."""
+    return OutboxMessage.objects.filter(status=OutboxMessage.QUEUED).aggregate(
+        due=Min("send_after"))["due"]
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    ready = Q(status=OutboxMessage.QUEUED, send_after__lte=now) | Q(
+        status=OutboxMessage.SENDING, locked_until__lt=now,
+    )
+    with transaction.atomic():
+        pending = OutboxMessage.objects.filter(ready).order_by("send_after", "id")
+        if db_connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        batch = list(pending[:batch_size])
+        OutboxMessage.objects.filter(id__in=[m.id for m in batch]).update(
+            status=OutboxMessage.SENDING,
+            locked_until=now + timedelta(seconds=LOCK_TIMEOUT),
+            attempts=F("attempts") + 1,
+        )
+    for message in batch:
+        message.attempts += 1
+    return batch
+
+
+def _email(message):
+    email = EmailMessage(message.subject, message.body, message.from_email or None, message.to)
+    if message.html:
+        email.content_subtype = "html"
+    return email
+
+
+def _record_failure(message, error):
+    retry = message.attempts < MAX_ATTEMPTS
+    OutboxMessage.objects.filter(id=message.id).update(
+        status=OutboxMessage.QUEUED if retry else OutboxMessage.FAILED,
+        send_after=timezone.now() + timedelta(seconds=backoff(message.attempts)),
+        locked_until=None,
+        last_error=f"{type(error).__name__}: {error}",
+    )
+    logger.warning("Outbox message #%s failed (attempt %s): %s", message.id, message.attempts, error)
+    return retry
+
+
+def _mark_sent(message_ids):
+    if message_ids:
+        OutboxMessage.objects.filter(id__in=message_ids).update(
+            status=OutboxMessage.SENT, sent_at=timezone.now(), locked_until=None, last_error="",
+        )
+
+
+def deliver_pending(batch_size=BATCH_SIZE, rate=None, limit=None):
+    """
+    Send ready messages over a single backend connection, ``batch_size`` claimed
+    at a time, at most ``rate`` per second (MAIL_RATE_LIMIT; 0 = unlimited) and
+    at most ``limit`` in total. Failed messages are retried with backoff up to
+    MAX_ATTEMPTS. Returns throughput stats.
+    """
+    rate = getattr(settings, "MAIL_RATE_LIMIT", 0) if rate is None else rate
+    stats = {"sent": 0, "retried": 0, "failed": 0, "batches": 0}
+    started = time.monotonic()
+
+    def attempted():
+        return stats["sent"] + stats["retried"] + stats["failed"]
+
+    with get_connection(fail_silently=False) as mail_connection:
+        while limit is None or attempted() < limit:
+            batch = _claim(batch_size if limit is None else min(batch_size, limit - attempted()))
+            if not batch:
+                break
+            stats["batches"] += 1
+            sent_ids = []
+            try:
+                for message in batch:
+                    if rate:
+                        wait = started + attempted() / rate - time.monotonic()
+                        if wait > 0:
+                            time.sleep(wait)
+                    try:
+                        mail_connection.send_messages([_email(message)])
+                    except Exception as exc:
+                        stats["retried" if _record_failure(message, exc) else "failed"] += 1
+                        # The session may be unusable after an SMTP error.
+                        mail_connection.close()
+                        mail_connection.open()
+                    else:
+                        sent_ids.append(message.id)
+                        stats["sent"] += 1
+            finally:
+                _mark_sent(sent_ids)
+
+    stats["seconds"] = time.monotonic() - started
+    stats["per_second"] = stats["sent"] / stats["seconds"] if stats["seconds"] else 0.0
+    if stats["batches"]:
+        logger.info(
+            "Outbox: sent %(sent)s, retried %(retried)s, failed %(failed)s in %(batches)s batches, "
+            "%(seconds).2fs (%(per_second).1f msg/s)", stats,
+        )
+    return stats
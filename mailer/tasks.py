@@ -0,0 +1,17 @@
+from django.utils import timezone
+
+from tasks.queue import task
+
+from .outbox import deliver_pending, next_send_after, schedule_delivery
+
+TASK_LIMIT = 1000
+
+
+@task(max_attempts=5, timeout=15 * 60)
+def deliver_outbox():
+    deliver_pending(limit=TASK_LIMIT)
+    due = next_send_after()
+    if due is not None:
+        # Messages backing off after a failure are not ready yet; come back
+        # when the first one is rather than straight away.
+        schedule_delivery(delay=max(0.0, (due - timezone.now()).total_seconds()))
@@ -0,0 +1,77 @@
+import smtplib
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from tasks.models import Task
+
+from . import outbox
+from .models import OutboxMessage
+
+opened = []
+
+
+class CountingBackend(EmailBackend):
+    def open(self):
+        opened.append(self)
+        return True
+
+    def send_messages(self, messages):
+        if any("bounce" in address for m in messages for address in m.to):
+            raise smtplib.SMTPRecipientsRefused({})
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="mailer.tests.CountingBackend", MAIL_RATE_LIMIT=0, TASKS_EAGER=False)
+class OutboxTests(TestCase):
+    def setUp(self):
+        opened.clear()
+
+    def test_registration_queues_mail_and_delivery_reuses_one_connection(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("users:register"), {
+                "username": "student", "email": "student@example.com",
+                "password1": "a-Long-passw0rd", "password2": "a-Long-passw0rd",
+            })
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(Task.objects.filter(name="mailer.tasks.deliver_outbox").count(), 1)
+
+        for i in range(4):
+            outbox.queue_mail("Notice", "Hello", [f"s{i}@example.com"])
+        stats = outbox.deliver_pending(batch_size=2)
+        self.assertEqual((stats["sent"], stats["batches"]), (5, 3))
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(mail.outbox[0].to, ["student@example.com"])
+        self.assertEqual(mail.outbox[0].content_subtype, "html")
+        self.assertFalse(OutboxMessage.objects.exclude(status=OutboxMessage.SENT).exists())
+
+    def test_failed_messages_are_retried_then_given_up(self):
+        outbox.queue_mail("Notice", "Hello", ["bounce@example.com"])
+        outbox.queue_mail("Notice", "Hello", ["ok@example.com"])
+        with mock.patch.object(outbox, "MAX_ATTEMPTS", 2):
+            stats = outbox.deliver_pending()
+            self.assertEqual((stats["sent"], stats["retried"]), (1, 1))
+            self.assertEqual(outbox.deliver_pending()["sent"], 0)
+
+            OutboxMessage.objects.filter(status=OutboxMessage.QUEUED).update(send_after="2000-01-01T00:00Z")
+            self.assertEqual(outbox.deliver_pending()["failed"], 1)
+        bounced = OutboxMessage.objects.get(to=["bounce@example.com"])
+        self.assertEqual((bounced.status, bounced.attempts), (OutboxMessage.FAILED, 2))
+        self.assertIn("SMTPRecipientsRefused", bounced.last_error)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_failure_reschedules_delivery_for_when_the_backoff_ends(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            outbox.queue_mail("Notice", "Hello", ["bounce@example.com"])
+        # Eager delivery failed once and queued exactly one retry task.
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.QUEUED, 1))
+        retries = Task.objects.filter(name="mailer.tasks.deliver_outbox", status=Task.QUEUED)
+        self.assertEqual(retries.count(), 1)
+        self.assertGreater(retries.get().run_after, message.send_after - timedelta(seconds=1))
+        self.assertLessEqual(len(callbacks), 3)
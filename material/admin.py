@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     Level, StudentHonor, Book, Note, Record, Image,
-    Material, News, Quiz, QuizQuestion, QuizAnswer, Question, Reply
+    Material, News, Quiz, QuizQuestion, QuizAnswer, Question, Reply, ScoreEvent, ReplyVote, Blob
 )
 
 @admin.register(Level)
@@ -24,7 +24,30 @@ class MaterialAdmin(admin.ModelAdmin):
 class QuizAdmin(admin.ModelAdmin):
     list_display = ("id", "title", "level")
 
-admin.site.register(StudentHonor)
+@admin.register(ScoreEvent)
+class ScoreEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "source", "ref", "delta", "created_at", "applied")
+    list_filter = ("source", "applied")
+    search_fields = ("user__username", "ref")
+    readonly_fields = ("applied",)
+
+@admin.register(ReplyVote)
+class ReplyVoteAdmin(admin.ModelAdmin):
+    list_display = ("id", "reply", "user", "created_at", "counted")
+    list_filter = ("counted",)
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ("name", "size", "refcount", "created_at")
+    search_fields = ("sha256", "name")
+    readonly_fields = ("sha256", "name", "size", "refcount", "created_at")
+
+@admin.register(StudentHonor)
+class StudentHonorAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "score")
+    list_select_related = ("user",)
+    ordering = ("-score",)
+
 admin.site.register(Book)
 admin.site.register(Note)
 admin.site.register(Record)
@@ -0,0 +1,164 @@
+"""
+Async versions of the read-heavy pages and the Q&A endpoints, routed instead
+of their counterparts in material.views when SERVER_MODE is "asgi" (see
+gunicorn.conf.py). A worker keeps serving other clients while these wait on
+the cache, the database or a slow connection.
+
+Independent work is awaited together with asyncio.gather. Cache lookups
+overlap; Django's async ORM still runs a request's queries one after another
+on a single thread.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from . import leaderboard, live
+from .forms import QuestionForm, ReplyForm
+from .fragments import acached_fragment
+from .models import Level, News, Question, Reply
+from .pagination import akeyset_page
+from .replicas import replica_reads
+from .upvotes import cast_vote
+from .views import LEVEL_DEFAULT_TAB, LEVEL_TAB_PREPARE, LEVEL_TABS, is_staff, save_reply
+
+# Full-page templates read the session, messages and request.user lazily.
+arender = sync_to_async(render)
+
+
+def _leaderboard_snapshot():
+    return leaderboard.get_leaderboard(), leaderboard.current_generation()
+
+# ── Homepage ───────────────────────────────────────────────────────────────────
+@replica_reads
+async def homepage(request):
+    user = await request.auser()
+    staff = user.is_authenticated and is_staff(user)
+    board, generation = await sync_to_async(_leaderboard_snapshot)()
+
+    async def slides():
+        items = [n async for n in News.objects.filter(is_slide=True)[:5]]
+        return render_to_string("material/home/slides.html", {"slides": items})
+
+    async def news():
+        items = [n async for n in News.objects.all()[:6]]
+        return render_to_string("material/home/news.html", {"news_list": items})
+
+    async def levels():
+        items = [level async for level in Level.objects.all()]
+        return render_to_string("material/home/levels.html", {"levels": items, "show_staff_controls": staff})
+
+    async def honor_board():
+        return render_to_string("material/home/honor_board.html", {"top_students": board.top(8)})
+
+    slides_html, news_html, levels_html, honor_board_html = await asyncio.gather(
+        acached_fragment("slides", slides),
+        acached_fragment("news", news),
+        acached_fragment("levels", levels, variant="staff" if staff else "public"),
+        acached_fragment("honor_board", honor_board, version=generation),
+    )
+    return await arender(request, "material/home.html", {
+        "slides_html": slides_html,
+        "news_html": news_html,
+        "levels_html": levels_html,
+        "honor_board_html": honor_board_html,
+    })
+
+# ── Level detail ───────────────────────────────────────────────────────────────
+async def level_tab_context(request, level, tab):
+    queryset_for, ordering, size = LEVEL_TABS[tab]
+    cursor = request.GET.get("cursor")
+    items, next_cursor = await akeyset_page(queryset_for(level), ordering, cursor, size)
+    if tab in LEVEL_TAB_PREPARE:
+        await sync_to_async(LEVEL_TAB_PREPARE[tab])(request, items)
+    next_url = None
+    if next_cursor:
+        next_url = f"{reverse('material:level_tab', args=[level.id, tab])}?cursor={next_cursor}"
+    return {
+        "template": f"material/tabs/{tab}.html",
+        "level": level,
+        "items": items,
+        "is_first_page": not cursor,
+        "next_url": next_url,
+    }
+
+@replica_reads
+async def level_detail(request, level_id):
+    level = await aget_object_or_404(Level, id=level_id)
+    return await arender(request, "material/subs.html", {
+        "level": level,
+        "default_tab": await level_tab_context(request, level, LEVEL_DEFAULT_TAB),
+        "live_events": settings.SERVER_MODE == "asgi",
+    })
+
+async def level_tab(request, level_id, tab):
+    if tab not in LEVEL_TABS:
+        raise Http404("Unknown tab.")
+    level = await aget_object_or_404(Level, id=level_id)
+    context = await level_tab_context(request, level, tab)
+    return await arender(request, context["template"], context)
+
+# ── Q&A ────────────────────────────────────────────────────────────────────────
+async def add_question(request, level_id):
+    level = await aget_object_or_404(Level, id=level_id)
+    if request.method == "POST":
+        form = QuestionForm(request.POST)
+        if form.is_valid():
+            q = form.save(commit=False)
+            q.level = level
+            user = await request.auser()
+            if user.is_authenticated:
+                q.author_user = user
+                if not q.author:
+                    q.author = user.username
+            await q.asave()
+            messages.success(request, "Question added.")
+    return redirect("material:details", level_id=level_id)
+
+async def add_reply(request, question_id):
+    question = await aget_object_or_404(Question, id=question_id)
+    if request.method == "POST":
+        form = ReplyForm(request.POST)
+        if form.is_valid():
+            r = form.save(commit=False)
+            r.question = question
+            user = await request.auser()
+            if user.is_authenticated:
+                r.author_user = user
+                if not r.author:
+                    r.author = user.username
+            await sync_to_async(save_reply)(r)
+            messages.success(request, "Reply added.")
+    return redirect("material:details", level_id=question.level_id)
+
+@login_required
+async def upvote_reply(request, reply_id):
+    reply = await aget_object_or_404(Reply.objects.select_related("question"), id=reply_id)
+    if request.method == "POST":
+        if await sync_to_async(cast_vote)(await request.auser(), reply):
+            messages.success(request, "Upvoted.")
+        else:
+            messages.info(request, "You already upvoted this reply.")
+    return redirect("material:details", level_id=reply.question.level_id)
+
+async def level_events(request, level_id):
+    # An open stream would hold a sync worker forever; 204 tells EventSource
+    # not to reconnect.
+    if settings.SERVER_MODE != "asgi":
+        return HttpResponse(status=204)
+    level = await aget_object_or_404(Level, id=level_id)
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    response = StreamingHttpResponse(live.stream(level.id, last_event_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,35 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_versions(keys):
+    """
+    Current value of each version counter in ``keys``. Missing counters are
+    seeded from the clock so an evicted counter never reuses an old version.
+    """
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return found
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+async def aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
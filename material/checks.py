@@ -0,0 +1,39 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register()
+def shared_cache(app_configs, **kwargs):
+    """Refuse a per-process cache when more than one process relies on it.
+
+    Cache versions (quiz answer keys, page fragments, the leaderboard) and the
+    newest live event id are set by whichever process made the change; the
+    others only see it through a cache they all share.
+    """
+    if settings.CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_CACHES:
+        return []
+    reasons = []
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        reasons.append("WEB_CONCURRENCY is above 1")
+    if not settings.TASKS_EAGER:
+        reasons.append("tasks run in a separate `run_worker` process")
+    if settings.SERVER_MODE == "asgi":
+        # Live Q&A brokers learn about new events from a cache key that any
+        # process (web, worker, admin commands) may set.
+        reasons.append("live Q&A events are announced through it (SERVER_MODE=asgi)")
+    if not reasons:
+        return []
+    return [
+        Error(
+            "The default cache is local to each process, but " + " and ".join(reasons) + ".",
+            hint="Set DJANGO_CACHE_BACKEND to a shared backend (file, Redis or database cache).",
+            id="material.E001",
+        )
+    ]
@@ -0,0 +1,49 @@
+"""
+Per-process database connection statistics.
+
+``connects`` counts how often this process handed a request a connection:
+with persistent connections (DATABASE_CONN_MAX_AGE) that is one per thread per
+connection lifetime, with DATABASE_POOL="pool" it is one per pool checkout.
+Pooled aliases add psycopg_pool's own counters, including how long requests
+waited for a free connection.
+"""
+from collections import Counter
+
+from django.db import connections
+
+_connects = Counter()
+
+# psycopg_pool.get_stats() name -> ours
+POOL_STATS = {
+    "pool_size": "size",
+    "pool_available": "available",
+    "pool_max": "max_size",
+    "requests_num": "checkouts",
+    "requests_waiting": "waiting",
+    "requests_queued": "queued",
+    "requests_wait_ms": "wait_ms",
+    "requests_errors": "checkout_errors",
+    "connections_num": "opened",
+    "connections_ms": "open_ms",
+    "connections_lost": "lost",
+}
+
+
+def connection_opened(alias):
+    _connects[alias] += 1
+
+
+def connection_stats():
+    """Return ``{alias: {...}}`` for every configured database."""
+    stats = {}
+    for alias in connections:
+        wrapper = connections[alias]
+        entry = {"connects": _connects[alias]}
+        pool = wrapper.pool if "pool" in wrapper.settings_dict["OPTIONS"] else None
+        if pool is not None:
+            raw = pool.get_stats()
+            entry.update({ours: raw.get(theirs, 0) for theirs, ours in POOL_STATS.items()})
+            checkouts = entry["checkouts"]
+            entry["avg_wait_ms"] = round(entry["wait_ms"] / checkouts, 3) if checkouts else 0.0
+        stats[alias] = entry
+    return stats
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from .cache_versions import aget_version, bump_version, get_version
+
+VERSION_KEY = "fragment:{name}:version"
+FRAGMENT_KEY = "fragment:{name}:{version}:{variant}"
+# Last good render regardless of version, served while a new one is computed.
+STALE_KEY = "fragment:{name}:stale:{variant}"
+FRAGMENT_TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 2.0
+POLL_INTERVAL = 0.05
+
+
+def bump_fragment(name):
+    bump_version(VERSION_KEY.format(name=name))
+
+
+def cached_fragment(name, render, variant="default", version=None):
+    """
+    Return the HTML produced by ``render()``, cached under the fragment's current
+    version. Only one caller recomputes a missing fragment (single flight); the
+    others get the previous render if there is one, or wait briefly for the new
+    one. ``version`` overrides the signal-bumped counter for fragments that
+    already have their own generation number.
+    """
+    if version is None:
+        version = get_version(VERSION_KEY.format(name=name))
+    key = FRAGMENT_KEY.format(name=name, version=version, variant=variant)
+    stale_key = STALE_KEY.format(name=name, variant=variant)
+
+    html = cache.get(key)
+    if html is not None:
+        return mark_safe(html)
+
+    lock_key = f"{key}:lock"
+    owns_lock = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if not owns_lock:
+        html = cache.get(stale_key)
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while html is None and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            html = cache.get(key)
+        if html is not None:
+            return mark_safe(html)
+
+    try:
+        html = str(render())
+        cache.set_many({key: html, stale_key: html}, FRAGMENT_TIMEOUT)
+    finally:
+        if owns_lock:
+            cache.delete(lock_key)
+    return mark_safe(html)
+
+
+async def acached_fragment(name, render, variant="default", version=None):
+    """Async version of cached_fragment; ``render`` is a coroutine function."""
+    if version is None:
+        version = await aget_version(VERSION_KEY.format(name=name))
+    key = FRAGMENT_KEY.format(name=name, version=version, variant=variant)
+    stale_key = STALE_KEY.format(name=name, variant=variant)
+
+    html = await cache.aget(key)
+    if html is not None:
+        return mark_safe(html)
+
+    lock_key = f"{key}:lock"
+    owns_lock = await cache.aadd(lock_key, 1, LOCK_TIMEOUT)
+    if not owns_lock:
+        html = await cache.aget(stale_key)
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while html is None and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            html = await cache.aget(key)
+        if html is not None:
+            return mark_safe(html)
+
+    try:
+        html = str(await render())
+        await cache.aset_many({key: html, stale_key: html}, FRAGMENT_TIMEOUT)
+    finally:
+        if owns_lock:
+            await cache.adelete(lock_key)
+    return mark_safe(html)
@@ -0,0 +1,86 @@
+from django.core.exceptions import BadRequest
+
+from .models import Quiz, QuizQuestion
+
+SINGLE_ANSWER_TYPES = ("single", "truefalse")
+
+
+class InvalidSubmission(BadRequest):
+    pass
+
+
+def compile_answer_keys(quiz_ids):
+    """
+    Load every question and answer of the given quizzes in one LEFT JOIN and
+    return ``{quiz_id: answer_key}`` with plain answer keys; quizzes that do not
+    exist are left out:
+
+        {"id": 1, "title": "...", "level_id": 3, "questions": [
+            {"id": 7, "text": "...", "type": "single",
+             "answers": [{"id": 21, "text": "..."}, ...],
+             "correct": frozenset({21})},
+        ]}
+    """
+    keys = {
+        quiz["id"]: {**quiz, "questions": []}
+        for quiz in Quiz.objects.filter(id__in=quiz_ids).values("id", "title", "level_id")
+    }
+    if not keys:
+        return keys
+    rows = (
+        QuizQuestion.objects.filter(quiz_id__in=keys)
+        .order_by("quiz_id", "id", "answers__id")
+        .values_list("quiz_id", "id", "text", "question_type", "answers__id", "answers__text", "answers__is_correct")
+    )
+    for quiz_id, q_id, q_text, q_type, a_id, a_text, a_correct in rows:
+        questions = keys[quiz_id]["questions"]
+        if not questions or questions[-1]["id"] != q_id:
+            questions.append({"id": q_id, "text": q_text, "type": q_type, "answers": [], "correct": frozenset()})
+        if a_id is not None:
+            questions[-1]["answers"].append({"id": a_id, "text": a_text})
+            if a_correct:
+                questions[-1]["correct"] |= {a_id}
+    return keys
+
+
+def _chosen_ids(question, values):
+    answer_ids = {a["id"] for a in question["answers"]}
+    try:
+        chosen = {int(v) for v in values if v != ""}
+    except ValueError:
+        raise InvalidSubmission(f"Malformed answer for question {question['id']}.")
+    if not chosen <= answer_ids:
+        raise InvalidSubmission(f"Answer does not belong to question {question['id']}.")
+    if question["type"] in SINGLE_ANSWER_TYPES and len(chosen) > 1:
+        raise InvalidSubmission(f"Question {question['id']} accepts a single answer.")
+    return chosen
+
+
+def grade_submission(key, data):
+    """
+    Grade ``data`` (a QueryDict with ``question_<id>`` fields) against an answer
+    key from compile_answer_keys, entirely in memory.
+
+    Returns ``(correct, total, wrong_questions)``; ``wrong_questions`` has the
+    shape expected by material/quiz_result.html. Unanswered single-choice
+    questions count as wrong without being listed, as before.
+    """
+    correct = 0
+    wrong_questions = []
+    for question in key["questions"]:
+        chosen = _chosen_ids(question, data.getlist(f"question_{question['id']}"))
+        if question["type"] in SINGLE_ANSWER_TYPES:
+            if not chosen:
+                continue
+            is_correct = chosen <= question["correct"]
+        else:
+            is_correct = chosen == question["correct"]
+        if is_correct:
+            correct += 1
+            continue
+        wrong_questions.append({
+            "question": question,
+            "your_answers": [a for a in question["answers"] if a["id"] in chosen],
+            "correct_answers": [a for a in question["answers"] if a["id"] in question["correct"]],
+        })
+    return correct, len(key["questions"]), wrong_questions
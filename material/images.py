@@ -0,0 +1,116 @@
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image as PILImage, ImageOps
+
+# Resized copies are stored next to the original: level_images/a.jpg ->
+# level_images/a.w320.jpg and level_images/a.w320.webp.
+WIDTHS = (160, 320, 640, 1280)
+FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+MAX_ORIGINAL_SIZE = 2560
+QUALITY = 82
+WIDTHS_KEY = "img:widths:{name}"
+WIDTHS_TIMEOUT = 60 * 60 * 24
+# How long "no derivatives yet" is remembered, so new ones show up soon after
+# the background job finishes.
+MISSING_TIMEOUT = 60
+
+
+def derivative_name(name, width, fmt):
+    root, _ = os.path.splitext(name)
+    return f"{root}.w{width}{FORMATS[fmt]}"
+
+
+def _open_rgb(fp):
+    image = ImageOps.exif_transpose(PILImage.open(fp))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGBA")
+        background = PILImage.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    return image
+
+
+def downscale_upload(field_file):
+    """
+    Shrink a not-yet-saved upload so its longest side is at most
+    MAX_ORIGINAL_SIZE. Call before the model is saved.
+    """
+    if not field_file or getattr(field_file, "_committed", True):
+        return
+    upload = field_file.file
+    try:
+        upload.seek(0)
+        image = PILImage.open(upload)
+        fmt = image.format
+        too_big = max(image.size) > MAX_ORIGINAL_SIZE
+    except (OSError, ValueError):
+        return
+    finally:
+        upload.seek(0)
+    if not too_big:
+        return
+
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((MAX_ORIGINAL_SIZE, MAX_ORIGINAL_SIZE), PILImage.LANCZOS)
+    buffer = BytesIO()
+    if fmt == "JPEG":
+        image.convert("RGB").save(buffer, "JPEG", quality=QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt or "PNG", optimize=True)
+    field_file.file = ContentFile(buffer.getvalue(), name=upload.name)
+
+
+def field_label(field):
+    """``"app_label.Model.field"`` for a file field, as passed to image_storage()."""
+    return f"{field.model._meta.label}.{field.name}"
+
+
+def image_storage(label=None):
+    """The storage of the field named by field_label(), or default_storage."""
+    if label is None:
+        return default_storage
+    model, field = label.rsplit(".", 1)
+    return apps.get_model(model)._meta.get_field(field).storage
+
+
+def generate_derivatives(name, storage=default_storage):
+    """
+    Write a JPEG and a WebP copy of ``name`` at every width in WIDTHS that is
+    smaller than the original, in the storage holding it. Returns the widths
+    written.
+    """
+    # Content-addressed storage would file each copy under its own hash; it
+    # keeps derivatives beside the blob instead.
+    save = getattr(storage, "save_beside", storage.save)
+    with storage.open(name, "rb") as fp:
+        original = _open_rgb(fp)
+        original.load()
+
+    widths = [w for w in WIDTHS if w < original.width]
+    for width in widths:
+        image = original.copy()
+        image.thumbnail((width, original.height), PILImage.LANCZOS)
+        for fmt in FORMATS:
+            buffer = BytesIO()
+            image.save(buffer, fmt.upper(), quality=QUALITY, optimize=True)
+            target = derivative_name(name, width, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            save(target, ContentFile(buffer.getvalue()))
+    cache.set(WIDTHS_KEY.format(name=name), widths, WIDTHS_TIMEOUT)
+    return widths
+
+
+def available_widths(name, storage=default_storage):
+    """Widths with derivatives on disk, remembered in the cache."""
+    key = WIDTHS_KEY.format(name=name)
+    widths = cache.get(key)
+    if widths is None:
+        widths = [w for w in WIDTHS if storage.exists(derivative_name(name, w, "webp"))]
+        cache.set(key, widths, WIDTHS_TIMEOUT if widths else MISSING_TIMEOUT)
+    return widths
@@ -0,0 +1,241 @@
+import math
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from sortedcontainers import SortedList
+
+from .models import StudentHonor
+
+SNAPSHOT_KEY = "leaderboard:snapshot"
+GENERATION_KEY = "leaderboard:generation"
+# Every scores_changed() call takes the next sequence number and stores the
+# changed user ids under it, so the shared snapshot only re-reads those rows.
+CHANGE_SEQ_KEY = "leaderboard:changes"
+CHANGE_KEY = "leaderboard:change:{seq}"
+REFRESH_LOCK_KEY = "leaderboard:refresh"
+SNAPSHOT_TIMEOUT = 60 * 5
+CHANGE_TIMEOUT = 60 * 60
+# However often scores change, the shared snapshot is republished at most once
+# per interval; in between each process only folds its own changes into its
+# local copy.
+REFRESH_INTERVAL = 5
+# The snapshot is shared by every process, so it is never built from a replica
+# that may be behind (views using material.replicas call in here).
+honors = StudentHonor.objects.db_manager(DEFAULT_DB_ALIAS)
+
+
+class Leaderboard:
+    """
+    Ranked in-memory snapshot of StudentHonor. ``order`` holds ``(-score, user_id)``
+    sorted ascending, i.e. best first, so ranks are bisect lookups and updates
+    are logarithmic.
+
+    ``generation`` is the shared snapshot this copy was loaded from and
+    ``applied`` the last change sequence number folded into it. Changes a
+    process applies on its own copy in between are counted in ``local_changes``.
+    """
+
+    def __init__(self, rows, applied=0):
+        self.entries = {}
+        for user_id, username, score in rows:
+            self.entries[user_id] = (username, score)
+        self.order = SortedList((-score, user_id) for user_id, (_, score) in self.entries.items())
+        self.generation = None
+        self.applied = applied
+        self.stalled = None
+        self._adopt()
+
+    def _adopt(self):
+        self._lock = threading.RLock()
+        self.token = uuid.uuid4().hex[:12]
+        self.local_changes = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_lock", "token", "local_changes"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._adopt()
+
+    @classmethod
+    def from_db(cls, applied=0):
+        return cls(honors.exclude(user=None).values_list("user_id", "user__username", "score"), applied)
+
+    @property
+    def version(self):
+        """Cache version for what this copy shows; unique to the process once it has local changes."""
+        with self._lock:
+            if not self.local_changes:
+                return self.generation
+            return f"{self.generation}.{self.token}.{self.local_changes}"
+
+    def __len__(self):
+        return len(self.order)
+
+    def _rank_of_score(self, score):
+        # Standard competition ranking: 1 + number of students strictly ahead.
+        return self.order.bisect_left((-score,)) + 1
+
+    def rank(self, user_id):
+        with self._lock:
+            if user_id not in self.entries:
+                return None
+            return self._rank_of_score(self.entries[user_id][1])
+
+    def top_percent(self, user_id):
+        with self._lock:
+            rank = self.rank(user_id)
+            if rank is None:
+                return None
+            return max(1, math.ceil(100 * rank / len(self)))
+
+    def top(self, n):
+        result = []
+        with self._lock:
+            for neg_score, user_id in self.order.islice(0, n):
+                username, score = self.entries[user_id]
+                result.append({"rank": self._rank_of_score(score), "user_id": user_id,
+                               "username": username, "score": score})
+        return result
+
+    def discard(self, user_id):
+        with self._lock:
+            if user_id in self.entries:
+                _, score = self.entries.pop(user_id)
+                self.order.remove((-score, user_id))
+
+    def update(self, user_id, username, score):
+        with self._lock:
+            self.discard(user_id)
+            self.entries[user_id] = (username, score)
+            self.order.add((-score, user_id))
+
+    def apply(self, user_ids):
+        """Re-read the given users' rows; returns the board for chaining."""
+        rows = honors.filter(user_id__in=user_ids).values_list("user_id", "user__username", "score")
+        with self._lock:
+            seen = set()
+            for user_id, username, score in rows:
+                self.update(user_id, username, score)
+                seen.add(user_id)
+            for user_id in set(user_ids) - seen:
+                self.discard(user_id)
+        return self
+
+
+_lock = threading.Lock()
+_local = {"board": None, "expires": 0}
+
+
+def _use(board):
+    with _lock:
+        _local.update(board=board, expires=time.monotonic() + SNAPSHOT_TIMEOUT)
+    return board
+
+
+def get_leaderboard():
+    """
+    The current snapshot. Each process keeps a copy and only unpickles the shared
+    one when its generation changes.
+    """
+    state = cache.get_many([GENERATION_KEY, CHANGE_SEQ_KEY])
+    generation, seq = state.get(GENERATION_KEY), state.get(CHANGE_SEQ_KEY, 0)
+    with _lock:
+        board = _local["board"]
+        fresh = board is not None and board.generation == generation and time.monotonic() < _local["expires"]
+    if not fresh:
+        board = cache.get(SNAPSHOT_KEY) if generation is not None else None
+        if board is None:
+            board = Leaderboard.from_db(applied=seq)
+            _store(board)
+        _use(board)
+    if seq > board.applied:
+        board = _refresh() or board
+    return board
+
+
+def current_generation():
+    """Version of the snapshot this process last returned from get_leaderboard."""
+    with _lock:
+        board = _local["board"]
+    return board.version if board is not None else None
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def _store(board):
+    board.generation = _incr(GENERATION_KEY)
+    cache.set(SNAPSHOT_KEY, board, SNAPSHOT_TIMEOUT)
+    return board.generation
+
+
+def scores_changed(user_ids):
+    """
+    Fold the given users' scores into this process's snapshot straight away
+    and queue them for the shared one.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    seq = _incr(CHANGE_SEQ_KEY)
+    cache.set(CHANGE_KEY.format(seq=seq), user_ids, CHANGE_TIMEOUT)
+    board = get_leaderboard()
+    if board.applied < seq:
+        with board._lock:
+            board.apply(user_ids)
+            board.local_changes += 1
+    _refresh()
+
+
+def _refresh():
+    """
+    Fold the queued changes into the shared snapshot, unless another process
+    did so within REFRESH_INTERVAL. Only the changed users' rows are read.
+    """
+    if not cache.add(REFRESH_LOCK_KEY, 1, REFRESH_INTERVAL):
+        return None
+    seq = cache.get(CHANGE_SEQ_KEY, 0)
+    board = cache.get(SNAPSHOT_KEY)
+    if board is None:
+        return rebuild()
+    if board.applied >= seq:
+        cache.delete(REFRESH_LOCK_KEY)
+        return None
+    keys = [CHANGE_KEY.format(seq=n) for n in range(board.applied + 1, seq + 1)]
+    changes = cache.get_many(keys)
+    user_ids = set()
+    for key in keys:
+        if key not in changes:
+            break
+        user_ids.update(changes[key])
+        board.applied += 1
+    if board.applied < seq:
+        # A writer may be between taking its number and storing its ids; if
+        # the same entry is still missing an interval later, it was evicted.
+        if board.stalled == board.applied + 1:
+            return rebuild()
+        board.stalled = board.applied + 1
+    else:
+        board.stalled = None
+    board.apply(user_ids)
+    _store(board)
+    return _use(board)
+
+
+def rebuild():
+    seq = cache.get(CHANGE_SEQ_KEY, 0)
+    board = Leaderboard.from_db(applied=seq)
+    _store(board)
+    return _use(board)
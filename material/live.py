@@ -0,0 +1,165 @@
+"""
+Live Q&A updates for a level, streamed as Server-Sent Events.
+
+Under ASGI, publish() appends a LiveEvent in the writer's transaction and, on
+commit, stores the newest id in the cache; at most once per PRUNE_INTERVAL it
+also deletes events older than RETENTION. Each ASGI process runs one Broker per event
+loop: while anyone is subscribed it watches that cache key, loads new events
+with a single query and copies them into every subscriber's in-memory queue,
+so idle subscribers cost nothing and an event costs one query per process no
+matter how many students are watching. Clients resume with Last-Event-ID.
+The cache must be shared by every process (checked by material.checks).
+"""
+import asyncio
+import json
+import weakref
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import LiveEvent
+
+LATEST_KEY = "live:latest"
+PRUNE_KEY = "live:prune"
+POLL_INTERVAL = 0.5
+HEARTBEAT_INTERVAL = 15
+RETRY_MS = 3000
+QUEUE_SIZE = 100
+REPLAY_LIMIT = 200
+# Ids are allocated before commit, so a slow transaction can commit an id
+# below one already delivered; re-read this many ids behind the newest.
+LOOKBACK = 50
+RETENTION = timedelta(days=1)
+PRUNE_INTERVAL = 60 * 60
+
+
+def publish(level_id, kind, payload):
+    # Only ASGI workers stream events; under WSGI nothing would read the row.
+    if settings.SERVER_MODE != "asgi":
+        return None
+    event = LiveEvent.objects.create(level_id=level_id, kind=kind, payload=payload)
+    transaction.on_commit(lambda: cache.set(LATEST_KEY, event.id, timeout=None))
+    if cache.add(PRUNE_KEY, 1, PRUNE_INTERVAL):
+        transaction.on_commit(prune)
+    return event
+
+
+def prune():
+    """Delete events older than RETENTION. Returns how many were deleted."""
+    return LiveEvent.objects.filter(created_at__lt=timezone.now() - RETENTION).delete()[0]
+
+
+def format_event(event):
+    return f"id: {event.id}\nevent: {event.kind}\ndata: {json.dumps(event.payload)}\n\n"
+
+
+class Broker:
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.task = None
+        self.last_id = None
+        self.delivered = set()
+
+    def subscribe(self, level_id):
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.subscribers[level_id].add(queue)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return queue
+
+    def unsubscribe(self, level_id, queue):
+        queues = self.subscribers.get(level_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[level_id]
+
+    async def run(self):
+        if self.last_id is None:
+            self.last_id = (await LiveEvent.objects.aaggregate(last=Max("id")))["last"] or 0
+            # Whatever is already committed counts as delivered; subscribers
+            # get older events from the Last-Event-ID replay instead.
+            self.delivered = {
+                event_id async for event_id in
+                LiveEvent.objects.filter(id__gt=self.last_id - LOOKBACK).values_list("id", flat=True)
+            }
+        seen = await cache.aget(LATEST_KEY)
+        while self.subscribers:
+            await asyncio.sleep(POLL_INTERVAL)
+            latest = await cache.aget(LATEST_KEY)
+            if latest != seen:
+                seen = latest
+                await self.poll()
+
+    async def poll(self):
+        events = LiveEvent.objects.filter(id__gt=self.last_id - LOOKBACK).order_by("id")
+        async for event in events:
+            if event.id in self.delivered:
+                continue
+            self.delivered.add(event.id)
+            self.last_id = max(self.last_id, event.id)
+            self.dispatch(event)
+        self.delivered = {event_id for event_id in self.delivered if event_id > self.last_id - LOOKBACK}
+
+    def dispatch(self, event):
+        message = (event.id, format_event(event))
+        for queue in list(self.subscribers.get(event.level_id, ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too far behind: end the stream; the client reconnects and
+                # catches up from Last-Event-ID.
+                self.unsubscribe(event.level_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+_brokers = weakref.WeakKeyDictionary()
+
+
+def get_broker():
+    loop = asyncio.get_running_loop()
+    if loop not in _brokers:
+        _brokers[loop] = Broker()
+    return _brokers[loop]
+
+
+async def stream(level_id, last_event_id=None):
+    """Yield SSE messages for ``level_id``, first replaying what the client missed."""
+    broker = get_broker()
+    queue = broker.subscribe(level_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        replayed = 0
+        if last_event_id is not None:
+            oldest = await LiveEvent.objects.order_by("id").values_list("id", flat=True).afirst()
+            missed = [
+                event async for event in
+                LiveEvent.objects.filter(level_id=level_id, id__gt=last_event_id).order_by("id")[:REPLAY_LIMIT + 1]
+            ]
+            if len(missed) > REPLAY_LIMIT or (oldest is not None and oldest > last_event_id + 1):
+                # Events were pruned or too many were missed; reload instead.
+                yield "event: reset\ndata: {}\n\n"
+                return
+            for event in missed:
+                yield format_event(event)
+                replayed = event.id
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if message is None:
+                return
+            event_id, text = message
+            if event_id > replayed:
+                yield text
+    finally:
+        broker.unsubscribe(level_id, queue)
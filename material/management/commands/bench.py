@@ -0,0 +1,169 @@
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from material import leaderboard
+from material.models import Level, Quiz, ScoreEvent, StudentHonor
+from material.quiz_cache import get_answer_key
+
+from .seed_bench import STUDENT_NAME
+
+SCENARIOS = ("home", "level_detail", "level_qa", "level_quizzes", "quiz_submit", "profile", "search")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main views through the test client against the current database "
+        "(fill it with `manage.py seed_bench`), optionally comparing with a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per scenario first.")
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                            help="Only run this scenario (repeatable).")
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--baseline", help="Compare with results previously written by --output.")
+        parser.add_argument("--max-slowdown", type=float, default=0.25,
+                            help="Allowed p50 growth over the baseline, as a fraction.")
+        parser.add_argument("--max-tail-slowdown", type=float, default=0.5,
+                            help="Allowed p95 growth over the baseline, as a fraction.")
+        parser.add_argument("--max-alloc-growth", type=float, default=0.25,
+                            help="Allowed peak allocation growth over the baseline, as a fraction.")
+
+    def handle(self, *args, **options):
+        level = Level.objects.order_by("id").first()
+        student = User.objects.filter(username=STUDENT_NAME.format(1)).first()
+        if level is None or student is None:
+            raise CommandError("No bench data; run `manage.py seed_bench` on an empty database first.")
+        requests = self.scenarios(level, student)
+
+        results = {}
+        last_event = ScoreEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        score = StudentHonor.objects.get(user=student).score
+        try:
+            for name in options["scenario"] or SCENARIOS:
+                results[name] = self.measure(requests[name], student, options["warmup"], options["iterations"])
+                if options["verbosity"] > 0:
+                    self.stdout.write(self.format_row(name, results[name]))
+        finally:
+            # Undo quiz_submit's points so every run sees the same data.
+            ScoreEvent.objects.filter(id__gt=last_event, user=student).delete()
+            StudentHonor.objects.filter(user=student).update(score=score)
+            leaderboard.scores_changed([student.id])
+
+        report = {
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "server_mode": settings.SERVER_MODE,
+                "iterations": options["iterations"],
+            },
+            "scenarios": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                json.dump(report, stream, indent=2)
+                stream.write("\n")
+        if options["baseline"]:
+            self.compare(results, options)
+
+    def scenarios(self, level, student):
+        quiz = Quiz.objects.filter(level=level).order_by("id").first()
+        key = get_answer_key(quiz.id)
+        answers = {"quiz_id": str(quiz.id)}
+        for question in key["questions"]:
+            answers[f"question_{question['id']}"] = [str(a) for a in sorted(question["correct"])]
+        # name -> (method, url, data)
+        return {
+            "home": ("get", reverse("material:home"), None),
+            "level_detail": ("get", reverse("material:details", args=[level.id]), None),
+            "level_qa": ("get", reverse("material:level_tab", args=[level.id, "qa"]), None),
+            "level_quizzes": ("get", reverse("material:level_tab", args=[level.id, "quizzes"]), None),
+            "quiz_submit": ("post", reverse("material:quiz_submit", args=[level.id]), answers),
+            "profile": ("get", reverse("users:profile"), None),
+            "search": ("get", reverse("material:search"), {"q": "derivative equation"}),
+        }
+
+    def measure(self, request, student, warmup, iterations):
+        method, url, data = request
+        client = Client()
+        client.force_login(student)
+        send = getattr(client, method)
+
+        def call():
+            response = send(url, data) if data is not None else send(url)
+            if response.status_code >= 400:
+                raise CommandError(f"{method.upper()} {url} returned {response.status_code}.")
+
+        for _ in range(warmup):
+            call()
+        gc.collect()
+        timings = []
+        queries = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+
+        # Separate pass: tracing allocations slows every request down.
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(min(iterations, 5)):
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                call()
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(percentile(timings, 0.95), 3),
+            "queries": max(queries),
+            "alloc_peak_kb": round(statistics.median(peaks) / 1024, 1),
+        }
+
+    def format_row(self, name, result):
+        return (f"{name:15} p50 {result['p50_ms']:8.2f} ms   p95 {result['p95_ms']:8.2f} ms   "
+                f"{result['queries']:3d} queries   {result['alloc_peak_kb']:9.1f} KiB peak")
+
+    def compare(self, results, options):
+        with open(options["baseline"], encoding="utf-8") as stream:
+            baseline = json.load(stream)["scenarios"]
+        failures = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            for metric, allowed in (("p50_ms", options["max_slowdown"]), ("p95_ms", options["max_tail_slowdown"])):
+                if result[metric] > before[metric] * (1 + allowed):
+                    failures.append(f"{name}: {metric} {before[metric]} -> {result[metric]}")
+            if result["queries"] > before["queries"]:
+                failures.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+            if result["alloc_peak_kb"] > before["alloc_peak_kb"] * (1 + options["max_alloc_growth"]):
+                failures.append(f"{name}: alloc_peak_kb {before['alloc_peak_kb']} -> {result['alloc_peak_kb']}")
+        if failures:
+            raise CommandError("Slower than the baseline:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"Within thresholds of {options['baseline']}."))
@@ -0,0 +1,80 @@
+import os
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import ImageField
+
+from material.images import FORMATS, WIDTHS, derivative_name, field_label
+from material.models import Blob
+from material.storage import content_models, content_storage_instance as storage, is_blob
+from material.tasks import generate_image_derivatives
+
+
+class Command(BaseCommand):
+    help = (
+        "Move files referenced by content-addressed fields into the cas/ tree, "
+        "sharing one blob per distinct content, and recount blob references."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Report what would be moved without changing anything.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        moved = missing = 0
+        legacy = set()
+        for model, fields in content_models():
+            for field in fields:
+                is_image = isinstance(model._meta.get_field(field), ImageField)
+                rows = model.objects.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+                for pk, name in rows.values_list("pk", field).iterator():
+                    if is_blob(name):
+                        continue
+                    if not storage.exists(name):
+                        missing += 1
+                        self.stderr.write(f"{model.__name__} #{pk}: {name} is missing, skipped.")
+                        continue
+                    moved += 1
+                    if dry_run:
+                        continue
+                    with transaction.atomic():
+                        with storage.open(name, "rb") as fp:
+                            new_name = storage.save(os.path.basename(name), fp)
+                        model.objects.filter(pk=pk).update(**{field: new_name})
+                    legacy.add(name)
+                    if is_image:
+                        generate_image_derivatives.enqueue(
+                            name=new_name, field=field_label(model._meta.get_field(field)))
+
+        if dry_run:
+            self.stdout.write(f"Would move {moved} files ({missing} missing).")
+            return
+
+        self.recount()
+        # Old paths are no longer referenced; remove them and their derivatives.
+        for name in legacy:
+            storage.delete(name)
+            for width in WIDTHS:
+                for fmt in FORMATS:
+                    storage.delete(derivative_name(name, width, fmt))
+        self.stdout.write(
+            f"Moved {moved} files ({missing} missing); {Blob.objects.count()} blobs, "
+            f"{len(legacy)} legacy files removed."
+        )
+
+    def recount(self):
+        """Set every blob's refcount from the rows that reference it; drop unused blobs."""
+        references = Counter()
+        for model, fields in content_models():
+            for field in fields:
+                references.update(model.objects.filter(**{f"{field}__startswith": "cas/"})
+                                  .values_list(field, flat=True).iterator())
+        for blob in Blob.objects.iterator():
+            count = references.get(blob.name, 0)
+            if count == 0:
+                blob.delete()
+                storage.delete_blob(blob.name)
+            elif count != blob.refcount:
+                Blob.objects.filter(pk=blob.pk).update(refcount=count)
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from material.quiz_io import export_rows, write_csv, write_jsonl
+
+
+class Command(BaseCommand):
+    help = "Stream every quiz with its questions and answers as JSON Lines or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("-o", "--output", default="-", help="Output file, or - for stdout.")
+        parser.add_argument("--format", choices=["jsonl", "csv"],
+                            help="Defaults to the output extension, jsonl otherwise.")
+        parser.add_argument("--level", type=int, help="Only export quizzes of this level id.")
+        parser.add_argument("--level-names", action="store_true",
+                            help="Write level names instead of ids.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options["output"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        writer = write_csv if fmt == "csv" else write_jsonl
+        stream = self.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+        started = time.monotonic()
+        try:
+            count = writer(stream, export_rows(options["level"], options["chunk_size"]), options["level_names"])
+        finally:
+            if stream is not self.stdout:
+                stream.close()
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stderr.write(f"Exported {count} quizzes in {elapsed:.1f}s ({count / elapsed:.0f} quizzes/s).")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from material.upvotes import BATCH_SIZE, flush_votes
+
+
+class Command(BaseCommand):
+    help = "Fold buffered reply upvotes into Reply.upvotes and author scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--loop", type=float, metavar="SECONDS",
+                            help="Keep running, flushing every SECONDS.")
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_votes(options["batch_size"])
+            if flushed or not options["loop"]:
+                self.stdout.write(f"Flushed {flushed} votes.")
+            if not options["loop"]:
+                return
+            time.sleep(options["loop"])
@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from material.images import available_widths, generate_derivatives
+from material.models import Image, Level, News
+
+
+class Command(BaseCommand):
+    help = "Create responsive derivatives for existing Level, Image and News images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true",
+                            help="Regenerate images that already have derivatives.")
+        parser.add_argument("--workers", type=int, default=4)
+
+    def names(self, force):
+        for model in (Level, Image, News):
+            storage = model._meta.get_field("image").storage
+            for name in model.objects.exclude(image="").exclude(image=None).values_list("image", flat=True).iterator():
+                if force or not available_widths(name, storage):
+                    yield name, storage
+
+    def process(self, item):
+        name, storage = item
+        try:
+            return name, generate_derivatives(name, storage), None
+        except Exception as exc:
+            return name, None, exc
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            for name, widths, error in pool.map(self.process, self.names(options["force"])):
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                else:
+                    done += 1
+                    if options["verbosity"] > 1:
+                        self.stdout.write(f"{name}: {', '.join(map(str, widths)) or 'no smaller widths'}")
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} images ({failed} failed) in {elapsed:.1f}s."))
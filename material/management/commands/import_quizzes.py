@@ -0,0 +1,80 @@
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from material.quiz_bulk import create_quizzes, validate_quiz
+from material.quiz_io import ImportRecordError, level_resolver, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream quizzes from a JSON Lines or CSV file into the database in batches. "
+        "Each batch is its own transaction, so an invalid quiz stops the import "
+        "after the batches before it were saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin.")
+        parser.add_argument("--format", choices=["jsonl", "csv"],
+                            help="Defaults to the file extension, jsonl otherwise.")
+        parser.add_argument("--batch-size", type=int, default=200,
+                            help="Quizzes per transaction; records are checked just before their batch.")
+        parser.add_argument("--skip-invalid", action="store_true",
+                            help="Report and skip invalid quizzes instead of stopping.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        reader = read_csv if fmt == "csv" else read_jsonl
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            self.import_stream(reader(stream), options)
+        except ImportRecordError as exc:
+            raise CommandError(str(exc))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def import_stream(self, records, options):
+        resolve_level = level_resolver()
+        valid = self.validated(records, resolve_level, options["skip_invalid"])
+        totals = {"quizzes": 0, "questions": 0, "answers": 0}
+        started = time.monotonic()
+        while True:
+            try:
+                batch = list(islice(valid, options["batch_size"]))
+            except ImportRecordError as exc:
+                # Not atomic: earlier batches are committed and stay.
+                raise ImportRecordError(exc.line, f"{exc.message} ({totals['quizzes']} quizzes before it were imported)")
+            if not batch:
+                break
+            create_quizzes(batch)
+            totals["quizzes"] += len(batch)
+            totals["questions"] += sum(len(q["questions"]) for q in batch)
+            totals["answers"] += sum(len(question["answers"]) for q in batch for question in q["questions"])
+            if options["verbosity"] > 1:
+                self.stdout.write(self.summary(totals, started))
+        self.stdout.write(self.style.SUCCESS("Done. " + self.summary(totals, started)))
+
+    def validated(self, records, resolve_level, skip_invalid):
+        for line, quiz in records:
+            errors = {}
+            quiz["level_id"] = resolve_level(quiz.pop("level"))
+            if quiz["level_id"] is None:
+                errors["level"] = "unknown level"
+            validate_quiz(quiz, errors, lambda i, j=None, part="text": (i, j, part))
+            if not errors:
+                yield quiz
+                continue
+            error = ImportRecordError(line, "; ".join(errors.values()))
+            if not skip_invalid:
+                raise error
+            self.stderr.write(f"Skipped {error}")
+
+    def summary(self, totals, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        rows = totals["quizzes"] + totals["questions"] + totals["answers"]
+        return (f"{totals['quizzes']} quizzes, {totals['questions']} questions, {totals['answers']} answers "
+                f"in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)")
@@ -0,0 +1,468 @@
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from .bench import percentile
+from .seed_bench import BENCH_PASSWORD, STUDENT_NAME
+
+# scenario -> default weight in the mix
+SCENARIOS = {"browse": 4, "level": 4, "quiz": 2, "reply": 1, "upvote": 1}
+READY_TIMEOUT = 30
+LEVEL_LINK = re.compile(r'href="(/levels/(\d+)/)"')
+FORM = re.compile(r"<form\b([^>]*)>(.*?)</form>", re.S)
+INPUT = re.compile(r"<input\b([^>]*)>")
+ATTR = re.compile(r'([\w-]+)="([^"]*)"')
+
+
+class ScenarioError(Exception):
+    pass
+
+
+def attrs(tag):
+    return dict(ATTR.findall(tag))
+
+
+def forms(html):
+    """(action, inner HTML, input attributes) for every <form> in the page."""
+    for head, body in FORM.findall(html):
+        yield attrs(head).get("action", ""), body, [attrs(tag) for tag in INPUT.findall(body)]
+
+
+def csrf_token(inputs):
+    for field in inputs:
+        if field.get("name") == "csrfmiddlewaretoken":
+            return field["value"]
+    raise ScenarioError("Form without a CSRF token.")
+
+
+class Browser:
+    """
+    One keep-alive HTTP/1.1 connection with its own cookie jar: a student's
+    browser, minus everything but the HTML.
+    """
+
+    def __init__(self, host, port, timeout):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.cookies = {}
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method, path, data=None):
+        reused = self.writer is not None
+        try:
+            return await asyncio.wait_for(self._exchange(method, path, data), self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError) as exc:
+            await self.close()
+            # The server may close an idle keep-alive connection at any time;
+            # retry once on a fresh one if it had not answered anything yet.
+            if not reused or getattr(exc, "partial", b""):
+                raise
+            return await asyncio.wait_for(self._exchange(method, path, data), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _exchange(self, method, path, data):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = urlencode(data, doseq=True).encode() if data is not None else b""
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        if self.cookies:
+            lines.append("Cookie: " + "; ".join(f"{name}={value}" for name, value in self.cookies.items()))
+        if data is not None:
+            lines += ["Content-Type: application/x-www-form-urlencoded", f"Content-Length: {len(body)}"]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip()
+            if name == "set-cookie":
+                self.set_cookie(value)
+            else:
+                headers[name] = value
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while size := int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16):
+                chunks.append(await self.reader.readexactly(size + 2))
+            while await self.reader.readuntil(b"\r\n") != b"\r\n":
+                pass
+            content = b"".join(chunk[:-2] for chunk in chunks)
+        elif "content-length" in headers:
+            content = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            content = await self.reader.read()
+            headers["connection"] = "close"
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, headers, content.decode("utf-8", "replace")
+
+    def set_cookie(self, header):
+        for name, morsel in SimpleCookie(header).items():
+            if morsel.value == "" or morsel["max-age"] == "0":
+                self.cookies.pop(name, None)
+            else:
+                self.cookies[name] = morsel.value
+
+
+class Student:
+    """A logged-in virtual user running scenarios one after another."""
+
+    def __init__(self, run, username):
+        self.run = run
+        self.username = username
+        self.browser = Browser(run.host, run.port, run.timeout)
+        self.rng = random.Random(f"{run.seed}:{username}")
+
+    async def send(self, name, method, path, data=None, expect=200):
+        start = time.perf_counter()
+        try:
+            status, headers, html = await self.browser.request(method, path, data)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as exc:
+            self.run.record(name, time.perf_counter() - start, type(exc).__name__)
+            raise ScenarioError(f"{method} {path}: {type(exc).__name__}") from exc
+        error = None if status == expect else f"HTTP {status}"
+        self.run.record(name, time.perf_counter() - start, error)
+        if error:
+            raise ScenarioError(f"{method} {path}: {error}")
+        return headers, html
+
+    async def login(self):
+        path = reverse("users:login")
+        _, html = await self.send("GET login", "GET", path)
+        _, _, inputs = next((form for form in forms(html)
+                             if any(field.get("name") == "username" for field in form[2])), (None, None, []))
+        await self.send("POST login", "POST", path, {
+            "csrfmiddlewaretoken": csrf_token(inputs),
+            "username": self.username,
+            "password": self.run.password,
+        }, expect=302)
+        if "sessionid" not in self.browser.cookies:
+            raise ScenarioError(f"Could not log in as {self.username}.")
+
+    def level(self):
+        return self.rng.choice(self.run.levels)
+
+    async def tab(self, level, tab):
+        return (await self.send(f"GET tab:{tab}", "GET", reverse("material:level_tab", args=[level, tab])))[1]
+
+    def pick_form(self, html, pattern):
+        matches = [(action, body, inputs) for action, body, inputs in forms(html) if re.fullmatch(pattern, action)]
+        if not matches:
+            raise ScenarioError(f"No form matching {pattern} on the page.")
+        return self.rng.choice(matches)
+
+    # ── Scenarios ──────────────────────────────────────────────────────────────
+    async def browse(self):
+        await self.send("GET home", "GET", reverse("material:home"))
+
+    async def open_level(self):
+        level = self.level()
+        await self.send("GET level", "GET", reverse("material:details", args=[level]))
+        await self.tab(level, "news")
+
+    async def take_quiz(self):
+        level = self.level()
+        action, _, inputs = self.pick_form(await self.tab(level, "quizzes"), r"/levels/\d+/quiz/submit/")
+        choices = defaultdict(list)
+        for field in inputs:
+            if field.get("name", "").startswith("question_"):
+                choices[field["name"], field.get("type")].append(field["value"])
+        data = {"csrfmiddlewaretoken": csrf_token(inputs),
+                "quiz_id": next(f["value"] for f in inputs if f.get("name") == "quiz_id")}
+        for (name, kind), values in choices.items():
+            data[name] = self.rng.sample(values, self.rng.randint(1, len(values))) if kind == "checkbox" \
+                else self.rng.choice(values)
+        await self.send("POST quiz_submit", "POST", action, data)
+
+    async def post_reply(self):
+        level = self.level()
+        action, _, inputs = self.pick_form(await self.tab(level, "qa"), r"/questions/\d+/reply/add/")
+        await self.send("POST reply", "POST", action, {
+            "csrfmiddlewaretoken": csrf_token(inputs),
+            "content": f"Load test reply from {self.username}.",
+        }, expect=302)
+
+    async def upvote(self):
+        level = self.level()
+        html = await self.tab(level, "qa")
+        candidates = [(action, inputs) for action, body, inputs in forms(html)
+                      if re.fullmatch(r"/replies/\d+/upvote/", action) and " disabled" not in body]
+        if not candidates:
+            # Everything on the first page is already upvoted by this student.
+            return
+        action, inputs = self.rng.choice(candidates)
+        await self.send("POST upvote", "POST", action, {"csrfmiddlewaretoken": csrf_token(inputs)}, expect=302)
+
+    async def loop(self, deadline):
+        handlers = {"browse": self.browse, "level": self.open_level, "quiz": self.take_quiz,
+                    "reply": self.post_reply, "upvote": self.upvote}
+        names, weights = zip(*self.run.mix.items())
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(names, weights)[0]
+            try:
+                await handlers[name]()
+            except ScenarioError as exc:
+                self.run.failed(name, str(exc))
+            else:
+                self.run.scenarios[name] += 1
+            if self.run.think_time:
+                await asyncio.sleep(self.rng.expovariate(1 / self.run.think_time))
+
+
+class LoadRun:
+    def __init__(self, host, port, options):
+        self.host, self.port = host, port
+        self.timeout = options["timeout"]
+        self.seed = options["seed"]
+        self.password = options["password"]
+        self.think_time = options["think_time"]
+        self.mix = options["mix"]
+        self.levels = []
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.scenarios = Counter()
+        self.scenario_errors = Counter()
+        self.first_errors = []
+
+    def record(self, name, seconds, error=None):
+        self.samples[name].append(seconds * 1000)
+        if error:
+            self.errors[name][error] += 1
+
+    def failed(self, scenario, message):
+        self.scenario_errors[scenario] += 1
+        if len(self.first_errors) < 10:
+            self.first_errors.append(message)
+
+    async def discover_levels(self):
+        browser = Browser(self.host, self.port, self.timeout)
+        try:
+            status, _, html = await browser.request("GET", reverse("material:home"))
+        finally:
+            await browser.close()
+        self.levels = sorted({int(level_id) for _, level_id in LEVEL_LINK.findall(html)})
+        if status != 200 or not self.levels:
+            raise CommandError("The homepage lists no levels; seed the server's database with `manage.py seed_bench`.")
+
+    async def main(self, usernames, ramp_up, duration):
+        await self.discover_levels()
+        students = [Student(self, username) for username in usernames]
+
+        # Logins are timed but kept out of the steady-state figures: password
+        # hashing would otherwise dominate short runs.
+        async def log_in(i, student):
+            await asyncio.sleep(ramp_up * i / len(students))
+            try:
+                await student.login()
+                return student
+            except ScenarioError as exc:
+                self.failed("login", str(exc))
+                return None
+
+        started = time.perf_counter()
+        students = [s for s in await asyncio.gather(*(log_in(i, s) for i, s in enumerate(students))) if s]
+        login_seconds = time.perf_counter() - started
+        if not students:
+            raise CommandError("No virtual user could log in:\n  " + "\n  ".join(self.first_errors))
+        login_samples = {name: self.samples.pop(name, []) for name in ("GET login", "POST login")}
+        login_errors = {name: self.errors.pop(name, Counter()) for name in login_samples}
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(student.loop(started + duration) for student in students))
+        finally:
+            elapsed = time.perf_counter() - started
+            for student in students:
+                await student.browser.close()
+        return self.report(len(students), elapsed, login_seconds, login_samples, login_errors)
+
+    def summary(self, samples, errors, elapsed=None):
+        entry = {
+            "requests": len(samples),
+            "errors": sum(errors.values()),
+            "error_rate": round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+            "p50_ms": round(percentile(samples, 0.5), 2) if samples else None,
+            "p90_ms": round(percentile(samples, 0.9), 2) if samples else None,
+            "p99_ms": round(percentile(samples, 0.99), 2) if samples else None,
+            "max_ms": round(max(samples), 2) if samples else None,
+        }
+        if elapsed:
+            entry["rps"] = round(len(samples) / elapsed, 2)
+        if errors:
+            entry["error_kinds"] = dict(errors)
+        return entry
+
+    def report(self, users, elapsed, login_seconds, login_samples, login_errors):
+        everything = [ms for samples in self.samples.values() for ms in samples]
+        all_errors = sum((errors for errors in self.errors.values()), Counter())
+        return {
+            "users": users,
+            "duration_s": round(elapsed, 2),
+            "total": self.summary(everything, all_errors, elapsed),
+            "requests": {name: self.summary(samples, self.errors[name], elapsed)
+                         for name, samples in sorted(self.samples.items())},
+            "scenarios": {name: {"completed": self.scenarios[name], "failed": self.scenario_errors[name]}
+                          for name in self.mix},
+            "login": {"seconds": round(login_seconds, 2), "failed": self.scenario_errors["login"],
+                      **{name: self.summary(samples, login_errors[name])
+                         for name, samples in login_samples.items()}},
+            "first_errors": self.first_errors,
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test a running server with concurrent logged-in students browsing, taking "
+        "quizzes, replying and upvoting. Use --start to launch gunicorn (as in the Procfile) "
+        "for the run. The scenarios write to the database: point the server at one filled "
+        "by `manage.py seed_bench`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server to load (http only).")
+        parser.add_argument("--start", action="store_true",
+                            help="Start `gunicorn -c gunicorn.conf.py` on --url for the run and stop it after.")
+        parser.add_argument("--workers", type=int, help="gunicorn --workers (with --start).")
+        parser.add_argument("--worker-class", help="gunicorn --worker-class (with --start).")
+        parser.add_argument("--threads", type=int, help="gunicorn --threads (with --start).")
+        parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users.")
+        parser.add_argument("--students", type=int,
+                            help="Seeded students to log in as, shared round-robin (default: --users).")
+        parser.add_argument("--password", default=BENCH_PASSWORD)
+        parser.add_argument("--duration", type=float, default=30, help="Seconds of load after everyone logged in.")
+        parser.add_argument("--ramp-up", type=float, default=5, help="Seconds over which the users log in.")
+        parser.add_argument("--think-time", type=float, default=0,
+                            help="Mean pause between a user's scenarios in seconds (0: closed loop at full speed).")
+        parser.add_argument("--mix", action="append", metavar="SCENARIO=WEIGHT",
+                            help=f"Scenario weight, repeatable. Defaults: "
+                                 f"{', '.join(f'{k}={v}' for k, v in SCENARIOS.items())}.")
+        parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        if url.scheme != "http" or not url.hostname:
+            raise CommandError("--url must be an http:// URL.")
+        host, port = url.hostname, url.port or 80
+        options["mix"] = self.parse_mix(options["mix"])
+        students = options["students"] or options["users"]
+        usernames = [STUDENT_NAME.format(i % students + 1) for i in range(options["users"])]
+
+        server = self.start_server(host, port, options) if options["start"] else None
+        try:
+            run = LoadRun(host, port, options)
+            report = asyncio.run(run.main(usernames, options["ramp_up"], options["duration"]))
+        finally:
+            if server is not None:
+                self.stop_server(server)
+
+        report["environment"] = {
+            "url": options["url"],
+            "server": " ".join(server.args[2:]) if server is not None else None,
+            "server_mode": settings.SERVER_MODE,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "mix": options["mix"],
+            "think_time": options["think_time"],
+        }
+        if options["verbosity"] > 0:
+            self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                json.dump(report, stream, indent=2)
+                stream.write("\n")
+
+    def parse_mix(self, entries):
+        if not entries:
+            return dict(SCENARIOS)
+        mix = {}
+        for entry in entries:
+            name, _, weight = entry.partition("=")
+            if name not in SCENARIOS:
+                raise CommandError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}.")
+            try:
+                mix[name] = float(weight)
+            except ValueError:
+                raise CommandError(f"--mix {entry}: the weight must be a number.")
+        if not any(mix.values()):
+            raise CommandError("--mix needs at least one scenario with a positive weight.")
+        return {name: weight for name, weight in mix.items() if weight > 0}
+
+    # ── Server ─────────────────────────────────────────────────────────────────
+    def start_server(self, host, port, options):
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"{host}:{port}"]
+        for flag in ("workers", "worker_class", "threads"):
+            if options[flag]:
+                command += [f"--{flag.replace('_', '-')}", str(options[flag])]
+        with socket.socket() as probe:
+            if probe.connect_ex((host, port)) == 0:
+                raise CommandError(f"Something is already listening on {host}:{port}.")
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR)
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"gunicorn exited with status {server.returncode}.")
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                self.stdout.write(f"Started {' '.join(command[2:])}")
+                return server
+            except OSError:
+                time.sleep(0.2)
+        self.stop_server(server)
+        raise CommandError(f"gunicorn did not listen on {host}:{port} within {READY_TIMEOUT}s.")
+
+    def stop_server(self, server):
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=READY_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    # ── Report ─────────────────────────────────────────────────────────────────
+    def print_report(self, report):
+        total = report["total"]
+        self.stdout.write(
+            f"{report['users']} users for {report['duration_s']}s: {total['requests']} requests, "
+            f"{total['rps']} req/s, {total['error_rate']:.2%} errors "
+            f"(logins took {report['login']['seconds']}s, {report['login']['failed']} failed)"
+        )
+        self.stdout.write(f"{'request':18} {'count':>7} {'req/s':>8} {'err%':>6} "
+                          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name, entry in [*report["requests"].items(), ("total", total)]:
+            if not entry["requests"]:
+                continue
+            self.stdout.write(
+                f"{name:18} {entry['requests']:7d} {entry['rps']:8.1f} {entry['error_rate']:6.1%} "
+                f"{entry['p50_ms']:8.1f} {entry['p90_ms']:8.1f} {entry['p99_ms']:8.1f} {entry['max_ms']:8.1f}"
+            )
+        scenarios = ", ".join(f"{name} {entry['completed']} ok/{entry['failed']} failed"
+                              for name, entry in report["scenarios"].items())
+        self.stdout.write(f"Scenarios: {scenarios}")
+        for message in report["first_errors"]:
+            self.stdout.write(self.style.WARNING(f"  {message}"))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from material.scoring import BATCH_SIZE, materialize_scores, rebuild_scores
+
+
+class Command(BaseCommand):
+    help = "Fold pending ScoreEvent rows into StudentHonor scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--loop", type=float, metavar="SECONDS",
+                            help="Keep running, materializing every SECONDS.")
+        parser.add_argument("--rebuild", action="store_true",
+                            help="Recompute every score from the full ledger.")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            users = rebuild_scores(options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt scores for {users} users."))
+            return
+
+        while True:
+            started = time.monotonic()
+            applied = materialize_scores(options["batch_size"])
+            if applied or not options["loop"]:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"Applied {applied} events in {elapsed:.2f}s.")
+            if not options["loop"]:
+                return
+            time.sleep(options["loop"])
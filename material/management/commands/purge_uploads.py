@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from material.uploads import purge_stale
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads (and their staging files) that were abandoned."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=24,
+                            help="Purge uploads idle for longer than this.")
+
+    def handle(self, *args, **options):
+        purged = purge_stale(timedelta(hours=options["hours"]))
+        self.stdout.write(f"Purged {purged} uploads.")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from material.search import BATCH_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        indexed = rebuild(options["batch_size"])
+        self.stdout.write(f"Indexed {indexed} documents.")
@@ -0,0 +1,155 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from material import leaderboard, search
+from material.fragments import bump_fragment
+from material.models import (
+    Book, Level, News, Note, Question, Record, Reply, ReplyVote, StudentHonor,
+)
+from material.quiz_bulk import create_quizzes
+
+# Volumes at --scale 1.
+VOLUMES = {
+    "levels": 8,
+    "students": 2000,
+    "books": 40,         # per level
+    "notes": 40,         # per level
+    "records": 20,       # per level
+    "news": 12,          # per level
+    "quizzes": 15,       # per level
+    "questions": 20,     # per quiz
+    "threads": 500,      # Q&A questions per level
+    "replies": 4,        # average per thread
+}
+ANSWERS_PER_QUESTION = 4
+BENCH_PASSWORD = "bench-password"
+STUDENT_NAME = "student{:05d}"
+# Fixed so two runs with the same seed produce identical rows.
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+WORDS = (
+    "algebra geometry physics chemistry biology history grammar essay equation "
+    "function derivative integral vector matrix molecule reaction energy force "
+    "velocity cell genome revolution empire poem verb theorem proof exam revision "
+    "homework lecture chapter summary example exercise solution question answer"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Fill an empty database with a reproducible data set for `manage.py bench`."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=1, help="Random seed.")
+        parser.add_argument("--scale", type=float, default=1.0,
+                            help="Multiply every volume by this factor.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if Level.objects.exists():
+            raise CommandError("The database already has levels; seed_bench only fills an empty one "
+                               "(e.g. DATABASE_URL=sqlite:////tmp/bench.sqlite3 after migrate).")
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        volumes = {name: max(1, round(count * options["scale"])) for name, count in VOLUMES.items()}
+        started = time.monotonic()
+
+        with transaction.atomic():
+            students = self.create_students(volumes["students"])
+            levels = Level.objects.bulk_create(
+                Level(name=f"Level {i + 1}", description=self.sentence(12)) for i in range(volumes["levels"])
+            )
+            for level in levels:
+                self.create_material(level, volumes)
+                self.create_quizzes(level, volumes)
+                self.create_threads(level, volumes, students)
+
+        # bulk_create sends no signals, so refresh what they would have.
+        search.rebuild()
+        leaderboard.rebuild()
+        for name in ("slides", "news", "levels"):
+            bump_fragment(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(levels)} levels and {len(students)} students in {time.monotonic() - started:.1f}s "
+            f"(seed {options['seed']}, scale {options['scale']}). "
+            f"Students log in as {STUDENT_NAME.format(1)} / {BENCH_PASSWORD}."
+        ))
+
+    def sentence(self, words):
+        return " ".join(self.rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+    def moment(self, days=365):
+        return EPOCH + timedelta(seconds=self.rng.randrange(days * 24 * 3600))
+
+    def create_students(self, count):
+        # A fixed salt keeps the password hash identical between runs too.
+        password = make_password(BENCH_PASSWORD, salt=f"benchseed{self.rng.randrange(10**8):08d}")
+        students = User.objects.bulk_create(
+            (User(username=STUDENT_NAME.format(i + 1), email=f"{STUDENT_NAME.format(i + 1)}@example.com",
+                  password=password, date_joined=self.moment()) for i in range(count)),
+            batch_size=self.batch_size,
+        )
+        StudentHonor.objects.bulk_create(
+            (StudentHonor(user=student, score=int(self.rng.paretovariate(1.5) * 10)) for student in students),
+            batch_size=self.batch_size,
+        )
+        return students
+
+    def create_material(self, level, volumes):
+        for model, count, path in (
+            (Book, volumes["books"], "books/bench.pdf"),
+            (Note, volumes["notes"], "notes/bench.pdf"),
+            (Record, volumes["records"], "records/bench.mp3"),
+        ):
+            model.objects.bulk_create(
+                (model(level=level, title=self.sentence(4), file=path) for _ in range(count)),
+                batch_size=self.batch_size,
+            )
+        News.objects.bulk_create(
+            (News(level=level, title=self.sentence(5), content=self.sentence(60),
+                  created_at=self.moment(), is_slide=self.rng.random() < 0.1) for _ in range(volumes["news"])),
+            batch_size=self.batch_size,
+        )
+
+    def create_quizzes(self, level, volumes):
+        quizzes = []
+        for q in range(volumes["quizzes"]):
+            questions = []
+            for _ in range(volumes["questions"]):
+                question_type = self.rng.choice(("single", "single", "multiple", "truefalse"))
+                correct = set(self.rng.sample(range(ANSWERS_PER_QUESTION), 2 if question_type == "multiple" else 1))
+                questions.append({
+                    "text": self.sentence(10)[:-1] + "?",
+                    "type": question_type,
+                    "answers": [{"text": self.sentence(3), "is_correct": a in correct}
+                                for a in range(ANSWERS_PER_QUESTION)],
+                })
+            quizzes.append({"title": f"{level.name} quiz {q + 1}", "level_id": level.id, "questions": questions})
+        create_quizzes(quizzes, batch_size=self.batch_size)
+
+    def create_threads(self, level, volumes, students):
+        threads = Question.objects.bulk_create(
+            (Question(level=level, author_user=self.rng.choice(students), content=self.sentence(25),
+                      created_at=self.moment()) for _ in range(volumes["threads"])),
+            batch_size=self.batch_size,
+        )
+        replies = Reply.objects.bulk_create(
+            (Reply(question=thread, author_user=self.rng.choice(students), content=self.sentence(20),
+                   created_at=thread.created_at + timedelta(minutes=self.rng.randrange(1, 5000)))
+             for thread in threads for _ in range(self.rng.randint(0, 2 * volumes["replies"]))),
+            batch_size=self.batch_size,
+        )
+        votes = []
+        for reply in replies:
+            voters = self.rng.sample(students, min(len(students), int(self.rng.expovariate(0.5))))
+            reply.upvotes = len(voters)
+            votes += [ReplyVote(reply=reply, user=voter, counted=True,
+                                created_at=reply.created_at + timedelta(minutes=self.rng.randrange(1, 5000)))
+                      for voter in voters]
+        Reply.objects.bulk_update(replies, ["upvotes"], batch_size=self.batch_size)
+        ReplyVote.objects.bulk_create(votes, batch_size=self.batch_size)
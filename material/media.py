@@ -0,0 +1,151 @@
+"""
+Media delivery with HTTP Range, validators and long-lived caching.
+
+Files are streamed with FileResponse from an open handle, so servers that
+provide wsgi.file_wrapper (gunicorn) send them with sendfile(). With
+MEDIA_OFFLOAD set, the response only carries an X-Accel-Redirect (nginx) or
+X-Sendfile (Apache, lighttpd) header and the fronting proxy sends the bytes.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import is_blob
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+class _FileRange:
+    """A read-only view of ``length`` bytes of an open file from its current offset."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Return ``(start, end)`` (inclusive) for a single ``bytes=`` range, None to
+    ignore the header (malformed or multiple ranges), or ``False`` when the
+    range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(("W/", '"')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == mtime
+
+
+def _offload(response, path, full_path):
+    mode = getattr(settings, "MEDIA_OFFLOAD", "")
+    if mode == "x-accel-redirect":
+        response["X-Accel-Redirect"] = settings.MEDIA_OFFLOAD_PREFIX + quote(path)
+    elif mode == "x-sendfile":
+        response["X-Sendfile"] = full_path
+    else:
+        return False
+    return True
+
+
+def _stream(full_path, content_type, byte_range, size):
+    file = open(full_path, "rb")
+    if not byte_range:
+        return FileResponse(file, content_type=content_type)
+    start, end = byte_range
+    file.seek(start)
+    response = FileResponse(_FileRange(file, end - start + 1), content_type=content_type, status=206)
+    response["Content-Length"] = end - start + 1
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = default_storage.path(path)
+    except (SuspiciousFileOperation, NotImplementedError):
+        raise Http404("File not found")
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404("File not found")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+
+    size = stat.st_size
+    mtime = int(stat.st_mtime)
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+    if encoding:
+        content_type = "application/octet-stream"
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        byte_range = None
+        if "Range" in request.headers and _if_range_matches(request, etag, mtime):
+            byte_range = parse_range(request.headers["Range"], size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+        else:
+            # With offloading the proxy handles Range itself.
+            response = HttpResponse(content_type=content_type)
+            if not _offload(response, path, full_path):
+                response = _stream(full_path, content_type, byte_range, size)
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(mtime)
+    response["Accept-Ranges"] = "bytes"
+    if is_blob(path):
+        # Content-addressed: the URL changes whenever the content does.
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response
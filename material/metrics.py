@@ -0,0 +1,238 @@
+"""
+Per-request timings: SQL query count, database time, template render time,
+view time and total time.
+
+request_metrics_middleware (first in MIDDLEWARE) starts a RequestStats for the
+request; the database execute wrapper installed on every connection (see
+material.signals) and the TimedDjangoTemplates backend add to it, and
+view_timing_middleware (last in MIDDLEWARE) times the view itself. The
+figures go out as a Server-Timing header and into per-URL-name histograms.
+
+Each process buffers its histogram counts and adds them to the shared cache
+at most every FLUSH_INTERVAL seconds, so /metrics reports every worker when
+the cache is shared between them.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.template.backends.django import DjangoTemplates, Template
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# name -> (help, buckets, scale for the integer sum kept in the cache)
+HISTOGRAMS = {
+    "request_duration_seconds": ("Time from the first middleware in to the response out.", SECONDS_BUCKETS, 10**6),
+    "view_duration_seconds": ("Time spent in the view function.", SECONDS_BUCKETS, 10**6),
+    "db_duration_seconds": ("Time spent executing SQL.", SECONDS_BUCKETS, 10**6),
+    "template_render_seconds": ("Time spent rendering templates.", SECONDS_BUCKETS, 10**6),
+    "db_queries": ("SQL queries per request.", (0, 1, 2, 5, 10, 20, 50, 100, 200, 500), 1),
+}
+PREFIX = "elda7e7a_"
+KEY = "metrics:{name}:{view}:{part}"
+VIEWS_KEY = "metrics:views"
+FLUSH_INTERVAL = 10
+UNRESOLVED = "unresolved"
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db: float = 0.0
+    render: float = 0.0
+    view: float = 0.0
+    rendering: bool = False
+
+
+_current = ContextVar("request_stats", default=None)
+_lock = threading.Lock()
+_pending = defaultdict(int)
+_views = set()
+_last_flush = time.monotonic()
+
+
+# ── Collection ─────────────────────────────────────────────────────────────────
+def query_timer(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db += time.perf_counter() - start
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.rendering = False
+            stats.render += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with render time added to RequestStats."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def _server_timing(stats, total):
+    return ", ".join([
+        f'db;dur={stats.db * 1000:.1f};desc="{stats.queries} queries"',
+        f"render;dur={stats.render * 1000:.1f}",
+        f"view;dur={stats.view * 1000:.1f}",
+        f"total;dur={total * 1000:.1f}",
+    ])
+
+
+def _finish(request, response, stats, start):
+    total = time.perf_counter() - start
+    if settings.SERVER_TIMING:
+        response["Server-Timing"] = _server_timing(stats, total)
+    match = getattr(request, "resolver_match", None)
+    observe(match.view_name if match else UNRESOLVED, {
+        "request_duration_seconds": total,
+        "view_duration_seconds": stats.view,
+        "db_duration_seconds": stats.db,
+        "template_render_seconds": stats.render,
+        "db_queries": stats.queries,
+    })
+    return response
+
+
+def request_metrics_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = RequestStats()
+            token = _current.set(stats)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(request, response, stats, start)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            stats = RequestStats()
+            token = _current.set(stats)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(request, response, stats, start)
+    return middleware
+
+
+def view_timing_middleware(get_response):
+    def add_view_time(start):
+        stats = _current.get()
+        if stats is not None:
+            stats.view += time.perf_counter() - start
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            start = time.perf_counter()
+            try:
+                return await get_response(request)
+            finally:
+                add_view_time(start)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            start = time.perf_counter()
+            try:
+                return get_response(request)
+            finally:
+                add_view_time(start)
+    return middleware
+
+
+for _middleware in (request_metrics_middleware, view_timing_middleware):
+    _middleware.sync_capable = True
+    _middleware.async_capable = True
+
+
+# ── Histograms ─────────────────────────────────────────────────────────────────
+def observe(view, values):
+    with _lock:
+        for name, value in values.items():
+            _, buckets, scale = HISTOGRAMS[name]
+            # Stored per bucket; export adds them up into Prometheus' "le" form.
+            _pending[KEY.format(name=name, view=view, part=bisect_left(buckets, value))] += 1
+            _pending[KEY.format(name=name, view=view, part="sum")] += round(value * scale)
+        _views.add(view)
+    if time.monotonic() - _last_flush > FLUSH_INTERVAL:
+        flush()
+
+
+def _incr(key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def flush():
+    """Add this process's buffered counts to the shared cache."""
+    global _last_flush
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        views = set(_views)
+        _last_flush = time.monotonic()
+    for key, delta in pending.items():
+        _incr(key, delta)
+    known = cache.get(VIEWS_KEY, set())
+    if not views <= known:
+        # A concurrent worker may overwrite this; each one re-adds its views
+        # on the next flush.
+        cache.set(VIEWS_KEY, known | views, timeout=None)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus():
+    """All histograms in the Prometheus text exposition format."""
+    flush()
+    views = sorted(cache.get(VIEWS_KEY, set()))
+    keys = [
+        KEY.format(name=name, view=view, part=part)
+        for name, (_, buckets, _) in HISTOGRAMS.items() for view in views
+        for part in [*range(len(buckets) + 1), "sum"]
+    ]
+    values = cache.get_many(keys)
+    lines = []
+    for name, (help_text, buckets, scale) in HISTOGRAMS.items():
+        lines += [f"# HELP {PREFIX}{name} {help_text}", f"# TYPE {PREFIX}{name} histogram"]
+        for view in views:
+            label = f'view="{_label(view)}"'
+            cumulative = 0
+            for part, bound in enumerate([*buckets, "+Inf"]):
+                cumulative += values.get(KEY.format(name=name, view=view, part=part), 0)
+                lines.append(f'{PREFIX}{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            total = values.get(KEY.format(name=name, view=view, part="sum"), 0) / scale
+            lines.append(f"{PREFIX}{name}_sum{{{label}}} {total}")
+            lines.append(f"{PREFIX}{name}_count{{{label}}} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    # Existing scores become one already-applied event each, so replaying the
+    # ledger reproduces today's totals.
+    StudentHonor = apps.get_model("material", "StudentHonor")
+    ScoreEvent = apps.get_model("material", "ScoreEvent")
+    ScoreEvent.objects.bulk_create(
+        ScoreEvent(user_id=h.user_id, source="opening", delta=h.score, applied=True)
+        for h in StudentHonor.objects.exclude(user=None).exclude(score=0).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0006_alter_level_options_alter_material_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('quiz', 'Quiz'), ('upvote', 'Reply upvote'), ('opening', 'Opening balance'), ('adjustment', 'Manual adjustment')], max_length=20)),
+                ('ref', models.CharField(blank=True, max_length=100)),
+                ('delta', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('applied', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('applied', False)), fields=['id'], name='scoreevent_pending_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
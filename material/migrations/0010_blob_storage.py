@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:56
+
+import django.utils.timezone
+import material.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0009_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='file',
+            field=models.FileField(storage=material.storage.content_storage, upload_to='books/'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='image',
+            field=models.ImageField(storage=material.storage.content_storage, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='material',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=material.storage.content_storage, upload_to='materials/'),
+        ),
+        migrations.AlterField(
+            model_name='note',
+            name='file',
+            field=models.FileField(storage=material.storage.content_storage, upload_to='notes/'),
+        ),
+        migrations.AlterField(
+            model_name='record',
+            name='file',
+            field=models.FileField(storage=material.storage.content_storage, upload_to='records/'),
+        ),
+    ]
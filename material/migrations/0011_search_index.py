@@ -0,0 +1,96 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE material_search_fts USING fts5(
+        title, body, content='material_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER material_search_ai AFTER INSERT ON material_searchdocument BEGIN
+        INSERT INTO material_search_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER material_search_ad AFTER DELETE ON material_searchdocument BEGIN
+        INSERT INTO material_search_fts(material_search_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER material_search_au AFTER UPDATE ON material_searchdocument BEGIN
+        INSERT INTO material_search_fts(material_search_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO material_search_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS material_search_au",
+    "DROP TRIGGER IF EXISTS material_search_ad",
+    "DROP TRIGGER IF EXISTS material_search_ai",
+    "DROP TABLE IF EXISTS material_search_fts",
+]
+POSTGRES_INDEX = [
+    """ALTER TABLE material_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED""",
+    "CREATE INDEX material_search_vector_idx ON material_searchdocument USING GIN (search_vector)",
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS material_search_vector_idx",
+    "ALTER TABLE material_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def create_index(apps, schema_editor):
+    for sql in {"sqlite": SQLITE_INDEX, "postgresql": POSTGRES_INDEX}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    for sql in {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def index_existing(apps, schema_editor):
+    SearchDocument = apps.get_model("material", "SearchDocument")
+    sources = [
+        ("book", "Book", lambda o: (o.title, o.description, o.level_id)),
+        ("note", "Note", lambda o: (o.title, "", o.level_id)),
+        ("record", "Record", lambda o: (o.title, "", o.level_id)),
+        ("material", "Material", lambda o: (o.title, o.description, None)),
+        ("news", "News", lambda o: (o.title, o.content, o.level_id)),
+        ("question", "Question", lambda o: ("", o.content, o.level_id)),
+        ("reply", "Reply", lambda o: ("", o.content, o.question.level_id)),
+    ]
+    for kind, model_name, fields in sources:
+        rows = apps.get_model("material", model_name).objects.all()
+        if kind == "reply":
+            rows = rows.select_related("question")
+        documents = []
+        for obj in rows.iterator():
+            title, body, level_id = fields(obj)
+            documents.append(SearchDocument(kind=kind, object_id=obj.pk, level_id=level_id,
+                                            title=(title or "")[:200], body=body or ""))
+        SearchDocument.objects.bulk_create(documents, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0010_blob_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('level_id', models.BigIntegerField(blank=True, null=True)),
+                ('title', models.CharField(blank=True, max_length=200)),
+                ('body', models.TextField(blank=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
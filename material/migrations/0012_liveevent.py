@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:06
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('question', 'New question'), ('reply', 'New reply'), ('upvote', 'Reply upvote')], max_length=20)),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['level_id', 'id'], name='liveevent_level_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0012_liveevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['-created_at'], name='news_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(condition=models.Q(('is_slide', True)), fields=['-created_at'], name='news_slide_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['level', '-created_at', '-id'], name='news_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['level', '-created_at', '-id'], name='question_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(fields=['question', '-upvotes', '-created_at'], name='reply_question_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studenthonor',
+            index=models.Index(fields=['-score', '-id'], name='studenthonor_score_idx'),
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+import uuid
+
+from django.db import models, router, transaction
 from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
 
+from .storage import content_storage
+
 class Level(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -19,51 +23,100 @@ class StudentHonor(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     score = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Highest scores first, as the admin lists them.
+            models.Index(fields=["-score", "-id"], name="studenthonor_score_idx"),
+        ]
+
     def __str__(self):
         return f"{self.user.username if self.user else 'NoUser'} ({self.score})"
 
 
-class Book(models.Model):
+class ScoreEvent(models.Model):
+    """
+    Append-only record of every point change. StudentHonor.score is a
+    materialized sum of these rows (see material.scoring).
+    """
+    SOURCES = [
+        ("quiz", "Quiz"),
+        ("upvote", "Reply upvote"),
+        ("opening", "Opening balance"),
+        ("adjustment", "Manual adjustment"),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="score_events")
+    source = models.CharField(max_length=20, choices=SOURCES)
+    ref = models.CharField(max_length=100, blank=True)
+    delta = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    applied = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["id"], condition=models.Q(applied=False), name="scoreevent_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.delta:+d} ({self.source})"
+
+
+class BlobOwner(models.Model):
+    """
+    A model with content-addressed file fields. Saving is atomic, so the blob
+    reference taken while its files are stored is rolled back with a failed save.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class Book(BlobOwner):
     level = models.ForeignKey(Level, on_delete=models.CASCADE, related_name="books")
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    file = models.FileField(upload_to="books/")
+    file = models.FileField(upload_to="books/", storage=content_storage)
 
     def __str__(self):
         return self.title
 
 
-class Note(models.Model):
+class Note(BlobOwner):
     level = models.ForeignKey(Level, on_delete=models.CASCADE, related_name="notes")
     title = models.CharField(max_length=200)
-    file = models.FileField(upload_to="notes/")
+    file = models.FileField(upload_to="notes/", storage=content_storage)
 
     def __str__(self):
         return self.title
 
 
-class Record(models.Model):
+class Record(BlobOwner):
     level = models.ForeignKey(Level, on_delete=models.CASCADE, related_name="records")
     title = models.CharField(max_length=200)
-    file = models.FileField(upload_to="records/")
+    file = models.FileField(upload_to="records/", storage=content_storage)
 
     def __str__(self):
         return self.title
 
 
-class Image(models.Model):
+class Image(BlobOwner):
     level = models.ForeignKey(Level, on_delete=models.CASCADE, related_name="images")
     title = models.CharField(max_length=200, blank=True)
-    image = models.ImageField(upload_to="images/")
+    image = models.ImageField(upload_to="images/", storage=content_storage)
 
     def __str__(self):
         return self.title or f"Image #{self.pk}"
 
 
-class Material(models.Model):
+class Material(BlobOwner):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    file = models.FileField(upload_to="materials/", blank=True, null=True)
+    file = models.FileField(upload_to="materials/", blank=True, null=True, storage=content_storage)
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -83,6 +136,11 @@ class News(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["-created_at"], name="news_recent_idx"),
+            models.Index(fields=["-created_at"], condition=models.Q(is_slide=True), name="news_slide_idx"),
+            models.Index(fields=["level", "-created_at", "-id"], name="news_level_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -133,6 +191,9 @@ class Question(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["level", "-created_at", "-id"], name="question_level_idx"),
+        ]
 
     def __str__(self):
         return f"Q by {self.author or (self.author_user.username if self.author_user else 'Anon')}: {self.content[:20]}..."
@@ -148,6 +209,120 @@ class Reply(models.Model):
 
     class Meta:
         ordering = ["-upvotes", "-created_at"]
+        indexes = [
+            models.Index(fields=["question", "-upvotes", "-created_at"], name="reply_question_idx"),
+        ]
 
     def __str__(self):
         return f"Reply by {self.author or (self.author_user.username if self.author_user else 'Anon')}"
+
+
+class ReplyVote(models.Model):
+    """
+    One upvote per user and reply. Reply.upvotes is updated from uncounted
+    votes in batches (see material.upvotes).
+    """
+    reply = models.ForeignKey(Reply, on_delete=models.CASCADE, related_name="votes")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="reply_votes")
+    created_at = models.DateTimeField(default=timezone.now)
+    counted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "reply"], name="unique_reply_vote"),
+        ]
+        indexes = [
+            models.Index(fields=["id"], condition=models.Q(counted=False), name="replyvote_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> reply {self.reply_id}"
+
+
+class ChunkedUpload(models.Model):
+    """
+    A file being uploaded in chunks to a staging file (see material.uploads).
+    ``received`` is the length of the verified prefix; a client resumes from it.
+    """
+    TARGETS = [
+        ("book", "Book"),
+        ("record", "Record"),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chunked_uploads")
+    target = models.CharField(max_length=20, choices=TARGETS)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+class Blob(models.Model):
+    """
+    One stored file in content-addressed storage (material.storage) and the
+    number of model fields referencing it.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+class SearchDocument(models.Model):
+    """
+    Searchable text of one Book, Note, Record, Material, News, Question or
+    Reply. The full-text index over these rows is database-specific; see
+    material.search.
+    """
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    level_id = models.BigIntegerField(null=True, blank=True)
+    title = models.CharField(max_length=200, blank=True)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="unique_search_document"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}"
+
+    def get_absolute_url(self):
+        if self.level_id:
+            return reverse("material:details", args=[self.level_id])
+        return reverse("material:home")
+
+
+class LiveEvent(models.Model):
+    """
+    A Q&A change pushed to students watching a level (see material.live). The
+    id doubles as the Server-Sent Events id used to resume a stream.
+    """
+    KINDS = [
+        ("question", "New question"),
+        ("reply", "New reply"),
+        ("upvote", "Reply upvote"),
+    ]
+    level_id = models.BigIntegerField()
+    kind = models.CharField(max_length=20, choices=KINDS)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["level_id", "id"], name="liveevent_level_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} on level {self.level_id}"
@@ -0,0 +1,68 @@
+import json
+
+from django.core.exceptions import BadRequest
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+def encode_cursor(values):
+    return urlsafe_base64_encode(json.dumps(values, default=str).encode())
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(urlsafe_base64_decode(cursor))
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor.")
+    if not isinstance(values, list):
+        raise BadRequest("Invalid cursor.")
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows strictly after ``values`` in ``ordering``, i.e. for ("-created_at", "-id"):
+    created_at < c OR (created_at = c AND id < i).
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        step = Q(**{f"{name}__{lookup}": values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev_field.lstrip("-"): prev_value})
+        condition |= step
+    return condition
+
+
+def _ordered_after(queryset, ordering, cursor):
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise BadRequest("Invalid cursor.")
+        queryset = queryset.filter(keyset_filter(ordering, values))
+    return queryset
+
+
+def _page(items, ordering, size):
+    if len(items) <= size:
+        return items, None
+    items = items[:size]
+    last = items[-1]
+    return items, encode_cursor([getattr(last, f.lstrip("-")) for f in ordering])
+
+
+def keyset_page(queryset, ordering, cursor=None, size=20):
+    """
+    Return ``(items, next_cursor)`` for one page of ``queryset``. The ordering must
+    end in a unique column (usually id) so the cursor identifies exactly one row.
+    """
+    queryset = _ordered_after(queryset, ordering, cursor)
+    return _page(list(queryset[:size + 1]), ordering, size)
+
+
+async def akeyset_page(queryset, ordering, cursor=None, size=20):
+    """Async version of keyset_page."""
+    queryset = _ordered_after(queryset, ordering, cursor)
+    return _page([item async for item in queryset[:size + 1]], ordering, size)
@@ -0,0 +1,139 @@
+from django.db import transaction
+
+from .models import Level, Quiz, QuizQuestion, QuizAnswer
+from .quiz_cache import bump_quiz_version
+
+QUESTION_TYPES = {value for value, _ in QuizQuestion.QUESTION_TYPES}
+SINGLE_ANSWER_TYPES = ("single", "truefalse")
+TITLE_MAX = Quiz._meta.get_field("title").max_length
+QUESTION_MAX = QuizQuestion._meta.get_field("text").max_length
+ANSWER_MAX = QuizAnswer._meta.get_field("text").max_length
+# Upper bounds for the builder's client-supplied counts.
+MAX_QUESTIONS = 200
+MAX_ANSWERS = 20
+
+
+def _count(data, field, errors, maximum):
+    try:
+        count = int(data.get(field) or 0)
+    except ValueError:
+        errors[field] = "Must be a number."
+        return 0
+    if count < 0:
+        errors[field] = "Must not be negative."
+        return 0
+    if count > maximum:
+        errors[field] = f"At most {maximum}."
+        return maximum
+    return count
+
+
+def validate_questions(questions, errors, field_name):
+    """
+    Check a list of ``{"text", "type", "answers": [{"text", "is_correct"}]}``
+    and record problems in ``errors`` keyed by ``field_name(i, j, part)``.
+    """
+    if not questions:
+        errors["question_count"] = "Add at least one question."
+    for i, question in enumerate(questions, start=1):
+        if not question["text"]:
+            errors[field_name(i, None, "text")] = f"Question {i}: text is required."
+        elif len(question["text"]) > QUESTION_MAX:
+            errors[field_name(i, None, "text")] = f"Question {i}: at most {QUESTION_MAX} characters."
+        if question["type"] not in QUESTION_TYPES:
+            errors[field_name(i, None, "type")] = f"Question {i}: unknown type {question['type']!r}."
+
+        answers = question["answers"]
+        if not answers:
+            errors[field_name(i, None, "answer_count")] = f"Question {i}: add at least one answer."
+        for j, answer in enumerate(answers, start=1):
+            if not answer["text"]:
+                errors[field_name(i, j, "text")] = f"Question {i}, answer {j}: text is required."
+            elif len(answer["text"]) > ANSWER_MAX:
+                errors[field_name(i, j, "text")] = f"Question {i}, answer {j}: at most {ANSWER_MAX} characters."
+        correct = sum(1 for a in answers if a["is_correct"])
+        if answers and not correct:
+            errors[field_name(i, None, "answer_count")] = f"Question {i}: mark the correct answer."
+        elif correct > 1 and question["type"] in SINGLE_ANSWER_TYPES:
+            errors[field_name(i, None, "answer_count")] = f"Question {i}: only one answer can be correct."
+
+
+def validate_quiz(quiz, errors, field_name):
+    """Check a quiz's title and questions, as validate_questions does."""
+    if not quiz["title"]:
+        errors["title"] = "Quiz title is required."
+    elif len(quiz["title"]) > TITLE_MAX:
+        errors["title"] = f"Quiz title must be at most {TITLE_MAX} characters."
+    validate_questions(quiz["questions"], errors, field_name)
+
+
+def _builder_field(i, j=None, part="text"):
+    if j is None:
+        return f"question_{i}_{part}"
+    return f"question_{i}_answer_{j}_{part}"
+
+
+def parse_builder_post(data, level_id=None):
+    """
+    Turn the quiz_builder POST into ``(quiz, errors)``. ``quiz`` is
+    ``{"title", "level_id", "questions"}``; ``errors`` maps POST field names to
+    messages and is empty when the quiz can be saved.
+    """
+    errors = {}
+    level_id = data.get("level") or level_id
+    try:
+        level_id = int(level_id)
+    except (TypeError, ValueError):
+        level_id = None
+    if level_id is None or not Level.objects.filter(id=level_id).exists():
+        errors["level"] = "Choose an existing level."
+
+    questions = []
+    for i in range(1, _count(data, "question_count", errors, MAX_QUESTIONS) + 1):
+        answers = []
+        for j in range(1, _count(data, f"question_{i}_answer_count", errors, MAX_ANSWERS) + 1):
+            answers.append({
+                "text": (data.get(f"question_{i}_answer_{j}_text") or "").strip(),
+                "is_correct": data.get(f"question_{i}_answer_{j}_correct") == "on",
+            })
+        questions.append({
+            "text": (data.get(f"question_{i}_text") or "").strip(),
+            "type": data.get(f"question_{i}_type") or "single",
+            "answers": answers,
+        })
+    quiz = {"title": (data.get("title") or "").strip(), "level_id": level_id, "questions": questions}
+    validate_quiz(quiz, errors, _builder_field)
+    return quiz, errors
+
+
+def create_quizzes(quizzes, batch_size=1000):
+    """
+    Insert already-validated quizzes (``{"title", "level_id", "questions"}``)
+    in one transaction: one bulk INSERT each for quizzes, questions and answers.
+    Returns the created Quiz objects.
+    """
+    with transaction.atomic():
+        quiz_objs = Quiz.objects.bulk_create(
+            [Quiz(title=quiz["title"], level_id=quiz["level_id"]) for quiz in quizzes],
+            batch_size=batch_size,
+        )
+        question_objs = QuizQuestion.objects.bulk_create(
+            [QuizQuestion(quiz=quiz_obj, text=question["text"], question_type=question["type"])
+             for quiz_obj, quiz in zip(quiz_objs, quizzes) for question in quiz["questions"]],
+            batch_size=batch_size,
+        )
+        questions = [question for quiz in quizzes for question in quiz["questions"]]
+        QuizAnswer.objects.bulk_create(
+            [QuizAnswer(question=question_obj, text=answer["text"], is_correct=answer["is_correct"])
+             for question_obj, question in zip(question_objs, questions) for answer in question["answers"]],
+            batch_size=batch_size,
+        )
+        # bulk_create sends no post_save, so invalidate cached answer keys here.
+        quiz_ids = [quiz_obj.id for quiz_obj in quiz_objs]
+        transaction.on_commit(lambda: _bump_all(quiz_ids))
+    return quiz_objs
+
+
+def _bump_all(quiz_ids):
+    for quiz_id in quiz_ids:
+        bump_quiz_version(quiz_id)
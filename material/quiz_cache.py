@@ -0,0 +1,41 @@
+from django.core.cache import cache
+
+from .cache_versions import bump_version, get_versions
+from .grading import compile_answer_keys
+
+# Compiled keys are stored under a per-quiz version, so invalidation is a single
+# counter bump and stale entries simply age out.
+VERSION_KEY = "quiz:{id}:version"
+ANSWER_KEY = "quiz:{id}:key:{version}"
+ANSWER_KEY_TIMEOUT = 60 * 60 * 24
+
+
+def quiz_versions(quiz_ids):
+    keys = {VERSION_KEY.format(id=quiz_id): quiz_id for quiz_id in quiz_ids}
+    return {keys[key]: version for key, version in get_versions(list(keys)).items()}
+
+
+def bump_quiz_version(quiz_id):
+    bump_version(VERSION_KEY.format(id=quiz_id))
+
+
+def get_answer_keys(quiz_ids):
+    """
+    Return ``{quiz_id: answer_key}`` for the given quizzes, compiling and caching
+    any that are missing. Quizzes that do not exist are left out.
+    """
+    versions = quiz_versions(quiz_ids)
+    keys = {ANSWER_KEY.format(id=quiz_id, version=version): quiz_id for quiz_id, version in versions.items()}
+    found = cache.get_many(keys)
+
+    result = {keys[key]: answer_key for key, answer_key in found.items()}
+    missing = {quiz_id: key for key, quiz_id in keys.items() if key not in found}
+    if missing:
+        compiled = compile_answer_keys(list(missing))
+        cache.set_many({missing[quiz_id]: answer_key for quiz_id, answer_key in compiled.items()}, ANSWER_KEY_TIMEOUT)
+        result.update(compiled)
+    return result
+
+
+def get_answer_key(quiz_id):
+    return get_answer_keys([quiz_id]).get(quiz_id)
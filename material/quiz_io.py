@@ -0,0 +1,159 @@
+"""
+Streaming readers and writers for quiz banks.
+
+JSON Lines: one quiz per line,
+    {"title": "...", "level": 3 | "Level name",
+     "questions": [{"text": "...", "type": "single",
+                    "answers": [{"text": "...", "correct": true}, ...]}, ...]}
+
+CSV: one answer per row,
+    quiz_no,question_no,quiz,level,question,type,answer,correct
+Rows with the same quiz_no / question_no form one quiz / question. The two
+number columns are optional; without them consecutive rows with the same quiz
+title and level, and then question text and type, are grouped.
+"""
+import csv
+import json
+from itertools import groupby
+
+from .models import Level, Quiz
+
+CSV_FIELDS = ["quiz", "level", "question", "type", "answer", "correct"]
+# Written by write_csv so quizzes or questions that share a title or text in a
+# row stay apart on import.
+SEQUENCE_FIELDS = ["quiz_no", "question_no"]
+TRUE_VALUES = {"1", "true", "yes", "y", "on", "x"}
+
+
+class ImportRecordError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+def level_resolver():
+    """Map a level reference (id or name) to a level id."""
+    by_id = {}
+    by_name = {}
+    for level_id, name in Level.objects.values_list("id", "name"):
+        by_id[str(level_id)] = level_id
+        by_name.setdefault(name.strip().lower(), level_id)
+
+    def resolve(ref):
+        ref = str(ref if ref is not None else "").strip()
+        return by_id.get(ref) or by_name.get(ref.lower())
+    return resolve
+
+
+def _answer(text, correct):
+    return {"text": (text or "").strip(), "is_correct": correct}
+
+
+def read_jsonl(stream):
+    """Yield ``(line_number, quiz_dict)`` from a JSON Lines stream."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+            quiz = {
+                "title": (raw.get("title") or "").strip(),
+                "level": raw.get("level"),
+                "questions": [
+                    {"text": (q.get("text") or "").strip(), "type": q.get("type") or "single",
+                     "answers": [_answer(a.get("text"), bool(a.get("correct"))) for a in q.get("answers") or []]}
+                    for q in raw.get("questions") or []
+                ],
+            }
+        except (ValueError, AttributeError, TypeError) as exc:
+            raise ImportRecordError(line_number, f"malformed record ({exc})")
+        yield line_number, quiz
+
+
+def read_csv(stream):
+    """Yield ``(line_number, quiz_dict)``, grouping consecutive rows of a quiz."""
+    reader = csv.DictReader(stream)
+    missing = set(CSV_FIELDS) - set(reader.fieldnames or [])
+    if missing:
+        raise ImportRecordError(1, f"missing columns: {', '.join(sorted(missing))}")
+
+    if set(SEQUENCE_FIELDS) <= set(reader.fieldnames):
+        quiz_key = lambda r: r[1]["quiz_no"].strip()
+        question_key = lambda r: r[1]["question_no"].strip()
+    else:
+        quiz_key = lambda r: (r[1]["quiz"].strip(), r[1]["level"].strip())
+        question_key = lambda r: (r[1]["question"].strip(), r[1]["type"].strip())
+
+    rows = ((reader.line_num, row) for row in reader)
+    for _, quiz_rows in groupby(rows, key=quiz_key):
+        quiz_rows = list(quiz_rows)
+        questions = []
+        for _, question_rows in groupby(quiz_rows, key=question_key):
+            question_rows = list(question_rows)
+            first = question_rows[0][1]
+            questions.append({
+                "text": first["question"].strip(),
+                "type": first["type"].strip() or "single",
+                "answers": [
+                    _answer(row["answer"], (row["correct"] or "").strip().lower() in TRUE_VALUES)
+                    for _, row in question_rows if (row["answer"] or "").strip()
+                ],
+            })
+        first = quiz_rows[0][1]
+        yield quiz_rows[0][0], {"title": first["quiz"].strip(), "level": first["level"].strip(), "questions": questions}
+
+
+def export_rows(level_id=None, chunk_size=2000):
+    """
+    Yield quizzes as ``{"id", "title", "level", "level_name", "questions"}`` from
+    one streamed LEFT JOIN, holding only one quiz in memory at a time.
+    """
+    rows = Quiz.objects.order_by("id", "questions__id", "questions__answers__id")
+    if level_id is not None:
+        rows = rows.filter(level_id=level_id)
+    rows = rows.values_list(
+        "id", "title", "level_id", "level__name",
+        "questions__id", "questions__text", "questions__question_type",
+        "questions__answers__text", "questions__answers__is_correct",
+    ).iterator(chunk_size=chunk_size)
+
+    for (quiz_id, title, level, level_name), quiz_rows in groupby(rows, key=lambda r: r[:4]):
+        questions = []
+        for question_id, question_rows in groupby(quiz_rows, key=lambda r: r[4]):
+            if question_id is None:
+                continue
+            question_rows = list(question_rows)
+            questions.append({
+                "text": question_rows[0][5],
+                "type": question_rows[0][6],
+                "answers": [{"text": r[7], "correct": r[8]} for r in question_rows if r[7] is not None],
+            })
+        yield {"id": quiz_id, "title": title, "level": level, "level_name": level_name, "questions": questions}
+
+
+def write_jsonl(stream, quizzes, level_names=False):
+    count = 0
+    for quiz in quizzes:
+        record = {
+            "title": quiz["title"],
+            "level": quiz["level_name"] if level_names else quiz["level"],
+            "questions": quiz["questions"],
+        }
+        stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(stream, quizzes, level_names=False):
+    writer = csv.writer(stream)
+    writer.writerow(SEQUENCE_FIELDS + CSV_FIELDS)
+    count = 0
+    for quiz in quizzes:
+        count += 1
+        level = quiz["level_name"] if level_names else quiz["level"]
+        for question_no, question in enumerate(quiz["questions"], start=1):
+            for answer in question["answers"] or [{"text": "", "correct": False}]:
+                writer.writerow([count, question_no, quiz["title"], level, question["text"], question["type"],
+                                 answer["text"], "1" if answer["correct"] else "0"])
+    return count
@@ -0,0 +1,213 @@
+"""
+Read replicas for the read-heavy pages.
+
+Views wrapped in @replica_reads send their reads to one healthy replica from
+settings.DATABASE_REPLICAS; everything else, and every write, uses the
+primary. A client that has just written (any POST/PUT/PATCH/DELETE, or a model
+saved or deleted during a GET) is pinned to the primary for REPLICA_PIN_SECONDS through a cookie,
+so it always reads its own writes, and a request that writes reads from the
+primary for the rest of the request.
+
+Each process checks a replica with a cheap query before using it again and
+skips it while it is down or lagging more than REPLICA_MAX_LAG seconds. If a
+replica fails mid-request before the request wrote anything, the view is run
+again on the primary; only wrap views that are safe to run twice, i.e. that
+read, fill caches and render but do not write.
+"""
+import functools
+import logging
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = "db_pin"
+CHECK_INTERVAL = 10
+RETRY_INTERVAL = 30
+UNSAFE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Replay lag in seconds on a Postgres standby, 0 while it has replayed
+# everything it received.
+PG_LAG_SQL = """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+"""
+
+
+@dataclass
+class Routing:
+    pinned: bool = False
+    wrote: bool = False
+    replica: str | None = None
+    used: set = field(default_factory=set)
+
+
+_routing = ContextVar("db_routing", default=None)
+# alias -> (healthy, monotonic time of the check)
+_health = {}
+
+
+def _check(alias):
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(PG_LAG_SQL)
+                lag = cursor.fetchone()[0]
+                if lag > settings.REPLICA_MAX_LAG:
+                    logger.warning("Replica %s is %.1fs behind; reading from the primary.", alias, lag)
+                    return False
+            else:
+                cursor.execute("SELECT 1")
+        return True
+    except DatabaseError:
+        logger.warning("Replica %s is unreachable; reading from the primary.", alias, exc_info=True)
+        connection.close_if_unusable_or_obsolete()
+        return False
+
+
+def is_healthy(alias):
+    healthy, checked_at = _health.get(alias, (True, None))
+    interval = CHECK_INTERVAL if healthy else RETRY_INTERVAL
+    if checked_at is None or time.monotonic() - checked_at > interval:
+        healthy = _check(alias)
+        _health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+def mark_down(alias):
+    _health[alias] = (False, time.monotonic())
+
+
+def _choose_replica():
+    healthy = [alias for alias in settings.DATABASE_REPLICAS if is_healthy(alias)]
+    return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.replica is None or routing.pinned or routing.wrote:
+            return None
+        if routing.replica == "":
+            # Chosen on the first read so pages that never query never check.
+            routing.replica = _choose_replica()
+        routing.used.add(routing.replica)
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def note_write():
+    """Called for every saved or deleted row (see material.signals)."""
+    routing = _routing.get()
+    if routing is not None:
+        routing.wrote = True
+
+
+def _failed_replica(routing):
+    return next((alias for alias in routing.used if alias != DEFAULT_DB_ALIAS), None)
+
+
+def replica_reads(view):
+    """
+    Let ``view`` read from a replica unless the client is pinned to the primary.
+    ``view`` must be read-only: it is run a second time if a replica fails.
+    """
+    def start():
+        routing = _routing.get()
+        if routing is None or not settings.DATABASE_REPLICAS:
+            return None
+        routing.replica = ""
+        return routing
+
+    def fall_back(routing, exc):
+        alias = _failed_replica(routing)
+        if alias is None:
+            return False
+        if routing.wrote:
+            # Running the view again would repeat its writes.
+            logger.warning("Read from replica %s failed after the request wrote; not retrying.", alias)
+            mark_down(alias)
+            return False
+        logger.warning("Read from replica %s failed (%s); retrying on the primary.", alias, exc)
+        mark_down(alias)
+        routing.replica = None
+        routing.used.clear()
+        return True
+
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            routing = start()
+            try:
+                return await view(request, *args, **kwargs)
+            except DatabaseError as exc:
+                if routing is None or not fall_back(routing, exc):
+                    raise
+            return await view(request, *args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            routing = start()
+            try:
+                return view(request, *args, **kwargs)
+            except DatabaseError as exc:
+                if routing is None or not fall_back(routing, exc):
+                    raise
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def replica_routing_middleware(get_response):
+    """
+    Track each request's database routing, and pin clients that wrote to the
+    primary for REPLICA_PIN_SECONDS.
+    """
+    def routing_for(request):
+        return Routing(pinned=request.method in UNSAFE_METHODS or PIN_COOKIE in request.COOKIES)
+
+    def pin(request, response, routing):
+        if routing.wrote or request.method in UNSAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, "1", max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite="Lax")
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            routing = routing_for(request)
+            token = _routing.set(routing)
+            try:
+                response = await get_response(request)
+            finally:
+                _routing.reset(token)
+            return pin(request, response, routing)
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            routing = routing_for(request)
+            token = _routing.set(routing)
+            try:
+                response = get_response(request)
+            finally:
+                _routing.reset(token)
+            return pin(request, response, routing)
+    return middleware
+
+
+replica_routing_middleware.sync_capable = True
+replica_routing_middleware.async_capable = True
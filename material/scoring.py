@@ -0,0 +1,116 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, Sum, Value, When
+
+from . import leaderboard
+from .models import ScoreEvent, StudentHonor
+
+BATCH_SIZE = 500
+
+
+def _ensure_honors(user_ids):
+    StudentHonor.objects.bulk_create(
+        [StudentHonor(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+
+
+def _scores_changed_on_commit(user_ids):
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: leaderboard.scores_changed(user_ids))
+
+
+def _add_to_scores(deltas):
+    """Apply ``{user_id: delta}`` to existing StudentHonor rows in one UPDATE."""
+    return StudentHonor.objects.filter(user_id__in=list(deltas)).update(score=F("score") + Case(
+        *[When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+        default=Value(0),
+    ))
+
+
+def award_points(user, delta, source, ref=""):
+    if not delta or user is None or not user.is_authenticated:
+        return None
+    if settings.SCORE_LEDGER_MODE != "inline":
+        return ScoreEvent.objects.create(user=user, source=source, ref=ref, delta=delta)
+    with transaction.atomic():
+        event = ScoreEvent.objects.create(user=user, source=source, ref=ref, delta=delta, applied=True)
+        if not _add_to_scores({user.id: delta}):
+            _ensure_honors([user.id])
+            _add_to_scores({user.id: delta})
+        _scores_changed_on_commit([user.id])
+    return event
+
+
+def award_points_bulk(awards):
+    """
+    Record many awards at once. ``awards`` is a list of
+    ``(user_id, delta, source, ref)``; one INSERT plus, in inline mode, one UPDATE.
+    """
+    awards = [a for a in awards if a[0] is not None and a[1]]
+    if not awards:
+        return
+    inline = settings.SCORE_LEDGER_MODE == "inline"
+    with transaction.atomic():
+        ScoreEvent.objects.bulk_create(
+            ScoreEvent(user_id=user_id, delta=delta, source=source, ref=ref, applied=inline)
+            for user_id, delta, source, ref in awards
+        )
+        if inline:
+            deltas = Counter()
+            for user_id, delta, _, _ in awards:
+                deltas[user_id] += delta
+            _ensure_honors(deltas)
+            _add_to_scores(deltas)
+            _scores_changed_on_commit(deltas)
+
+
+def pending_points(user):
+    """Points recorded in the ledger but not yet materialized."""
+    return ScoreEvent.objects.filter(user=user, applied=False).aggregate(total=Sum("delta"))["total"] or 0
+
+
+def materialize_scores(batch_size=BATCH_SIZE):
+    """
+    Fold pending events into StudentHonor, one transaction per batch. Safe to run
+    from several processes: on databases that support it rows are claimed with
+    SKIP LOCKED. Returns the number of events applied.
+    """
+    applied = 0
+    while True:
+        with transaction.atomic():
+            pending = ScoreEvent.objects.filter(applied=False).order_by("id")
+            if connection.features.has_select_for_update_skip_locked:
+                pending = pending.select_for_update(skip_locked=True)
+            batch = list(pending.values_list("id", "user_id", "delta")[:batch_size])
+            if not batch:
+                return applied
+            deltas = Counter()
+            for _, user_id, delta in batch:
+                deltas[user_id] += delta
+            _ensure_honors(deltas)
+            _add_to_scores(deltas)
+            _scores_changed_on_commit(deltas)
+            ScoreEvent.objects.filter(id__in=[event_id for event_id, _, _ in batch]).update(applied=True)
+        applied += len(batch)
+
+
+def rebuild_scores(batch_size=BATCH_SIZE):
+    """Recompute every StudentHonor.score from the full ledger."""
+    with transaction.atomic():
+        ScoreEvent.objects.filter(applied=False).update(applied=True)
+        totals = dict(
+            ScoreEvent.objects.order_by().values("user_id").annotate(total=Sum("delta")).values_list("user_id", "total")
+        )
+        StudentHonor.objects.update(score=0)
+        _ensure_honors(totals)
+        user_ids = list(totals)
+        transaction.on_commit(leaderboard.rebuild)
+        for start in range(0, len(user_ids), batch_size):
+            chunk = user_ids[start:start + batch_size]
+            StudentHonor.objects.filter(user_id__in=chunk).update(score=Case(
+                *[When(user_id=user_id, then=Value(totals[user_id])) for user_id in chunk],
+                default=Value(0),
+            ))
+    return len(totals)
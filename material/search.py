@@ -0,0 +1,129 @@
+"""
+Site-wide full-text search.
+
+SearchDocument keeps one row of text per searchable object, updated by
+signals. The inverted index over it depends on the database:
+
+* SQLite: an external-content FTS5 table kept in sync by triggers, ranked
+  with bm25().
+* PostgreSQL: a generated tsvector column with a GIN index, ranked with
+  ts_rank_cd().
+
+Other databases fall back to LIKE scans. Both indexes are created by
+migration 0011_search_index; ``manage.py rebuild_search_index`` refills them.
+"""
+import re
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import SearchDocument
+
+PAGE_SIZE = 20
+MAX_TERMS = 8
+BATCH_SIZE = 1000
+FTS_TABLE = "material_search_fts"
+DOCUMENT_TABLE = SearchDocument._meta.db_table
+
+# kind -> (model, title, body, level id, select_related)
+SOURCES = {
+    "book": ("Book", lambda o: o.title, lambda o: o.description, lambda o: o.level_id, ()),
+    "note": ("Note", lambda o: o.title, lambda o: "", lambda o: o.level_id, ()),
+    "record": ("Record", lambda o: o.title, lambda o: "", lambda o: o.level_id, ()),
+    "material": ("Material", lambda o: o.title, lambda o: o.description, lambda o: None, ()),
+    "news": ("News", lambda o: o.title, lambda o: o.content, lambda o: o.level_id, ()),
+    "question": ("Question", lambda o: "", lambda o: o.content, lambda o: o.level_id, ()),
+    "reply": ("Reply", lambda o: "", lambda o: o.content, lambda o: o.question.level_id, ("question",)),
+}
+KIND_BY_MODEL = {name: kind for kind, (name, *_) in SOURCES.items()}
+
+# ── Indexing ───────────────────────────────────────────────────────────────────
+def _fields(kind, obj):
+    _, title, body, level_id, _ = SOURCES[kind]
+    return {"title": (title(obj) or "")[:200], "body": body(obj) or "", "level_id": level_id(obj)}
+
+
+def index_object(obj):
+    kind = KIND_BY_MODEL[type(obj).__name__]
+    SearchDocument.objects.update_or_create(kind=kind, object_id=obj.pk, defaults=_fields(kind, obj))
+
+
+def unindex_object(obj):
+    kind = KIND_BY_MODEL[type(obj).__name__]
+    SearchDocument.objects.filter(kind=kind, object_id=obj.pk).delete()
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Reindex every source object from scratch. Returns the number indexed."""
+    indexed = 0
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for kind, (model_name, *_, related) in SOURCES.items():
+            rows = apps.get_model("material", model_name).objects.select_related(*related).order_by()
+            batch = []
+            for obj in rows.iterator(chunk_size=batch_size):
+                batch.append(SearchDocument(kind=kind, object_id=obj.pk, **_fields(kind, obj)))
+                if len(batch) == batch_size:
+                    indexed += len(SearchDocument.objects.bulk_create(batch))
+                    batch = []
+            indexed += len(SearchDocument.objects.bulk_create(batch))
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+# ── Querying ───────────────────────────────────────────────────────────────────
+def terms(text):
+    return re.findall(r"\w+", text or "")[:MAX_TERMS]
+
+
+def _fts5_query(words):
+    # Every word must match, as a prefix; quoting keeps FTS5 syntax out.
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(text, page=1, per_page=PAGE_SIZE, level_id=None):
+    """
+    Return ``(documents, has_next)`` for one page of ranked results. Each
+    document has a ``snippet`` attribute.
+    """
+    words = terms(text)
+    if not words:
+        return [], False
+    offset = (page - 1) * per_page
+    level_sql = " AND d.level_id = %s" if level_id else ""
+    level_params = [level_id] if level_id else []
+
+    if connection.vendor == "sqlite":
+        rows = SearchDocument.objects.raw(
+            f"""SELECT d.id, d.kind, d.object_id, d.level_id, d.title,
+                       snippet({FTS_TABLE}, 1, '', '', '…', 24) AS snippet
+                FROM {FTS_TABLE} JOIN {DOCUMENT_TABLE} d ON d.id = {FTS_TABLE}.rowid
+                WHERE {FTS_TABLE} MATCH %s{level_sql}
+                ORDER BY bm25({FTS_TABLE}, 4.0, 1.0) LIMIT %s OFFSET %s""",
+            [_fts5_query(words), *level_params, per_page + 1, offset],
+        )
+    elif connection.vendor == "postgresql":
+        rows = SearchDocument.objects.raw(
+            f"""SELECT d.id, d.kind, d.object_id, d.level_id, d.title,
+                       ts_headline('simple', d.body, q, 'StartSel="",StopSel="",MaxWords=30,MinWords=10') AS snippet
+                FROM {DOCUMENT_TABLE} d, to_tsquery('simple', %s) q
+                WHERE d.search_vector @@ q{level_sql}
+                ORDER BY ts_rank_cd(d.search_vector, q) DESC, d.id LIMIT %s OFFSET %s""",
+            [" & ".join(f"{word}:*" for word in words), *level_params, per_page + 1, offset],
+        )
+    else:
+        rows = SearchDocument.objects.all()
+        for word in words:
+            rows = rows.filter(Q(title__icontains=word) | Q(body__icontains=word))
+        if level_id:
+            rows = rows.filter(level_id=level_id)
+        rows = rows.order_by("-id")[offset:offset + per_page + 1]
+        for row in rows:
+            row.snippet = row.body[:200]
+
+    documents = list(rows)
+    return documents[:per_page], len(documents) > per_page
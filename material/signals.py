@@ -0,0 +1,171 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import leaderboard
+from .dbpool import connection_opened
+from .fragments import bump_fragment
+from .images import downscale_upload, field_label
+from .metrics import query_timer
+from .models import (
+    Book, Image, Level, Material, News, Note, Question, Quiz, QuizQuestion, QuizAnswer, Record, Reply,
+    StudentHonor,
+)
+from .quiz_cache import bump_quiz_version
+from .replicas import note_write
+from .live import publish
+from .search import index_object, unindex_object
+from .storage import content_fields, release
+from .tasks import generate_image_derivatives
+
+
+# ── Quiz answer-key cache ──────────────────────────────────────────────────────
+def _bump_on_commit(quiz_id):
+    # Bumping earlier would let a concurrent quiz_submit compile the old rows
+    # and cache them under the new version.
+    transaction.on_commit(lambda: bump_quiz_version(quiz_id))
+
+@receiver([post_save, post_delete], sender=Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    _bump_on_commit(instance.id)
+
+@receiver([post_save, post_delete], sender=QuizQuestion)
+def quiz_question_changed(sender, instance, **kwargs):
+    _bump_on_commit(instance.quiz_id)
+
+@receiver([post_save, post_delete], sender=QuizAnswer)
+def quiz_answer_changed(sender, instance, **kwargs):
+    # While a whole quiz is being deleted the question row may already be gone;
+    # the Quiz delete bumps the version in that case.
+    quiz_id = QuizQuestion.objects.filter(id=instance.question_id).values_list("quiz_id", flat=True).first()
+    if quiz_id is not None:
+        _bump_on_commit(quiz_id)
+
+
+# ── Leaderboard ────────────────────────────────────────────────────────────────
+@receiver([post_save, post_delete], sender=StudentHonor)
+def student_honor_changed(sender, instance, **kwargs):
+    # F() updates from material.scoring bypass this and refresh the board themselves.
+    if instance.user_id:
+        transaction.on_commit(lambda: leaderboard.scores_changed([instance.user_id]))
+
+
+# ── Homepage fragments ─────────────────────────────────────────────────────────
+# The honor board fragment is keyed by the leaderboard generation, which the
+# StudentHonor handler above advances.
+# Bumps wait for the commit, like the quiz versions above.
+@receiver([post_save, post_delete], sender=News)
+def news_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: (bump_fragment("news"), bump_fragment("slides")))
+
+@receiver([post_save, post_delete], sender=Level)
+def level_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_fragment("levels"))
+
+
+# ── Image derivatives ──────────────────────────────────────────────────────────
+@receiver(pre_save, sender=Level)
+@receiver(pre_save, sender=Image)
+@receiver(pre_save, sender=News)
+def image_uploading(sender, instance, **kwargs):
+    instance._image_uploaded = bool(instance.image) and not instance.image._committed
+    if instance._image_uploaded:
+        downscale_upload(instance.image)
+
+@receiver(post_save, sender=Level)
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=News)
+def image_uploaded(sender, instance, **kwargs):
+    if getattr(instance, "_image_uploaded", False):
+        generate_image_derivatives.enqueue(name=instance.image.name, field=field_label(instance.image.field))
+
+
+# ── Content-addressed blobs ────────────────────────────────────────────────────
+# Storing a file takes a reference on its blob (ContentAddressedStorage._save);
+# replacing or deleting it gives the reference back.
+BLOB_MODELS = (Book, Note, Record, Image, Material)
+
+def _file_names(instance):
+    return {field: getattr(instance, field).name for field in content_fields(type(instance))}
+
+def blob_owner_saving(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    fields = content_fields(sender)
+    previous = sender.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._previous_files = previous or {}
+
+def blob_owner_saved(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_files", None)
+    if not previous:
+        return
+    current = _file_names(instance)
+    for field, name in previous.items():
+        if name != current[field]:
+            release(name)
+    instance._previous_files = None
+
+def blob_owner_deleted(sender, instance, **kwargs):
+    for name in _file_names(instance).values():
+        release(name)
+
+for model in BLOB_MODELS:
+    pre_save.connect(blob_owner_saving, sender=model)
+    post_save.connect(blob_owner_saved, sender=model)
+    post_delete.connect(blob_owner_deleted, sender=model)
+
+
+# ── Search index ───────────────────────────────────────────────────────────────
+SEARCH_MODELS = (Book, Note, Record, Material, News, Question, Reply)
+
+def searchable_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_object(instance)
+
+def searchable_deleted(sender, instance, **kwargs):
+    unindex_object(instance)
+
+for model in SEARCH_MODELS:
+    post_save.connect(searchable_saved, sender=model)
+    post_delete.connect(searchable_deleted, sender=model)
+
+
+# ── Live Q&A ───────────────────────────────────────────────────────────────────
+# Upvotes are published by material.upvotes.cast_vote.
+def _author_name(instance):
+    if instance.author_user_id:
+        return instance.author_user.username
+    return instance.author or "Anon"
+
+@receiver(post_save, sender=Question)
+def question_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish(instance.level_id, "question", {
+            "id": instance.id, "author": _author_name(instance), "content": instance.content,
+        })
+
+@receiver(post_save, sender=Reply)
+def reply_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish(instance.question.level_id, "reply", {
+            "id": instance.id, "question": instance.question_id,
+            "author": _author_name(instance), "content": instance.content,
+        })
+
+
+# ── Read replicas ──────────────────────────────────────────────────────────────
+# Any model write pins the current client to the primary (material.replicas).
+@receiver(post_save)
+@receiver(post_delete)
+def row_written(sender, **kwargs):
+    note_write()
+
+
+# ── Database connections ───────────────────────────────────────────────────────
+@receiver(connection_created)
+def database_connected(sender, connection, **kwargs):
+    connection_opened(connection.alias)
+    # First, so connection.execute_wrapper() blocks still pop their own.
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_timer)
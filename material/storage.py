@@ -0,0 +1,117 @@
+"""
+Content-addressed file storage. Every file is stored once per SHA-256 under
+``cas/ab/cd/<sha256>/<original name>``; identical uploads share the blob and a
+Blob row counts how many model fields point at it. Blob contents never
+change, so their URLs can be cached as immutable (see material.media).
+"""
+import hashlib
+import os
+import shutil
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F, FileField
+from django.utils.text import get_valid_filename
+
+PREFIX = "cas"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        """
+        Store ``content`` once and take a reference on its blob. Run it inside
+        the owner's save (see BlobOwner) so a failed save drops the reference.
+        """
+        Blob = apps.get_model("material", "Blob")
+        sha256 = file_sha256(content)
+        target = f"{blob_directory(sha256)}/{get_valid_filename(os.path.basename(name))}"
+        with transaction.atomic():
+            # Locked, so collect() cannot delete the blob and its directory
+            # between this check and the new reference.
+            blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+            if blob:
+                if not self.exists(blob.name):
+                    blob.name = super()._save(target, content)
+                Blob.objects.filter(pk=blob.pk).update(name=blob.name, refcount=F("refcount") + 1)
+                return blob.name
+
+        name = super()._save(target, content)
+        try:
+            with transaction.atomic():
+                Blob.objects.create(sha256=sha256, name=name, size=content.size, refcount=1)
+        except IntegrityError:
+            # A concurrent upload of the same content stored it first: drop
+            # our copy of the file and reference that blob instead.
+            self.delete(name)
+            return self._save(name, content)
+        return name
+
+    def save_beside(self, name, content):
+        """Store a file under exactly ``name``, e.g. an image derivative next to its blob."""
+        return super()._save(name, content)
+
+    def delete_blob(self, name):
+        """Remove a blob and everything stored beside it (image derivatives)."""
+        directory = self.path(os.path.dirname(name))
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+content_storage_instance = ContentAddressedStorage()
+
+
+def content_storage():
+    return content_storage_instance
+
+
+def file_sha256(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_directory(sha256):
+    return f"{PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(PREFIX + "/")
+
+
+def content_fields(model):
+    """Names of ``model``'s file fields that use content-addressed storage."""
+    return [
+        field.name for field in model._meta.fields
+        if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def content_models():
+    for model in apps.get_models():
+        fields = content_fields(model)
+        if fields:
+            yield model, fields
+
+
+def release(name):
+    """Drop one reference to a blob; the last one deletes it after commit."""
+    if not is_blob(name):
+        return
+    Blob = apps.get_model("material", "Blob")
+    Blob.objects.filter(name=name).update(refcount=F("refcount") - 1)
+    transaction.on_commit(lambda: collect(name))
+
+
+def collect(name):
+    Blob = apps.get_model("material", "Blob")
+    with transaction.atomic():
+        # The directory goes while the row is locked, so a concurrent _save of
+        # the same content waits and then stores a fresh copy.
+        blob = Blob.objects.select_for_update().filter(name=name, refcount__lte=0).first()
+        if blob is None:
+            return
+        Blob.objects.filter(pk=blob.pk).delete()
+        content_storage_instance.delete_blob(name)
@@ -0,0 +1,14 @@
+from tasks.queue import task
+
+from .images import generate_derivatives, image_storage
+from .upvotes import flush_votes
+
+
+@task(max_attempts=3, timeout=120)
+def generate_image_derivatives(name, field=None):
+    generate_derivatives(name, image_storage(field))
+
+
+@task(max_attempts=3, timeout=300)
+def flush_upvotes():
+    flush_votes()
@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from material.images import available_widths, derivative_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_img(image, sizes="100vw", **attrs):
+    """
+    Render ``image`` (an ImageFieldFile) as a <picture> with WebP and JPEG
+    srcsets of its derivatives, falling back to the original until they exist.
+
+        {% responsive_img level.image sizes="160px" class="img-fluid" %}
+    """
+    if not image:
+        return ""
+    attrs.setdefault("loading", "lazy")
+    extra = format_html_join("", ' {}="{}"', attrs.items())
+    widths = available_widths(image.name, image.storage)
+    if not widths:
+        return format_html('<img src="{}"{}>', image.url, extra)
+
+    def srcset(fmt):
+        return ", ".join(
+            f"{image.storage.url(derivative_name(image.name, w, fmt))} {w}w" for w in widths
+        )
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        srcset("webp"), sizes, image.url, srcset("jpeg"), sizes, extra,
+    )
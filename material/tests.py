@@ -1,3 +1,1084 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.sessions.backends.cache import SessionStore
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, router
+from django.db.models import QuerySet
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.http import Http404, HttpResponse
+from django.test import AsyncRequestFactory, LiveServerTestCase, RequestFactory, TestCase, override_settings
+from PIL import Image as PILImage
+from django.template import Context, Template
+from django.test.testcases import LiveServerThread
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Level, Book, Image, Note, Record, Quiz, QuizQuestion, QuizAnswer, Question, Reply, News,
+    ScoreEvent, StudentHonor, ReplyVote, ChunkedUpload, Blob, LiveEvent,
+)
+from . import async_views, checks, leaderboard, live, metrics, quiz_bulk, replicas, views
+from .leaderboard import get_leaderboard
+from .pagination import keyset_filter
+from .quiz_bulk import create_quizzes
+from .quiz_cache import quiz_versions
+from . import search as site_search
+from .scoring import award_points, materialize_scores, rebuild_scores
+from .storage import ContentAddressedStorage, content_storage
+from .upvotes import cast_vote, flush_votes
+
+
+def seed_level(quizzes=10, questions_per_quiz=20, threads=200, replies_per_thread=2):
+    level = Level.objects.create(name="Seeded level")
+    user = User.objects.create_user("seed-author", password="x")
+    Book.objects.bulk_create(Book(level=level, title=f"Book {i}", file="books/b.pdf") for i in range(5))
+    Note.objects.bulk_create(Note(level=level, title=f"Note {i}", file="notes/n.pdf") for i in range(5))
+    Record.objects.bulk_create(Record(level=level, title=f"Rec {i}", file="records/r.mp3") for i in range(5))
+    News.objects.bulk_create(News(level=level, title=f"News {i}", content="x") for i in range(5))
+
+    quiz_objs = Quiz.objects.bulk_create(Quiz(level=level, title=f"Quiz {i}") for i in range(quizzes))
+    question_objs = QuizQuestion.objects.bulk_create(
+        QuizQuestion(quiz=quiz, text=f"Q{j}", question_type="multiple" if j % 2 else "single")
+        for quiz in quiz_objs for j in range(questions_per_quiz)
+    )
+    QuizAnswer.objects.bulk_create(
+        QuizAnswer(question=q, text=f"A{k}", is_correct=k == 0)
+        for q in question_objs for k in range(4)
+    )
+
+    thread_objs = Question.objects.bulk_create(
+        Question(level=level, content=f"Thread {i}", author_user=user if i % 2 else None, author="" if i % 2 else "guest")
+        for i in range(threads)
+    )
+    Reply.objects.bulk_create(
+        Reply(question=t, content="reply", author_user=user if k % 2 else None)
+        for t in thread_objs for k in range(replies_per_thread)
+    )
+    return level
+
+
+class QueryBudgetMixin:
+    def assertMaxQueries(self, budget, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            result = func(*args, **kwargs)
+        self.assertLessEqual(
+            len(ctx.captured_queries), budget,
+            f"{len(ctx.captured_queries)} queries executed, budget is {budget}:\n"
+            + "\n".join(q["sql"] for q in ctx.captured_queries),
+        )
+        return result
+
+
+class LevelDetailQueryBudgetTests(QueryBudgetMixin, TestCase):
+    # level + first page of the default tab
+    BUDGET = 2
+    # level + items (+ one prefetch per nested relation); quizzes read their
+    # questions from the answer-key cache once it is warm
+    TAB_BUDGETS = {
+        "books": 2, "notes": 2, "records": 2, "images": 2, "news": 2,
+        "quizzes": 2, "qa": 3,
+    }
+
+    def setUp(self):
+        cache.clear()
+
+    def test_large_level_stays_within_budget(self):
+        level = seed_level()
+        response = self.assertMaxQueries(
+            self.BUDGET, self.client.get, reverse("material:details", args=[level.id])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Book 0")
+
+    def test_tabs_stay_within_budget(self):
+        level = seed_level()
+        self.client.get(reverse("material:level_tab", args=[level.id, "quizzes"]))
+        for tab, budget in self.TAB_BUDGETS.items():
+            with self.subTest(tab=tab):
+                response = self.assertMaxQueries(
+                    budget, self.client.get, reverse("material:level_tab", args=[level.id, tab])
+                )
+                self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("material:level_tab", args=[level.id, "qa"]))
+        self.assertContains(response, "seed-author")
+        self.assertContains(response, "guest")
+
+    def test_query_count_does_not_grow_with_level_size(self):
+        small = seed_level(quizzes=1, questions_per_quiz=1, threads=1, replies_per_thread=1)
+        User.objects.filter(username="seed-author").delete()
+        large = seed_level()
+        for tab in views.LEVEL_TABS:
+            counts = []
+            for level in (small, large):
+                with CaptureQueriesContext(connection) as ctx:
+                    self.client.get(reverse("material:level_tab", args=[level.id, tab]))
+                counts.append(len(ctx.captured_queries))
+            self.assertEqual(counts[0], counts[1], tab)
+
+
+class LevelTabPaginationTests(TestCase):
+    def test_keyset_cursor_walks_every_thread_once(self):
+        level = seed_level(quizzes=0, threads=45, replies_per_thread=0)
+        url = reverse("material:level_tab", args=[level.id, "qa"])
+        seen = []
+        while url:
+            response = self.client.get(url)
+            seen += [q.id for q in response.context["items"]]
+            url = response.context["next_url"]
+        expected = list(level.questions.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_unknown_tab_and_bad_cursor(self):
+        level = Level.objects.create(name="L")
+        self.assertEqual(self.client.get(reverse("material:level_tab", args=[level.id, "nope"])).status_code, 404)
+        url = reverse("material:level_tab", args=[level.id, "news"])
+        self.assertEqual(self.client.get(url, {"cursor": "garbage"}).status_code, 400)
+
+
+class QuizSubmitTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.level = seed_level(quizzes=2, questions_per_quiz=50, threads=0)
+        self.quiz, self.other_quiz = Quiz.objects.order_by("id")
+        self.user = User.objects.create_user("student", password="x")
+        self.client.force_login(self.user)
+        self.url = reverse("material:quiz_submit", args=[self.level.id])
+
+    def answers_for(self, quiz, pick_correct=True):
+        data = {"quiz_id": quiz.id}
+        for question in quiz.questions.prefetch_related("answers"):
+            answer = next(a for a in question.answers.all() if a.is_correct == pick_correct)
+            data[f"question_{question.id}"] = [answer.id]
+        return data
+
+    def test_grading_cost_does_not_depend_on_quiz_size(self):
+        data = self.answers_for(self.quiz)
+        self.client.post(self.url, data)
+        # session, user, ledger insert + score update (in a savepoint); no quiz
+        # reads once the key is cached
+        response = self.assertMaxQueries(6, self.client.post, self.url, data)
+        self.assertEqual((response.context["correct"], response.context["total"]), (50, 50))
+
+    def test_answer_changes_invalidate_cached_key(self):
+        data = self.answers_for(self.quiz)
+        self.client.post(self.url, data)
+        answer = QuizAnswer.objects.get(id=data[next(k for k in data if k.startswith("question_"))][0])
+        answer.is_correct = False
+        version = quiz_versions([self.quiz.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            answer.save()
+            # Not before commit: a concurrent submit would cache the old rows.
+            self.assertEqual(quiz_versions([self.quiz.id]), version)
+        self.assertEqual(self.client.post(self.url, data).context["correct"], 49)
+        with self.captureOnCommitCallbacks(execute=True):
+            QuizQuestion.objects.filter(id=answer.question_id).delete()
+        data.pop(f"question_{answer.question_id}")
+        self.assertEqual(self.client.post(self.url, data).context["total"], 49)
+
+    def test_wrong_answers_are_reported(self):
+        response = self.client.post(self.url, self.answers_for(self.quiz, pick_correct=False))
+        self.assertEqual(response.context["correct"], 0)
+        self.assertEqual(len(response.context["wrong_questions"]), 50)
+        self.assertEqual(response.context["wrong_questions"][0]["correct_answers"][0]["text"], "A0")
+
+    def test_rejects_answers_from_another_quiz(self):
+        data = self.answers_for(self.quiz)
+        foreign = QuizAnswer.objects.filter(question__quiz=self.other_quiz).first()
+        data[next(k for k in data if k.startswith("question_"))] = [foreign.id]
+        self.assertEqual(self.client.post(self.url, data).status_code, 400)
+
+    def test_process_local_cache_is_refused_with_several_processes(self):
+        local = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(CACHES=local, TASKS_EAGER=True):
+            self.assertEqual(checks.shared_cache(None), [])
+            with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "4"}):
+                self.assertEqual([e.id for e in checks.shared_cache(None)], ["material.E001"])
+        with override_settings(CACHES=local, TASKS_EAGER=False):
+            self.assertEqual([e.id for e in checks.shared_cache(None)], ["material.E001"])
+        with override_settings(CACHES=local, TASKS_EAGER=True, SERVER_MODE="asgi"):
+            self.assertEqual([e.id for e in checks.shared_cache(None)], ["material.E001"])
+        shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache"}}
+        with override_settings(CACHES=shared, TASKS_EAGER=False):
+            self.assertEqual(checks.shared_cache(None), [])
+
+
+class ScoreLedgerTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="x")
+        self.bob = User.objects.create_user("bob", password="x")
+
+    def test_inline_awards_update_scores_immediately(self):
+        with mock.patch.object(leaderboard, "scores_changed") as scores_changed:
+            with self.captureOnCommitCallbacks(execute=True):
+                award_points(self.alice, 10, "quiz")  # creates the StudentHonor row
+            scores_changed.assert_called_once_with([self.alice.id])
+        award_points(self.alice, 1, "upvote")
+        self.assertEqual(StudentHonor.objects.get(user=self.alice).score, 11)
+        self.assertFalse(ScoreEvent.objects.filter(applied=False).exists())
+
+    @override_settings(SCORE_LEDGER_MODE="deferred")
+    def test_deferred_awards_are_materialized_in_batches(self):
+        for _ in range(7):
+            award_points(self.alice, 10, "quiz")
+            award_points(self.bob, 1, "upvote")
+        self.assertFalse(StudentHonor.objects.exists())
+        self.assertEqual(materialize_scores(batch_size=4), 14)
+        self.assertEqual(materialize_scores(), 0)
+        scores = dict(StudentHonor.objects.values_list("user__username", "score"))
+        self.assertEqual(scores, {"alice": 70, "bob": 7})
+
+    def test_rebuild_replays_the_ledger(self):
+        award_points(self.alice, 10, "quiz")
+        award_points(self.bob, 3, "adjustment")
+        StudentHonor.objects.update(score=999)
+        rebuild_scores()
+        scores = dict(StudentHonor.objects.values_list("user__username", "score"))
+        self.assertEqual(scores, {"alice": 10, "bob": 3})
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, score in [("ann", 50), ("ben", 30), ("cat", 30), ("dan", 10)]:
+            StudentHonor.objects.create(user=User.objects.create_user(name, password="x"), score=score)
+
+    def test_ranks_and_top(self):
+        board = get_leaderboard()
+        ids = dict(User.objects.values_list("username", "id"))
+        self.assertEqual([e["username"] for e in board.top(2)], ["ann", "ben"])
+        self.assertEqual([board.rank(ids[n]) for n in ["ann", "ben", "cat", "dan"]], [1, 2, 2, 4])
+        self.assertEqual(board.top_percent(ids["dan"]), 100)
+        self.assertContains(self.client.get(reverse("material:home")), "ann")
+
+    def test_score_changes_are_applied_incrementally(self):
+        get_leaderboard()
+        dan = User.objects.get(username="dan")
+        with self.captureOnCommitCallbacks(execute=True):
+            award_points(dan, 45, "quiz")
+        with self.assertNumQueries(0):
+            board = get_leaderboard()
+            self.assertEqual(board.rank(dan.id), 1)
+            self.assertEqual(board.top(1)[0]["score"], 55)
+
+    def test_shared_snapshot_is_rebuilt_at_most_once_per_interval(self):
+        ids = dict(User.objects.values_list("username", "id"))
+        get_leaderboard()
+        generation = cache.get(leaderboard.GENERATION_KEY)
+        for name, points in [("dan", 45), ("cat", 1), ("ben", 2)]:
+            with self.captureOnCommitCallbacks(execute=True):
+                award_points(User.objects.get(username=name), points, "quiz")
+        # The first change was published; the other two waited for the interval.
+        self.assertEqual(cache.get(leaderboard.GENERATION_KEY), generation + 1)
+        self.assertEqual(get_leaderboard().rank(ids["cat"]), 4)  # this process sees its own changes
+        local_version = leaderboard.current_generation()
+        self.assertNotEqual(local_version, generation + 1)
+
+        leaderboard._local.update(board=None)  # another process
+        self.assertEqual(get_leaderboard().rank(ids["cat"]), 3)
+        self.assertEqual(leaderboard.current_generation(), generation + 1)
+        cache.delete(leaderboard.REFRESH_LOCK_KEY)  # the interval passes
+        with self.assertNumQueries(1):  # only the two changed rows are re-read
+            board = get_leaderboard()
+        self.assertEqual([board.rank(ids[n]) for n in ["dan", "ann", "ben", "cat"]], [1, 2, 3, 4])
+        self.assertEqual(cache.get(leaderboard.GENERATION_KEY), generation + 2)
+
+
+class UpvoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.level = Level.objects.create(name="L")
+        self.author = User.objects.create_user("author", password="x")
+        question = Question.objects.create(level=self.level, content="q")
+        self.reply = Reply.objects.create(question=question, content="r", author_user=self.author)
+        self.voters = [User.objects.create_user(f"v{i}", password="x") for i in range(3)]
+        self.url = reverse("material:upvote_reply", args=[self.reply.id])
+        self.tab_url = reverse("material:level_tab", args=[self.level.id, "qa"])
+
+    def vote(self, user):
+        self.client.force_login(user)
+        self.client.post(self.url)
+
+    def test_one_vote_per_user_and_buffered_until_flush(self):
+        cache.add("upvotes:flush", 1, 60)  # hold off the opportunistic flush
+        for user in self.voters:
+            self.vote(user)
+        self.vote(self.voters[0])
+        self.assertEqual(ReplyVote.objects.count(), 3)
+        self.reply.refresh_from_db()
+        self.assertEqual(self.reply.upvotes, 0)
+
+        reply = self.client.get(self.tab_url).context["items"][0].replies.all()[0]
+        self.assertEqual((reply.upvote_count, reply.voted), (3, True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(flush_votes(), 3)
+        self.reply.refresh_from_db()
+        self.assertEqual(self.reply.upvotes, 3)
+        self.assertEqual(StudentHonor.objects.get(user=self.author).score, 3)
+        reply = self.client.get(self.tab_url).context["items"][0].replies.all()[0]
+        self.assertEqual(reply.upvote_count, 3)
+
+    def test_count_is_right_when_another_process_flushes(self):
+        cache.add("upvotes:flush", 1, 60)
+        for user in self.voters:
+            self.vote(user)
+        # flush_upvotes --loop or another worker: nothing shared with this process.
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("flush_upvotes", stdout=StringIO())
+        cache.clear()
+        self.vote(User.objects.create_user("late", password="x"))
+        reply = self.client.get(self.tab_url).context["items"][0].replies.all()[0]
+        self.assertEqual((reply.upvotes, reply.upvote_count), (3, 4))
+
+    def test_anonymous_votes_are_refused(self):
+        self.client.post(self.url)
+        self.assertFalse(ReplyVote.objects.exists())
+
+    @override_settings(TASKS_EAGER=True)
+    def test_failing_flush_does_not_fail_the_vote(self):
+        self.client.force_login(self.voters[0])
+        with mock.patch("material.tasks.flush_votes", side_effect=OperationalError("database is locked")):
+            with self.assertLogs("tasks.queue", "WARNING"), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(ReplyVote.objects.filter(user=self.voters[0], counted=False).exists())
+
+
+class HomepageFragmentTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        Level.objects.create(name="First level")
+        News.objects.create(title="Exam dates", content="soon", is_slide=True)
+
+    def test_warm_homepage_runs_no_queries(self):
+        self.client.get(reverse("material:home"))
+        response = self.assertMaxQueries(0, self.client.get, reverse("material:home"))
+        self.assertContains(response, "First level")
+        self.assertContains(response, "Exam dates")
+
+    def test_writes_invalidate_their_sections(self):
+        self.client.get(reverse("material:home"))
+        with self.captureOnCommitCallbacks(execute=True):
+            Level.objects.create(name="Second level")
+            News.objects.create(title="Holiday", content="x")
+            # Not before commit: a concurrent render would cache the old rows.
+            self.assertNotContains(self.client.get(reverse("material:home")), "Second level")
+        response = self.client.get(reverse("material:home"))
+        self.assertContains(response, "Second level")
+        self.assertContains(response, "Holiday")
+
+    def test_staff_controls_only_render_for_staff(self):
+        self.assertNotContains(self.client.get(reverse("material:home")), "New Level")
+        self.client.force_login(User.objects.create_user("staff", password="x", is_staff=True))
+        self.assertContains(self.client.get(reverse("material:home")), "New Level")
+
+
+class QuizBuilderTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.level = Level.objects.create(name="L")
+        self.client.force_login(User.objects.create_user("staff", password="x", is_staff=True))
+        self.url = reverse("material:quiz_builder", args=[self.level.id])
+
+    def post_data(self, questions=100, answers=4):
+        data = {"title": "Big quiz", "level": self.level.id, "question_count": questions}
+        for i in range(1, questions + 1):
+            data.update({f"question_{i}_text": f"Q{i}", f"question_{i}_type": "single",
+                         f"question_{i}_answer_count": answers})
+            for j in range(1, answers + 1):
+                data[f"question_{i}_answer_{j}_text"] = f"A{j}"
+            data[f"question_{i}_answer_1_correct"] = "on"
+        return data
+
+    def test_whole_quiz_is_inserted_in_bulk(self):
+        # session, user, level check, savepoint, bulk inserts (SQLite splits the
+        # 400 answers in two to stay under its parameter limit), release
+        response = self.assertMaxQueries(9, self.client.post, self.url, self.post_data())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(QuizQuestion.objects.count(), 100)
+        self.assertEqual(QuizAnswer.objects.filter(is_correct=True).count(), 100)
+
+    def test_invalid_quiz_is_rejected_with_field_errors(self):
+        data = self.post_data(questions=3)
+        data["question_2_answer_3_text"] = ""
+        data.pop("question_3_answer_1_correct")
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.context["errors"]), {"question_2_answer_3_text", "question_3_answer_count"})
+        self.assertFalse(Quiz.objects.exists())
+        # Everything entered is shown again, not just the title and level.
+        self.assertContains(response, 'name="question_3_text" value="Q3"')
+        self.assertContains(response, 'name="question_1_answer_1_correct" checked')
+        self.assertContains(response, 'name="question_2_answer_4_text" value="A4"')
+        self.assertContains(response, 'id="question_count" value="3"')
+
+    def test_counts_are_capped(self):
+        data = self.post_data(questions=1)
+        data["question_1_answer_count"] = 10**9
+        data["question_count"] = 10**9
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.context["errors"]["question_count"], f"At most {quiz_bulk.MAX_QUESTIONS}.")
+        self.assertEqual(response.context["errors"]["question_1_answer_count"], f"At most {quiz_bulk.MAX_ANSWERS}.")
+        self.assertEqual(len(response.context["questions"]), quiz_bulk.MAX_QUESTIONS)
+        self.assertFalse(Quiz.objects.exists())
+
+
+class QuizImportExportTests(TestCase):
+    def setUp(self):
+        self.level = Level.objects.create(name="Level One")
+
+    def export(self, fmt):
+        out = StringIO()
+        call_command("export_quizzes", format=fmt, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_round_trip_jsonl_and_csv(self):
+        lines = [
+            json.dumps({"title": f"Quiz {i}", "level": "level one" if i % 2 else self.level.id, "questions": [
+                {"text": f"Q{k}", "type": "multiple", "answers": [
+                    {"text": "yes", "correct": True}, {"text": "no", "correct": False}]}
+                for k in range(3)
+            ]})
+            for i in range(5)
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write("\n".join(lines))
+        self.addCleanup(os.unlink, f.name)
+        call_command("import_quizzes", f.name, batch_size=2, stdout=StringIO())
+        self.assertEqual((Quiz.objects.count(), QuizQuestion.objects.count(), QuizAnswer.objects.count()), (5, 15, 30))
+
+        exported = self.export("jsonl").splitlines()
+        self.assertEqual(len(exported), 5)
+        self.assertEqual(json.loads(exported[0])["questions"][0]["answers"][0], {"text": "yes", "correct": True})
+
+        csv_text = self.export("csv")
+        Quiz.objects.all().delete()
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as f:
+            f.write(csv_text)
+        self.addCleanup(os.unlink, f.name)
+        call_command("import_quizzes", f.name, stdout=StringIO())
+        self.assertEqual((Quiz.objects.count(), QuizAnswer.objects.filter(is_correct=True).count()), (5, 15))
+
+    def test_csv_round_trip_keeps_quizzes_and_questions_with_the_same_names_apart(self):
+        quiz = {"title": "Untitled Quiz", "level_id": self.level.id, "questions": [
+            {"text": "Same?", "type": "single", "answers": [{"text": "a", "is_correct": True}]},
+            {"text": "Same?", "type": "single", "answers": [{"text": "b", "is_correct": True}]},
+        ]}
+        create_quizzes([quiz, quiz])
+        csv_text = self.export("csv")
+        Quiz.objects.all().delete()
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as f:
+            f.write(csv_text)
+        self.addCleanup(os.unlink, f.name)
+        call_command("import_quizzes", f.name, stdout=StringIO())
+        self.assertEqual((Quiz.objects.count(), QuizQuestion.objects.count(), QuizAnswer.objects.count()), (2, 4, 4))
+        self.assertEqual(
+            [list(q.answers.values_list("text", flat=True)) for q in Quiz.objects.order_by("id")[0].questions.order_by("id")],
+            [["a"], ["b"]],
+        )
+
+    def test_invalid_records_abort_or_are_skipped(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write(json.dumps({"title": "ok", "level": "Level One", "questions": [
+                {"text": "Q", "answers": [{"text": "a", "correct": True}]}]}) + "\n")
+            f.write(json.dumps({"title": "bad", "level": "Nope", "questions": []}) + "\n")
+            f.write(json.dumps({"title": "x" * (quiz_bulk.TITLE_MAX + 1), "level": "Level One", "questions": [
+                {"text": "Q", "answers": [{"text": "a", "correct": True}]}]}) + "\n")
+        self.addCleanup(os.unlink, f.name)
+        with self.assertRaisesMessage(CommandError, "line 2"):
+            call_command("import_quizzes", f.name, stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "line 2: unknown level; Add at least one question. "
+                                                    "(1 quizzes before it were imported)"):
+            call_command("import_quizzes", f.name, batch_size=1, stdout=StringIO())
+        stderr = StringIO()
+        call_command("import_quizzes", f.name, skip_invalid=True, stdout=StringIO(), stderr=stderr)
+        self.assertIn(f"line 3: Quiz title must be at most {quiz_bulk.TITLE_MAX} characters.", stderr.getvalue())
+        self.assertEqual(Quiz.objects.count(), 2)
+
+
+@override_settings(TASKS_EAGER=True)
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def upload(self, size):
+        buffer = BytesIO()
+        PILImage.new("RGB", size, "red").save(buffer, "JPEG")
+        return SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+    def test_upload_is_downscaled_and_gets_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            level = Level.objects.create(name="L", image=self.upload((4000, 1000)))
+        with PILImage.open(level.image.path) as stored:
+            self.assertEqual(stored.size, (2560, 640))
+        html = self.client.get(reverse("material:home")).content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(".w640.webp 640w", html)
+        self.assertIn(".w1280.jpg 1280w", html)
+
+    def test_derivatives_live_in_the_image_fields_storage(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        storage = ContentAddressedStorage(location=location.name, base_url="/blobs/")
+        self.enterContext(mock.patch.object(Image._meta.get_field("image"), "storage", storage))
+        level = Level.objects.create(name="L")
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(level=level, image=self.upload((1000, 500)))
+        directory = os.path.dirname(image.image.name)
+        self.assertIn(os.path.basename(image.image.name.replace(".jpg", ".w640.webp")),
+                      storage.listdir(directory)[1])
+        self.assertEqual(Blob.objects.count(), 1)  # copies are not content-addressed themselves
+        html = Template("{% load media_tags %}{% responsive_img image %}").render(Context({"image": image.image}))
+        self.assertIn(f"/blobs/{directory}/photo.w640.webp 640w", html)
+
+
+class MediaDeliveryTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        os.makedirs(os.path.join(media.name, "records"))
+        with open(os.path.join(media.name, "records", "lesson.mp3"), "wb") as fp:
+            fp.write(bytes(range(256)) * 4)
+        self.url = "/media/records/lesson.mp3"
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_and_ranged_responses(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, len(body)), (200, 1024))
+        self.assertEqual(response["Content-Type"], "audio/mpeg")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("max-age=", response["Cache-Control"])
+
+        response, body = self.get(Range="bytes=256-259")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 256-259/1024")
+        self.assertEqual(body, bytes([0, 1, 2, 3]))
+
+        response, body = self.get(Range="bytes=-2")
+        self.assertEqual((response["Content-Range"], body), ("bytes 1022-1023/1024", bytes([254, 255])))
+
+        response, _ = self.get(Range="bytes=2048-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */1024"))
+
+        response, body = self.get(Range="bytes=0-1", **{"If-Range": '"stale"'})
+        self.assertEqual((response.status_code, len(body)), (200, 1024))
+
+    def test_validators_and_offload(self):
+        response, _ = self.get()
+        self.assertEqual(self.get(**{"If-None-Match": response["ETag"]})[0].status_code, 304)
+        self.assertEqual(self.get(**{"If-Modified-Since": response["Last-Modified"]})[0].status_code, 304)
+
+        with self.settings(MEDIA_OFFLOAD="x-accel-redirect"):
+            response, body = self.get()
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/records/lesson.mp3")
+        self.assertEqual(body, b"")
+
+        self.assertEqual(self.client.get("/media/../settings.py").status_code, 404)
+        self.assertEqual(self.client.get("/media/records/missing.mp3").status_code, 404)
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=os.path.join(media.name, "media"),
+            UPLOAD_STAGING_DIR=os.path.join(media.name, "staging"),
+            UPLOAD_CHUNK_SIZE=4,
+        ))
+        self.level = Level.objects.create(name="L")
+        self.client.force_login(User.objects.create_user("staff", password="x", is_staff=True))
+
+    def put(self, state, offset, data, digest=None):
+        return self.client.put(
+            f"{state['chunk_url']}?offset={offset}", data, content_type="application/octet-stream",
+            headers={"X-Chunk-Sha256": digest or hashlib.sha256(data).hexdigest()},
+        )
+
+    def test_resumable_upload_is_verified_and_attached(self):
+        content = b"0123456789"
+        state = self.client.post(reverse("material:upload_start"), {
+            "target": "book", "filename": "../scan.pdf", "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest(),
+        }).json()
+        self.assertEqual(self.put(state, 0, content[:4]).json()["offset"], 4)
+
+        # A corrupted chunk is discarded, an out-of-order one is refused.
+        self.assertEqual(self.put(state, 4, b"XXXX", hashlib.sha256(b"4567").hexdigest()).status_code, 400)
+        response = self.put(state, 8, content[8:])
+        self.assertEqual((response.status_code, response.json()["offset"]), (409, 4))
+
+        # Resume: ask where to continue, then finish.
+        offset = self.client.get(state["chunk_url"]).json()["offset"]
+        self.assertEqual(offset, 4)
+        self.put(state, 4, content[4:8])
+        complete = reverse("material:upload_complete", args=[state["id"]])
+        self.assertEqual(self.client.post(complete, {"level": self.level.id, "title": "T"}).status_code, 400)
+        self.put(state, 8, content[8:])
+        response = self.client.post(complete, {"level": self.level.id, "title": "Scan"})
+
+        book = Book.objects.get()
+        self.assertEqual(response.json()["redirect"], reverse("material:details", args=[self.level.id]))
+        self.assertTrue(book.file.name.startswith("cas/") and book.file.name.endswith("/scan.pdf"))
+        with book.file.open("rb") as fp:
+            self.assertEqual(fp.read(), content)
+        self.assertEqual(os.listdir(settings.UPLOAD_STAGING_DIR), [])
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.level = Level.objects.create(name="L")
+
+    def test_identical_uploads_share_one_blob(self):
+        first = Book.objects.create(level=self.level, title="A", file=SimpleUploadedFile("a.pdf", b"%PDF same"))
+        second = Note.objects.create(level=self.level, title="B", file=SimpleUploadedFile("b.pdf", b"%PDF same"))
+        other = Note.objects.create(level=self.level, title="C", file=SimpleUploadedFile("c.pdf", b"%PDF other"))
+
+        digest = hashlib.sha256(b"%PDF same").hexdigest()
+        self.assertEqual(first.file.name, f"cas/{digest[:2]}/{digest[2:4]}/{digest}/a.pdf")
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertNotEqual(other.file.name, first.file.name)
+        self.assertEqual(Blob.objects.get(sha256=digest).refcount, 2)
+
+        response = self.client.get(first.file.url)
+        self.assertIn("immutable", response["Cache-Control"])
+        b"".join(response.streaming_content)
+
+        path = first.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.filter(sha256=digest).exists())
+
+    def test_concurrent_uploads_of_new_content_share_the_first_blob(self):
+        storage = content_storage()
+        digest = hashlib.sha256(b"%PDF race").hexdigest()
+        winner = storage.save("first.pdf", SimpleUploadedFile("first.pdf", b"%PDF race"))
+        # The second upload looked for the blob before the first one committed.
+        first = QuerySet.first
+        lookups = []
+
+        def missed_once(queryset):
+            lookups.append(queryset.model)
+            return None if len(lookups) == 1 else first(queryset)
+        with mock.patch.object(QuerySet, "first", missed_once):
+            name = storage.save("second.pdf", SimpleUploadedFile("second.pdf", b"%PDF race"))
+        self.assertEqual(name, winner)
+        self.assertEqual(Blob.objects.get(sha256=digest).refcount, 2)
+        self.assertEqual(os.listdir(os.path.dirname(storage.path(winner))), ["first.pdf"])
+
+    def test_failed_save_does_not_keep_a_reference(self):
+        Book.objects.create(level=self.level, title="A", file=SimpleUploadedFile("a.pdf", b"%PDF kept"))
+        for content in (b"%PDF kept", b"%PDF new"):
+            with self.assertRaises(IntegrityError):
+                Book(level=self.level, title=None, file=SimpleUploadedFile("b.pdf", content)).save()
+        self.assertEqual(list(Blob.objects.values_list("refcount", flat=True)), [1])
+
+    def test_dedupe_media_moves_legacy_files(self):
+        for folder in ("books", "notes"):
+            os.makedirs(os.path.join(settings.MEDIA_ROOT, folder))
+            with open(os.path.join(settings.MEDIA_ROOT, folder, "x.pdf"), "wb") as fp:
+                fp.write(b"%PDF legacy")
+        Book.objects.bulk_create([Book(level=self.level, title="A", file="books/x.pdf")])
+        Note.objects.bulk_create([Note(level=self.level, title="B", file="notes/x.pdf")])
+
+        call_command("dedupe_media", stdout=StringIO())
+        names = {Book.objects.get().file.name, Note.objects.get().file.name}
+        self.assertEqual(len(names), 1)
+        self.assertEqual(Blob.objects.get().refcount, 2)
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, "books", "x.pdf")))
+        with Book.objects.get().file.open("rb") as fp:
+            self.assertEqual(fp.read(), b"%PDF legacy")
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.level = Level.objects.create(name="L")
+
+    def kinds(self, query, **kwargs):
+        results, _ = site_search.search(query, **kwargs)
+        return [(doc.kind, doc.object_id) for doc in results]
+
+    def test_index_follows_writes_and_ranks_title_matches_first(self):
+        news = News.objects.create(title="Exam timetable", content="Photosynthesis revision is on Monday.")
+        book = Book.objects.create(level=self.level, title="Photosynthesis", file="books/p.pdf")
+        question = Question.objects.create(level=self.level, content="What drives photosynthesis?")
+        reply = Reply.objects.create(question=question, content="Sunlight and chlorophyll.")
+
+        self.assertEqual(self.kinds("photosynth")[0], ("book", book.id))
+        self.assertEqual(len(self.kinds("photosynthesis")), 3)
+        self.assertEqual(self.kinds("chlorophyll sunlight"), [("reply", reply.id)])
+        self.assertEqual(self.kinds("photosynthesis", level_id=self.level.id)[-1], ("question", question.id))
+        self.assertEqual(self.kinds('"); DROP TABLE x; --'), [])
+
+        news.content = "Biology revision is on Monday."
+        news.save()
+        book.delete()
+        self.assertEqual(self.kinds("photosynthesis"), [("question", question.id)])
+
+    def test_pagination_and_rebuild(self):
+        Note.objects.bulk_create([Note(level=self.level, title=f"Algebra {i}", file="notes/a.pdf") for i in range(25)])
+        self.assertEqual(self.kinds("algebra"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+
+        response = self.client.get(reverse("material:search"), {"q": "algebra"})
+        self.assertEqual(len(response.context["results"]), 20)
+        self.assertTrue(response.context["has_next"])
+        response = self.client.get(reverse("material:search"), {"q": "algebra", "page": 2})
+        self.assertEqual((len(response.context["results"]), response.context["has_next"]), (5, False))
+
+
+class AsyncViewTests(TestCase):
+    CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="[^"]+"')
+
+    def setUp(self):
+        cache.clear()
+        self.level = seed_level(quizzes=2, questions_per_quiz=3, threads=30)
+
+    def prepare(self, request):
+        request.user = AnonymousUser()
+        request.session = SessionStore()
+        request._messages = CookieStorage(request)
+
+        async def auser():
+            return request.user
+        request.auser = auser
+        return request
+
+    async def test_async_views_render_the_same_pages(self):
+        pages = [
+            ("/", "homepage", {}),
+            (f"/levels/{self.level.id}/", "level_detail", {"level_id": self.level.id}),
+            (f"/levels/{self.level.id}/tabs/qa/", "level_tab", {"level_id": self.level.id, "tab": "qa"}),
+            (f"/levels/{self.level.id}/tabs/quizzes/", "level_tab", {"level_id": self.level.id, "tab": "quizzes"}),
+        ]
+        for path, name, kwargs in pages:
+            expected = await sync_to_async(getattr(views, name))(self.prepare(RequestFactory().get(path)), **kwargs)
+            await sync_to_async(cache.clear)()
+            response = await getattr(async_views, name)(self.prepare(AsyncRequestFactory().get(path)), **kwargs)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.CSRF_RE.sub("", response.content.decode()),
+                             self.CSRF_RE.sub("", expected.content.decode()), path)
+
+        with self.assertRaises(Http404):
+            await async_views.level_tab(self.prepare(AsyncRequestFactory().get("/")), self.level.id, "nope")
+
+    async def test_async_reply_is_saved(self):
+        question = await Question.objects.filter(level=self.level).afirst()
+        request = self.prepare(AsyncRequestFactory().post("/", {"author": "sam", "content": "Async reply"}))
+        response = await async_views.add_reply(request, question.id)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await Reply.objects.filter(question=question, content="Async reply").aexists())
+
+
+@override_settings(SERVER_MODE="asgi")
+class LiveEventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.level = Level.objects.create(name="L")
+        self.question = Question.objects.create(level=self.level, content="First?")
+
+    def test_qa_writes_publish_events(self):
+        reply = Reply.objects.create(question=self.question, content="Yes", author="sam")
+        cast_vote(User.objects.create_user("voter", password="x"), reply)
+        events = list(LiveEvent.objects.values_list("kind", "payload"))
+        self.assertEqual([kind for kind, _ in events], ["question", "reply", "upvote"])
+        self.assertEqual(events[1][1], {"id": reply.id, "question": self.question.id, "author": "sam", "content": "Yes"})
+        self.assertEqual(events[2][1], {"reply": reply.id, "delta": 1})
+
+    def test_old_events_are_pruned_by_writers(self):
+        LiveEvent.objects.update(created_at=timezone.now() - live.RETENTION - timedelta(minutes=1))
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Reply.objects.create(question=self.question, content="Yes")
+        self.assertEqual(list(LiveEvent.objects.values_list("kind", flat=True)), ["reply"])
+
+    @override_settings(SERVER_MODE="wsgi")
+    def test_nothing_is_published_under_wsgi(self):
+        reply = Reply.objects.create(question=self.question, content="Yes")
+        cast_vote(User.objects.create_user("voter", password="x"), reply)
+        self.assertEqual(list(LiveEvent.objects.values_list("kind", flat=True)), ["question"])
+        self.assertEqual(self.client.get(reverse("material:level_events", args=[self.level.id])).status_code, 204)
+
+    async def test_stream_resumes_and_fans_out_new_events(self):
+        first = await LiveEvent.objects.aget(kind="question")
+        stream = live.stream(self.level.id, last_event_id=first.id - 1)
+        others = [live.get_broker().subscribe(self.level.id) for _ in range(1000)]
+        self.assertEqual(await anext(stream), f"retry: {live.RETRY_MS}\n\n")
+        self.assertTrue((await anext(stream)).startswith(f"id: {first.id}\nevent: question\n"))
+
+        reply = await Reply.objects.acreate(question=self.question, content="Live")
+        await cache.aset(live.LATEST_KEY, reply.id)
+        message = await asyncio.wait_for(anext(stream), 5)
+        self.assertIn('"content": "Live"', message)
+        self.assertTrue(all(queue.qsize() == 1 for queue in others))
+        await stream.aclose()
+        for queue in others:
+            live.get_broker().unsubscribe(self.level.id, queue)
+        self.assertEqual(dict(live.get_broker().subscribers), {})
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        replicas._health.clear()
+        self.addCleanup(replicas._health.clear)
+        self.check = self.enterContext(mock.patch.object(replicas, "_check", return_value=True))
+        self.factory = RequestFactory()
+
+    def serve(self, view, request):
+        return replicas.replica_routing_middleware(view)(request)
+
+    def read_alias(self, request):
+        return HttpResponse(router.db_for_read(Level))
+
+    def test_reads_go_to_replica_until_client_writes(self):
+        view = replicas.replica_reads(self.read_alias)
+        response = self.serve(view, self.factory.get("/"))
+        self.assertEqual(response.content, b"replica_1")
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertEqual(self.serve(self.read_alias, self.factory.get("/")).content, b"default")
+
+        response = self.serve(view, self.factory.post("/"))
+        self.assertEqual(response.content, b"default")
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]["max-age"], settings.REPLICA_PIN_SECONDS)
+        request = self.factory.get("/")
+        request.COOKIES[replicas.PIN_COOKIE] = "1"
+        self.assertEqual(self.serve(view, request).content, b"default")
+
+        def write_then_read(request):
+            Level.objects.create(name="New")
+            return self.read_alias(request)
+        response = self.serve(replicas.replica_reads(write_then_read), self.factory.get("/"))
+        self.assertEqual(response.content, b"default")
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_failed_replica_falls_back_to_primary(self):
+        aliases = []
+
+        def flaky(request):
+            aliases.append(router.db_for_read(Level))
+            if aliases[-1] == "replica_1":
+                raise OperationalError("replica went away")
+            return HttpResponse(aliases[-1])
+        response = self.serve(replicas.replica_reads(flaky), self.factory.get("/"))
+        self.assertEqual((aliases, response.content), (["replica_1", "default"], b"default"))
+
+        # Marked down, so the next request does not try it again.
+        self.check.reset_mock()
+        response = self.serve(replicas.replica_reads(self.read_alias), self.factory.get("/"))
+        self.assertEqual(response.content, b"default")
+        self.check.assert_not_called()
+
+        self.check.return_value = False
+        replicas._health.clear()
+        self.check.reset_mock()
+        response = self.serve(replicas.replica_reads(self.read_alias), self.factory.get("/"))
+        self.assertEqual(response.content, b"default")
+        self.check.assert_called_once_with("replica_1")
+
+        # A view that already wrote is not run a second time.
+        self.check.return_value = True
+        replicas._health.clear()
+        calls = []
+
+        def write_then_fail(request):
+            calls.append(router.db_for_read(Level))
+            Level.objects.create(name="Once")
+            raise OperationalError("replica went away")
+        with self.assertRaises(OperationalError):
+            self.serve(replicas.replica_reads(write_then_fail), self.factory.get("/"))
+        self.assertEqual((calls, Level.objects.filter(name="Once").count()), (["replica_1"], 1))
+
+
+class DatabaseStatsTests(TestCase):
+    def test_staff_see_connection_stats(self):
+        self.client.force_login(User.objects.create_user("student", password="x"))
+        self.assertEqual(self.client.get(reverse("material:db_stats")).status_code, 302)
+
+        self.client.force_login(User.objects.create_user("admin", password="x", is_staff=True))
+        stats = self.client.get(reverse("material:db_stats")).json()
+        self.assertGreaterEqual(stats["default"]["connects"], 1)
+        self.assertNotIn("checkouts", stats["default"])
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries must be answered from an index, already in order."""
+
+    def hot_queries(self):
+        level = Level.objects.create(name="L")
+        after = ["2024-01-01T00:00:00+00:00", 10**9]
+        qa_ordering = views.LEVEL_TABS["qa"][1]
+        # name -> (queryset, index that must answer it)
+        return {
+            "slides": (News.objects.filter(is_slide=True)[:5], "news_slide_idx"),
+            "news": (News.objects.all()[:6], "news_recent_idx"),
+            "news tab": (views.LEVEL_TABS["news"][0](level).order_by("-created_at", "-id")[:13], "news_level_idx"),
+            "qa tab": (views._qa_tab_queryset(level).order_by(*qa_ordering)[:21], "question_level_idx"),
+            "qa tab, next page": (
+                views._qa_tab_queryset(level).order_by(*qa_ordering).filter(keyset_filter(qa_ordering, after))[:21],
+                "question_level_idx",
+            ),
+            "qa replies": (
+                views.with_pending_votes(views.with_author_name(Reply.objects.order_by(*views.QA_REPLY_ORDERING)))
+                .filter(question__in=[1, 2, 3]),
+                "reply_question_idx",
+            ),
+            "honor admin": (StudentHonor.objects.order_by("-score", "-id")[:100], "studenthonor_score_idx"),
+        }
+
+    def plan(self, queryset):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                # Tiny test tables make a sequential scan look cheapest; only
+                # fall back to one when no index can answer the query.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("SET LOCAL enable_sort = off")
+        return queryset.explain()
+
+    def test_hot_queries_use_indexes(self):
+        table_scan = re.compile(r"\bSCAN (material_\w+|auth_user)$|Seq Scan on (material_\w+)", re.M)
+        sorting = re.compile(r"USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY|^\s*(->\s*)?(Incremental )?Sort\b", re.M)
+        for name, (queryset, index) in self.hot_queries().items():
+            with self.subTest(name):
+                plan = self.plan(queryset)
+                self.assertIn(index, plan)
+                self.assertIsNone(table_scan.search(plan), plan)
+                self.assertIsNone(sorting.search(plan), plan)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.flush()
+        cache.clear()
+
+    def test_server_timing_reports_the_request(self):
+        level = seed_level(quizzes=1, threads=3)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("material:details", args=[level.id]))
+        timing = dict(
+            (metric.split(";")[0], metric) for metric in response["Server-Timing"].split(", ")
+        )
+        self.assertEqual(set(timing), {"db", "render", "view", "total"})
+        self.assertIn(f'desc="{len(queries)} queries"', timing["db"])
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_endpoint_is_protected_and_aggregates_by_url_name(self):
+        self.client.get(reverse("material:home"))
+        self.client.get(reverse("material:home"))
+        self.assertEqual(self.client.get(reverse("material:metrics")).status_code, 403)
+        self.assertEqual(self.client.get(reverse("material:metrics"), HTTP_AUTHORIZATION="Bearer nope").status_code, 403)
+
+        response = self.client.get(reverse("material:metrics"), HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn("# TYPE elda7e7a_request_duration_seconds histogram", body)
+        self.assertIn('elda7e7a_request_duration_seconds_count{view="material:home"} 2', body)
+        self.assertIn('elda7e7a_db_queries_bucket{view="material:home",le="+Inf"} 2', body)
+
+        self.client.force_login(User.objects.create_user("admin", password="x", is_staff=True))
+        body = self.client.get(reverse("material:metrics")).content.decode()
+        self.assertIn('elda7e7a_request_duration_seconds_count{view="material:metrics"} 3', body)
+
+
+class BenchCommandTests(TestCase):
+    def test_seed_then_bench_against_a_baseline(self):
+        call_command("seed_bench", scale=0.02, seed=7, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 40)
+        self.assertTrue(Reply.objects.exists() and Quiz.objects.exists())
+        with self.assertRaises(CommandError):
+            call_command("seed_bench", stdout=StringIO())
+
+        student = User.objects.get(username="student00001")
+        score = StudentHonor.objects.get(user=student).score
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "bench.json")
+            call_command("bench", iterations=2, warmup=1, output=output, stdout=StringIO())
+            with open(output) as stream:
+                report = json.load(stream)
+            self.assertEqual(set(report["scenarios"]["quiz_submit"]), {"p50_ms", "p95_ms", "queries", "alloc_peak_kb"})
+            self.assertEqual(StudentHonor.objects.get(user=student).score, score)
+
+            report["scenarios"]["home"]["queries"] -= 1
+            with open(output, "w") as stream:
+                json.dump(report, stream)
+            with self.assertRaisesMessage(CommandError, "home: queries"):
+                call_command("bench", iterations=2, warmup=1, scenario=["home"], baseline=output, stdout=StringIO())
+
+
+class SerializedWSGIServer(ThreadedWSGIServer):
+    """
+    Serves one request at a time. With in-memory SQLite every request thread
+    shares the test's single connection, so concurrent requests would run
+    inside each other's transactions.
+    """
+
+    def set_app(self, application):
+        lock = threading.Lock()
+
+        def serialized(environ, start_response):
+            with lock:
+                return application(environ, start_response)
+        super().set_app(serialized)
+
+
+class SerializedLiveServerThread(LiveServerThread):
+    server_class = SerializedWSGIServer
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class LoadTestCommandTests(LiveServerTestCase):
+    server_thread_class = SerializedLiveServerThread
+
+    def setUp(self):
+        cache.clear()
+
+    def test_students_log_in_and_run_every_scenario(self):
+        call_command("seed_bench", scale=0.01, seed=3, stdout=StringIO())
+        replies = Reply.objects.count()
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "load.json")
+            call_command("loadtest", url=self.live_server_url, users=2, duration=1.5, ramp_up=0,
+                         mix=["quiz=1", "reply=1", "upvote=1", "level=1"], output=output, stdout=StringIO())
+            with open(output) as stream:
+                report = json.load(stream)
+        self.assertEqual(report["login"]["failed"], 0)
+        self.assertEqual(report["total"]["errors"], 0, report["first_errors"])
+        self.assertGreater(report["total"]["requests"], 0)
+        self.assertTrue(all(entry["failed"] == 0 for entry in report["scenarios"].values()))
+        self.assertGreater(report["scenarios"]["reply"]["completed"], 0)
+        self.assertGreater(Reply.objects.count(), replies)
+
+        with self.assertRaisesMessage(CommandError, "Unknown scenario"):
+            call_command("loadtest", url=self.live_server_url, mix=["nap=1"], stdout=StringIO())
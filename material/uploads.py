@@ -0,0 +1,135 @@
+"""
+Resumable chunked uploads. The client creates a ChunkedUpload, PUTs the file
+in order as chunks of at most UPLOAD_CHUNK_SIZE bytes, and finalizes. Chunks
+stream from the request straight into a staging file; the staged file is
+moved (not copied) into storage when the model is saved.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+READ_SIZE = 64 * 1024
+
+
+class ChunkConflict(Exception):
+    """The chunk does not start where the verified prefix ends."""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected a chunk at offset {offset}.")
+        self.offset = offset
+
+
+class StagedFile(UploadedFile):
+    """A finished upload; FileSystemStorage moves it into place instead of copying."""
+
+    def __init__(self, path, name, size):
+        super().__init__(open(path, "rb"), name=name, size=size)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def staging_path(upload):
+    return os.path.join(settings.UPLOAD_STAGING_DIR, f"{upload.id}.part")
+
+
+def start_upload(user, target, filename, size, sha256=""):
+    if target not in dict(ChunkedUpload.TARGETS):
+        raise BadRequest("Unknown upload target.")
+    filename = os.path.basename(filename or "").strip()
+    if not filename:
+        raise BadRequest("A file name is required.")
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        raise BadRequest(f"File size must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes.")
+    upload = ChunkedUpload.objects.create(
+        user=user, target=target, filename=filename, size=size, sha256=(sha256 or "").lower(),
+    )
+    os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+    open(staging_path(upload), "wb").close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length, sha256=""):
+    """
+    Write ``length`` bytes read from ``stream`` at ``offset``. The chunk must
+    continue the verified prefix; if ``sha256`` is given it must match the
+    chunk, otherwise the chunk is discarded. Returns the new verified length.
+    """
+    if offset != upload.received:
+        raise ChunkConflict(upload.received)
+    if length <= 0 or length > settings.UPLOAD_CHUNK_SIZE or offset + length > upload.size:
+        raise BadRequest("Chunk is empty, too large or past the end of the file.")
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(staging_path(upload), "r+b") as staging:
+        staging.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            digest.update(data)
+            staging.write(data)
+            written += len(data)
+        staging.truncate(offset + written)
+    if written != length or (sha256 and digest.hexdigest() != sha256.lower()):
+        _truncate(upload, offset)
+        raise BadRequest("Chunk was incomplete or failed its checksum; resend it.")
+
+    # Only advance if nobody else did in the meantime.
+    if not ChunkedUpload.objects.filter(id=upload.id, received=offset).update(
+        received=offset + length, updated_at=timezone.now(),
+    ):
+        upload.refresh_from_db()
+        raise ChunkConflict(upload.received)
+    upload.received = offset + length
+    return upload.received
+
+
+def _truncate(upload, length):
+    with open(staging_path(upload), "r+b") as staging:
+        staging.truncate(length)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def staged_file(upload):
+    """Return the completed file after checking its size and checksum."""
+    if upload.received != upload.size:
+        raise BadRequest(f"Upload is incomplete ({upload.received} of {upload.size} bytes).")
+    path = staging_path(upload)
+    if upload.sha256 and file_digest(path) != upload.sha256:
+        raise BadRequest("Uploaded file does not match its checksum.")
+    return StagedFile(path, upload.filename, upload.size)
+
+
+def discard(upload):
+    try:
+        os.remove(staging_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def purge_stale(max_age=timedelta(days=1)):
+    """Delete uploads that have not received a chunk for ``max_age``."""
+    stale = ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - max_age)
+    count = 0
+    for upload in stale.iterator():
+        discard(upload)
+        count += 1
+    return count
@@ -0,0 +1,93 @@
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from tasks.queue import enqueue
+
+from .live import publish
+from .models import Reply, ReplyVote
+from .scoring import award_points_bulk
+
+FLUSH_LOCK_KEY = "upvotes:flush"
+# At most one opportunistic flush per interval across all workers, queued as a
+# background task (material.tasks) so its cost and failures stay out of the
+# vote request; run `manage.py flush_upvotes --loop N` to flush on a schedule
+# instead.
+FLUSH_INTERVAL = 10
+FLUSH_TASK = "material.tasks.flush_upvotes"
+BATCH_SIZE = 500
+POINTS_PER_UPVOTE = 1
+
+
+def cast_vote(user, reply):
+    """
+    Record ``user``'s upvote on ``reply``. Returns False if they already voted.
+    Only the vote row is written here; Reply.upvotes catches up at the next flush.
+    """
+    try:
+        with transaction.atomic():
+            ReplyVote.objects.create(user=user, reply=reply)
+            publish(reply.question.level_id, "upvote", {"reply": reply.id, "delta": 1})
+    except IntegrityError:
+        return False
+
+    if cache.add(FLUSH_LOCK_KEY, 1, FLUSH_INTERVAL):
+        enqueue(FLUSH_TASK)
+    return True
+
+
+def with_pending_votes(replies):
+    """
+    Annotate ``pending_votes``: votes cast but not folded into ``upvotes`` yet.
+    They are counted from the database, so the figure is right whichever
+    process runs the flush.
+    """
+    pending = ReplyVote.objects.filter(reply=OuterRef("pk"), counted=False).values("reply").annotate(
+        n=Count("id")).values("n")
+    return replies.annotate(pending_votes=Coalesce(Subquery(pending), 0))
+
+
+def attach_vote_counts(replies, user=None):
+    """
+    Set ``upvote_count`` (stored count plus pending votes) and ``voted`` on each
+    reply from ``with_pending_votes``, with at most one query.
+    """
+    voted = set()
+    if user is not None and user.is_authenticated and replies:
+        voted = set(ReplyVote.objects.filter(user=user, reply__in=replies).values_list("reply_id", flat=True))
+    for reply in replies:
+        reply.upvote_count = reply.upvotes + reply.pending_votes
+        reply.voted = reply.id in voted
+
+
+def flush_votes(batch_size=BATCH_SIZE):
+    """
+    Fold uncounted votes into Reply.upvotes and author scores: per batch one
+    UPDATE of replies, one ledger insert and one UPDATE marking the votes counted.
+    Returns the number of votes flushed.
+    """
+    flushed = 0
+    while True:
+        with transaction.atomic():
+            pending = ReplyVote.objects.filter(counted=False).order_by("id")
+            if connection.features.has_select_for_update_skip_locked:
+                pending = pending.select_for_update(skip_locked=True, of=("self",))
+            batch = list(pending.values_list("id", "reply_id", "reply__author_user_id")[:batch_size])
+            if not batch:
+                return flushed
+            per_reply = Counter(reply_id for _, reply_id, _ in batch)
+            Reply.objects.filter(id__in=list(per_reply)).update(upvotes=F("upvotes") + Case(
+                *[When(id=reply_id, then=Value(n)) for reply_id, n in per_reply.items()],
+                default=Value(0),
+            ))
+            authors = {reply_id: author_id for _, reply_id, author_id in batch}
+            award_points_bulk([
+                (authors[reply_id], n * POINTS_PER_UPVOTE, "upvote", f"reply:{reply_id}")
+                for reply_id, n in per_reply.items()
+            ])
+            ReplyVote.objects.filter(id__in=[vote_id for vote_id, _, _ in batch]).update(counted=True)
+        flushed += len(batch)
+
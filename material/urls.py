@@ -1,17 +1,24 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI the read-heavy pages and the Q&A endpoints are served by their
+# async versions.
+pages = async_views if settings.SERVER_MODE == "asgi" else views
 
 app_name = "material"
 
 urlpatterns = [
-    path("", views.homepage, name="home"),
-    path("home/", views.homepage, name="home"),
+    path("", pages.homepage, name="home"),
+    path("home/", pages.homepage, name="home"),
+    path("search/", views.search, name="search"),
 
     # Levels
     path("levels/add/", views.level_create, name="level_create"),
     path("levels/<int:pk>/edit/", views.level_edit, name="level_edit"),
     path("levels/<int:pk>/delete/", views.level_delete, name="level_delete"),
-    path("levels/<int:level_id>/", views.level_detail, name="details"),
+    path("levels/<int:level_id>/", pages.level_detail, name="details"),
+    path("levels/<int:level_id>/tabs/<slug:tab>/", pages.level_tab, name="level_tab"),
 
     # Material & Assets
     path("materials/add/", views.material_create, name="material_create"),
@@ -19,6 +26,9 @@ urlpatterns = [
     path("notes/add/", views.note_create, name="note_create"),
     path("records/add/", views.record_create, name="record_create"),
     path("images/add/", views.image_create, name="image_create"),
+    path("uploads/", views.upload_start, name="upload_start"),
+    path("uploads/<uuid:upload_id>/", views.upload_chunk, name="upload_chunk"),
+    path("uploads/<uuid:upload_id>/complete/", views.upload_complete, name="upload_complete"),
 
     # Quizzes
     path("levels/<int:level_id>/quiz/builder/", views.quiz_builder, name="quiz_builder"),
@@ -28,7 +38,12 @@ urlpatterns = [
     path("levels/<int:level_id>/quiz/submit/", views.quiz_submit, name="quiz_submit"),
 
     # Q&A
-    path("levels/<int:level_id>/question/add/", views.add_question, name="add_question"),
-    path("questions/<int:question_id>/reply/add/", views.add_reply, name="add_reply"),
-    path("replies/<int:reply_id>/upvote/", views.upvote_reply, name="upvote_reply"),
+    path("levels/<int:level_id>/question/add/", pages.add_question, name="add_question"),
+    path("questions/<int:question_id>/reply/add/", pages.add_reply, name="add_reply"),
+    path("replies/<int:reply_id>/upvote/", pages.upvote_reply, name="upvote_reply"),
+    path("levels/<int:level_id>/events/", async_views.level_events, name="level_events"),
+
+    # Operations
+    path("ops/db/", views.db_stats, name="db_stats"),
+    path("metrics", views.metrics, name="metrics"),
 ]
@@ -1,12 +1,35 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db import transaction
+from django.views.decorators.http import require_http_methods, require_POST
+from django.urls import reverse
+from django.db.models import Prefetch, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.contrib.auth.models import User
+from django.utils.crypto import constant_time_compare
 
 from .models import (
     News, Level, StudentHonor, Book, Note, Record, Image,
-    Material, Quiz, QuizQuestion, QuizAnswer, Question, Reply
+    Material, Quiz, QuizQuestion, QuizAnswer, Question, Reply, ChunkedUpload
 )
+from .dbpool import connection_stats
+from .fragments import cached_fragment
+from .metrics import render_prometheus
+from .grading import grade_submission
+from . import leaderboard
+from .quiz_bulk import create_quizzes, parse_builder_post
+from .quiz_cache import get_answer_key, get_answer_keys
+from .pagination import keyset_page
+from .replicas import replica_reads
+from .scoring import award_points
+from . import search as site_search
+from .upvotes import attach_vote_counts, cast_vote, with_pending_votes
+from .uploads import ChunkConflict, discard, staged_file, start_upload, write_chunk
 from .forms import (
     MaterialForm, NewsForm, LevelForm, BookForm, NoteForm, RecordForm, ImageForm,
     QuizForm, QuizQuestionForm, QuizAnswerForm, QuestionForm, ReplyForm
@@ -22,33 +45,113 @@ def is_staff(user):
     return user.is_staff or user.is_superuser
 
 # ── Homepage ───────────────────────────────────────────────────────────────────
+@replica_reads
 def homepage(request):
-    slides = News.objects.filter(is_slide=True)[:5]
-    news_list = News.objects.all()[:6]
-    levels = Level.objects.all()
-
-    top_students = StudentHonor.objects.select_related("user").order_by("-score")[:8]
-    ranked_students = [{"rank": i + 1, "student": s} for i, s in enumerate(top_students)]
-
+    # Each section is a cached fragment; see material.signals for invalidation.
+    staff = request.user.is_authenticated and is_staff(request.user)
+    board = leaderboard.get_leaderboard()
     return render(request, "material/home.html", {
-        "slides": slides,
-        "news_list": news_list,
-        "levels": levels,
-        "top_students": ranked_students,
+        "slides_html": cached_fragment("slides", lambda: render_to_string(
+            "material/home/slides.html", {"slides": News.objects.filter(is_slide=True)[:5]})),
+        "news_html": cached_fragment("news", lambda: render_to_string(
+            "material/home/news.html", {"news_list": News.objects.all()[:6]})),
+        "levels_html": cached_fragment("levels", lambda: render_to_string(
+            "material/home/levels.html", {"levels": Level.objects.all(), "show_staff_controls": staff}),
+            variant="staff" if staff else "public"),
+        "honor_board_html": cached_fragment("honor_board", lambda: render_to_string(
+            "material/home/honor_board.html", {"top_students": board.top(8)}),
+            version=leaderboard.current_generation()),
     })
 
 # ── Level detail ───────────────────────────────────────────────────────────────
+def with_author_name(qs):
+    # Resolve "author_user.username, else author, else Anon" in SQL so the
+    # templates never touch the User table per row.
+    return qs.annotate(author_name=Coalesce(
+        "author_user__username", NullIf("author", Value("")), Value("Anon"),
+    ))
+
+@replica_reads
 def level_detail(request, level_id):
+    # Only the header and the default tab are rendered here; the other tabs are
+    # fetched from level_tab when opened.
     level = get_object_or_404(Level, id=level_id)
     return render(request, "material/subs.html", {
         "level": level,
-        "books": level.books.all(),
-        "notes": level.notes.all(),
-        "records": level.records.all(),
-        "images": level.images.all(),
-        "quizzes": level.quizzes.all(),
-        "questions": level.questions.all(),
-        "news_list": level.news.all(),
+        "default_tab": level_tab_context(request, level, LEVEL_DEFAULT_TAB),
+        "live_events": settings.SERVER_MODE == "asgi",
+    })
+
+def _attach_answer_keys(request, quizzes):
+    # Questions and answers come from the compiled answer-key cache.
+    answer_keys = get_answer_keys([quiz.id for quiz in quizzes])
+    for quiz in quizzes:
+        quiz.answer_key = answer_keys.get(quiz.id, {"questions": []})
+
+# Replies of the whole page come from one IN query; ordering by question first
+# lets reply_question_idx return them already sorted.
+QA_REPLY_ORDERING = ("question_id", "-upvotes", "-created_at")
+
+def _qa_tab_queryset(level):
+    return with_author_name(level.questions.all()).prefetch_related(
+        Prefetch("replies", queryset=with_pending_votes(with_author_name(Reply.objects.order_by(*QA_REPLY_ORDERING)))),
+    )
+
+# tab -> (queryset factory, keyset ordering, page size)
+LEVEL_TABS = {
+    "books": (lambda level: level.books.all(), ("id",), 24),
+    "notes": (lambda level: level.notes.all(), ("id",), 30),
+    "records": (lambda level: level.records.all(), ("id",), 30),
+    "images": (lambda level: level.images.all(), ("id",), 24),
+    "news": (lambda level: level.news.all(), ("-created_at", "-id"), 12),
+    "quizzes": (lambda level: level.quizzes.all(), ("id",), 5),
+    "qa": (_qa_tab_queryset, ("-created_at", "-id"), 20),
+}
+def _attach_reply_votes(request, questions):
+    attach_vote_counts([r for q in questions for r in q.replies.all()], request.user)
+
+LEVEL_TAB_PREPARE = {"quizzes": _attach_answer_keys, "qa": _attach_reply_votes}
+LEVEL_DEFAULT_TAB = "books"
+
+def level_tab_context(request, level, tab):
+    queryset_for, ordering, size = LEVEL_TABS[tab]
+    cursor = request.GET.get("cursor")
+    items, next_cursor = keyset_page(queryset_for(level), ordering, cursor, size)
+    if tab in LEVEL_TAB_PREPARE:
+        LEVEL_TAB_PREPARE[tab](request, items)
+    next_url = None
+    if next_cursor:
+        next_url = f"{reverse('material:level_tab', args=[level.id, tab])}?cursor={next_cursor}"
+    return {
+        "template": f"material/tabs/{tab}.html",
+        "level": level,
+        "items": items,
+        "is_first_page": not cursor,
+        "next_url": next_url,
+    }
+
+def level_tab(request, level_id, tab):
+    if tab not in LEVEL_TABS:
+        raise Http404("Unknown tab.")
+    level = get_object_or_404(Level, id=level_id)
+    context = level_tab_context(request, level, tab)
+    return render(request, context["template"], context)
+
+# ── Search ─────────────────────────────────────────────────────────────────────
+def search(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+        level_id = int(request.GET["level"]) if request.GET.get("level") else None
+    except ValueError:
+        raise Http404("Invalid page")
+    results, has_next = site_search.search(query, page=page, level_id=level_id)
+    return render(request, "material/search.html", {
+        "query": query,
+        "results": results,
+        "page": page,
+        "has_next": has_next,
+        "level_id": level_id,
     })
 
 # ── Level CRUD ─────────────────────────────────────────────────────────────────
@@ -114,7 +217,7 @@ def book_create(request):
             return redirect("material:details", level_id=book.level.id)
     else:
         form = BookForm()
-    return render(request, "material/simple_form.html", {"form": form, "title": "Add Book"})
+    return render(request, "material/simple_form.html", {"form": form, "title": "Add Book", "chunked_target": "book"})
 
 @login_required
 @user_passes_test(is_staff)
@@ -140,7 +243,7 @@ def record_create(request):
             return redirect("material:details", level_id=record.level.id)
     else:
         form = RecordForm()
-    return render(request, "material/simple_form.html", {"form": form, "title": "Add Audio"})
+    return render(request, "material/simple_form.html", {"form": form, "title": "Add Audio", "chunked_target": "record"})
 
 @login_required
 @user_passes_test(is_staff)
@@ -155,6 +258,79 @@ def image_create(request):
         form = ImageForm()
     return render(request, "material/simple_form.html", {"form": form, "title": "Add Image"})
 
+# ── Chunked uploads ────────────────────────────────────────────────────────────
+# JSON endpoints used by simple_form.html to upload large books and recordings
+# in resumable chunks; see material.uploads.
+UPLOAD_FORMS = {
+    "book": (BookForm, "Book uploaded."),
+    "record": (RecordForm, "Audio uploaded."),
+}
+
+def _upload_state(upload):
+    return {
+        "id": str(upload.id),
+        "offset": upload.received,
+        "size": upload.size,
+        "chunk_size": settings.UPLOAD_CHUNK_SIZE,
+        "chunk_url": reverse("material:upload_chunk", args=[upload.id]),
+        "complete_url": reverse("material:upload_complete", args=[upload.id]),
+    }
+
+@login_required
+@user_passes_test(is_staff)
+@require_POST
+def upload_start(request):
+    try:
+        size = int(request.POST.get("size", ""))
+        upload = start_upload(request.user, request.POST.get("target"), request.POST.get("filename"),
+                              size, request.POST.get("sha256", ""))
+    except ValueError:
+        return JsonResponse({"error": "File size must be a number."}, status=400)
+    except BadRequest as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    return JsonResponse(_upload_state(upload), status=201)
+
+@login_required
+@user_passes_test(is_staff)
+@require_http_methods(["GET", "PUT"])
+def upload_chunk(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, user=request.user)
+    if request.method == "GET":
+        return JsonResponse(_upload_state(upload))
+    try:
+        offset = int(request.GET.get("offset", ""))
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+        write_chunk(upload, offset, request, length, request.headers.get("X-Chunk-Sha256", ""))
+    except ValueError:
+        return JsonResponse({"error": "Offset must be a number."}, status=400)
+    except ChunkConflict as exc:
+        return JsonResponse({"error": str(exc), "offset": exc.offset}, status=409)
+    except BadRequest as exc:
+        return JsonResponse({"error": str(exc), "offset": upload.received}, status=400)
+    return JsonResponse(_upload_state(upload))
+
+@login_required
+@user_passes_test(is_staff)
+@require_POST
+def upload_complete(request, upload_id):
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, user=request.user)
+    form_class, message = UPLOAD_FORMS[upload.target]
+    try:
+        staged = staged_file(upload)
+    except BadRequest as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    with staged:
+        form = form_class(request.POST, {"file": staged})
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        # Saving moves the staged file into storage, unless an identical blob
+        # already exists.
+        with transaction.atomic():
+            obj = form.save()
+    discard(upload)
+    messages.success(request, message)
+    return JsonResponse({"redirect": reverse("material:details", kwargs={"level_id": obj.level_id})})
+
 # ── Quiz ───────────────────────────────────────────────────────────────────────
 @login_required
 @user_passes_test(is_staff)
@@ -210,53 +386,23 @@ def quiz_submit(request, level_id):
     if request.method != "POST":
         return redirect("material:details", level_id=level_id)
 
-    level = get_object_or_404(Level, id=level_id)
-    quiz = get_object_or_404(Quiz, id=request.POST.get("quiz_id"), level=level)
-
-    correct = 0
-    total = 0
-    wrong_questions = []
-
-    for question in quiz.questions.all():
-        total += 1
-        answers = question.answers.all()
-
-        if question.question_type in ["single", "truefalse"]:
-            chosen_id = request.POST.get(f"question_{question.id}")
-            if chosen_id:
-                chosen = get_object_or_404(QuizAnswer, id=chosen_id)
-                if chosen.is_correct:
-                    correct += 1
-                else:
-                    wrong_questions.append({
-                        "question": question,
-                        "your_answers": [chosen],
-                        "correct_answers": [a for a in answers if a.is_correct],
-                    })
-        elif question.question_type == "multiple":
-            chosen_ids = request.POST.getlist(f"question_{question.id}")
-            chosen = list(QuizAnswer.objects.filter(id__in=chosen_ids, question=question))
-            correct_answers = list(answers.filter(is_correct=True))
-            if set(chosen) == set(correct_answers):
-                correct += 1
-            else:
-                wrong_questions.append({
-                    "question": question,
-                    "your_answers": chosen,
-                    "correct_answers": correct_answers,
-                })
+    try:
+        quiz_id = int(request.POST.get("quiz_id", ""))
+    except ValueError:
+        raise Http404("No such quiz.")
+    key = get_answer_key(quiz_id)
+    if key is None or key["level_id"] != level_id:
+        raise Http404("No such quiz.")
+    correct, total, wrong_questions = grade_submission(key, request.POST)
 
     if total > 0:
-        honor = ensure_honor_entry(request.user)
-        if honor:
-            honor.score += correct * 10
-            honor.save()
+        award_points(request.user, correct * 10, "quiz", ref=f"quiz:{quiz_id}")
         messages.success(request, f"You got {correct}/{total} correct. +{correct*10} points")
     else:
         messages.warning(request, "No answers submitted.")
 
     return render(request, "material/quiz_result.html", {
-        "quiz": quiz,
+        "quiz": key,
         "correct": correct,
         "total": total,
         "wrong_questions": wrong_questions,
@@ -266,44 +412,25 @@ def quiz_submit(request, level_id):
 @login_required
 @user_passes_test(is_staff)
 def quiz_builder(request, level_id=None):
-    from .models import Level, Quiz, QuizQuestion, QuizAnswer
-
+    errors = {}
+    questions = []
     if request.method == "POST":
-        title = request.POST.get("title")
-        level_id_post = request.POST.get("level") or level_id
-        level = get_object_or_404(Level, id=level_id_post)
-
-        quiz = Quiz.objects.create(title=title, level=level)
-
-        q_count = int(request.POST.get("question_count", 0))
-        for i in range(1, q_count + 1):
-            q_text = request.POST.get(f"question_{i}_text")
-            q_type = request.POST.get(f"question_{i}_type")
-            if not q_text:
-                continue
-            question = QuizQuestion.objects.create(
-                quiz=quiz,
-                text=q_text,
-                question_type=q_type or "single"
-            )
-
-            a_count = int(request.POST.get(f"question_{i}_answer_count", 0))
-            for j in range(1, a_count + 1):
-                a_text = request.POST.get(f"question_{i}_answer_{j}_text")
-                is_correct = request.POST.get(f"question_{i}_answer_{j}_correct") == "on"
-                if a_text:
-                    QuizAnswer.objects.create(
-                        question=question,
-                        text=a_text,
-                        is_correct=is_correct
-                    )
-
-        messages.success(request, "Quiz created successfully with questions & answers.")
-        return redirect("material:details", level_id=level.id)
+        quiz, errors = parse_builder_post(request.POST, level_id)
+        if not errors:
+            create_quizzes([quiz])
+            messages.success(request, "Quiz created successfully with questions & answers.")
+            return redirect("material:details", level_id=quiz["level_id"])
+        # Shown again so the author only fixes what the errors point at.
+        questions = quiz["questions"]
 
     return render(request, "material/quiz_builder.html", {
         "levels": Level.objects.all(),
         "level_id": level_id,
+        "errors": errors,
+        "title": request.POST.get("title", ""),
+        "selected_level": request.POST.get("level") or level_id,
+        "questions": questions,
+        "question_types": QuizQuestion.QUESTION_TYPES,
     })
 
 
@@ -324,6 +451,11 @@ def add_question(request, level_id):
             messages.success(request, "Question added.")
     return redirect("material:details", level_id=level_id)
 
+def save_reply(reply):
+    # The reply, its search document and its live event commit together.
+    with transaction.atomic():
+        reply.save()
+
 def add_reply(request, question_id):
     question = get_object_or_404(Question, id=question_id)
     if request.method == "POST":
@@ -335,18 +467,32 @@ def add_reply(request, question_id):
                 r.author_user = request.user
                 if not r.author:
                     r.author = request.user.username
-            r.save()
+            save_reply(r)
             messages.success(request, "Reply added.")
     return redirect("material:details", level_id=question.level.id)
 
+@login_required
 def upvote_reply(request, reply_id):
-    reply = get_object_or_404(Reply, id=reply_id)
-    reply.upvotes += 1
-    reply.save()
-    if reply.author_user:
-        honor = ensure_honor_entry(reply.author_user)
-        if honor:
-            honor.score += 1
-            honor.save()
-    messages.success(request, "Upvoted.")
-    return redirect("material:details", level_id=reply.question.level.id)
+    reply = get_object_or_404(Reply.objects.select_related("question"), id=reply_id)
+    if request.method == "POST":
+        if cast_vote(request.user, reply):
+            messages.success(request, "Upvoted.")
+        else:
+            messages.info(request, "You already upvoted this reply.")
+    return redirect("material:details", level_id=reply.question.level_id)
+
+# ── Operations ─────────────────────────────────────────────────────────────────
+@login_required
+@user_passes_test(is_staff)
+def db_stats(request):
+    # Counters of the worker process that served this request.
+    return JsonResponse(connection_stats())
+
+def metrics(request):
+    # Prometheus scrapes with the token; staff can look in the browser.
+    authorization = request.headers.get("Authorization", "")
+    token_ok = bool(settings.METRICS_TOKEN) and constant_time_compare(
+        authorization, f"Bearer {settings.METRICS_TOKEN}")
+    if not token_ok and not (request.user.is_authenticated and is_staff(request.user)):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
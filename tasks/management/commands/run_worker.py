@@ -0,0 +1,49 @@
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tasks.queue import claim, run_claimed_in_thread
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks with a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="Worker threads.")
+        parser.add_argument("--poll", type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Drain the ready tasks and exit.")
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stopping.set())
+
+        concurrency = options["concurrency"]
+        slots = threading.Semaphore(concurrency)
+        ran = 0
+        self.stdout.write(f"Worker started with {concurrency} threads.")
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="task") as pool:
+            while not stopping.is_set():
+                free = 0
+                while slots.acquire(blocking=False):
+                    free += 1
+                task_ids = claim(free) if free else []
+                close_old_connections()
+                for _ in range(free - len(task_ids)):
+                    slots.release()
+                for task_id in task_ids:
+                    future = pool.submit(run_claimed_in_thread, task_id)
+                    future.add_done_callback(lambda _: slots.release())
+                ran += len(task_ids)
+
+                if not task_ids:
+                    if options["once"] and free == concurrency:
+                        break
+                    stopping.wait(options["poll"] if free else 0.05)
+        self.stdout.write(f"Worker stopped after {ran} tasks.")
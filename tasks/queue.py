@@ -0,0 +1,174 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+BACKOFF_BASE = 5
+BACKOFF_MAX = 60 * 60
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_attempts, timeout):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.__doc__ = func.__doc__
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, idempotency_key=None, delay=None, **kwargs):
+        return enqueue(self.name, kwargs, idempotency_key=idempotency_key, delay=delay)
+
+
+def task(name=None, max_attempts=5, timeout=300):
+    """
+    Register a function as a background task. Keyword arguments must be
+    JSON-serializable; ``timeout`` is the visibility timeout in seconds.
+
+        @task()
+        def send_report(user_id): ...
+
+        send_report.enqueue(user_id=1)
+    """
+    def decorator(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        _registry[task_name] = TaskFunction(func, task_name, max_attempts, timeout)
+        return _registry[task_name]
+    return decorator
+
+
+def enqueue(name, kwargs=None, idempotency_key=None, delay=None):
+    """
+    Queue ``name`` to run with ``kwargs``. A task with the same idempotency key
+    is only ever queued once; the existing row is returned instead.
+    """
+    task_function = _registry[name]
+    run_after = timezone.now() + timedelta(seconds=delay or 0)
+    try:
+        with transaction.atomic():
+            queued = Task.objects.create(
+                name=name, kwargs=kwargs or {}, idempotency_key=idempotency_key,
+                max_attempts=task_function.max_attempts, run_after=run_after,
+            )
+    except IntegrityError:
+        if idempotency_key is None:
+            raise
+        return Task.objects.get(idempotency_key=idempotency_key)
+
+    if getattr(settings, "TASKS_EAGER", False):
+        transaction.on_commit(lambda: _run_now(queued.id, name))
+    return queued
+
+
+def _run_now(task_id, name):
+    if _claim_one(task_id, name, timezone.now()):
+        run_task(task_id)
+
+
+def _claimable(now):
+    return (
+        Q(status=Task.QUEUED, run_after__lte=now)
+        | Q(status=Task.RUNNING, locked_until__lt=now, attempts__lt=F("max_attempts"))
+    )
+
+
+def reap_expired():
+    """Fail running tasks whose visibility timeout passed on their last attempt."""
+    now = timezone.now()
+    return Task.objects.filter(
+        status=Task.RUNNING, locked_until__lt=now, attempts__gte=F("max_attempts"),
+    ).update(status=Task.FAILED, locked_until=None, finished_at=now,
+             last_error="Visibility timeout expired on the last attempt.")
+
+
+def claim(limit=1):
+    """
+    Mark up to ``limit`` ready tasks as running and return their ids. Each claim
+    is a conditional UPDATE, so concurrent workers never get the same task.
+    """
+    reap_expired()
+    now = timezone.now()
+    claimed = []
+    candidates = Task.objects.filter(_claimable(now)).order_by("run_after", "id")
+    for task_id, name in candidates.values_list("id", "name")[:limit * 2]:
+        if _claim_one(task_id, name, now):
+            claimed.append(task_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def _claim_one(task_id, name, now):
+    task_function = _registry.get(name)
+    timeout = task_function.timeout if task_function else 300
+    return Task.objects.filter(_claimable(now), id=task_id).update(
+        status=Task.RUNNING,
+        locked_until=now + timedelta(seconds=timeout),
+        attempts=F("attempts") + 1,
+    )
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_task(task_id):
+    """Run a claimed task and record the outcome."""
+    queued = Task.objects.get(id=task_id)
+    task_function = _registry.get(queued.name)
+    try:
+        if task_function is None:
+            raise LookupError(f"Unknown task {queued.name!r}")
+        task_function(**queued.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Task %s #%s failed (attempt %s):\n%s", queued.name, queued.id, queued.attempts, error)
+        retry = task_function is not None and queued.attempts < queued.max_attempts
+        Task.objects.filter(id=queued.id).update(
+            status=Task.QUEUED if retry else Task.FAILED,
+            run_after=timezone.now() + timedelta(seconds=backoff(queued.attempts)),
+            locked_until=None,
+            last_error=error,
+            finished_at=None if retry else timezone.now(),
+        )
+        return False
+    Task.objects.filter(id=queued.id).update(
+        status=Task.DONE, locked_until=None, finished_at=timezone.now(),
+    )
+    return True
+
+
+def run_pending(limit=100):
+    """Claim and run ready tasks in this thread. Returns how many ran."""
+    ran = 0
+    while ran < limit:
+        task_ids = claim(min(10, limit - ran))
+        if not task_ids:
+            break
+        for task_id in task_ids:
+            run_task(task_id)
+            ran += 1
+    return ran
+
+
+def run_claimed_in_thread(task_id):
+    """Pool entry point: run one task with a clean database connection."""
+    close_old_connections()
+    try:
+        return run_task(task_id)
+    finally:
+        close_old_connections()
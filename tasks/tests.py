@@ -0,0 +1,67 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import claim, run_pending, run_task, task
+
+calls = []
+
+
+@task(name="tests.record", max_attempts=3, timeout=30)
+def record(value):
+    calls.append(value)
+
+
+@task(name="tests.flaky", max_attempts=2)
+def flaky():
+    raise RuntimeError("boom")
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_tasks_run_once_per_idempotency_key(self):
+        first = record.enqueue(value=1, idempotency_key="k")
+        second = record.enqueue(value=2, idempotency_key="k")
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, [1])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        queued = flaky.enqueue()
+        run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertGreater(queued.run_after, timezone.now())
+        self.assertIn("RuntimeError: boom", queued.last_error)
+        self.assertEqual(run_pending(), 0)
+
+        Task.objects.update(run_after=timezone.now())
+        run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+
+    def test_claimed_tasks_are_invisible_until_their_timeout(self):
+        record.enqueue(value=1)
+        [task_id] = claim(5)
+        self.assertEqual(claim(5), [])
+
+        later = timezone.now() + timedelta(seconds=31)
+        with mock.patch("tasks.queue.timezone.now", return_value=later):
+            self.assertEqual(claim(5), [task_id])
+        self.assertEqual(Task.objects.get().attempts, 2)
+        self.assertTrue(run_task(task_id))
+        self.assertEqual(calls, [1])
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record.enqueue(value=3)
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [3])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
@@ -2,16 +2,19 @@ from django.contrib.auth import login, logout, authenticate, get_user_model
 from django.shortcuts import render, redirect
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.template.loader import render_to_string
 from django.contrib.auth.tokens import default_token_generator as token_generator
-from django.core.mail import EmailMessage
 from django.urls import reverse
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
 
 from .forms import RegisterForm
 from material.models import StudentHonor
+from material.leaderboard import get_leaderboard
+from material.replicas import replica_reads
+from material.scoring import pending_points
+from mailer.outbox import queue_mail
 
 User = get_user_model()
 
@@ -21,10 +24,20 @@ def _ensure_honor(user):
     obj, _ = StudentHonor.objects.get_or_create(user=user)
     return obj
 
+@replica_reads
 @login_required
 def profile_view(request):
-    honor = _ensure_honor(request.user)
-    return render(request, 'users/profile.html', {'honor': honor})
+    # Read-only, so replica_reads may run it again on the primary; the
+    # StudentHonor row is created at activation or with the first points.
+    score = StudentHonor.objects.filter(user=request.user).values_list('score', flat=True).first() or 0
+    score += pending_points(request.user)
+    board = get_leaderboard()
+    return render(request, 'users/profile.html', {
+        'score': score,
+        'rank': board.rank(request.user.id),
+        'top_percent': board.top_percent(request.user.id),
+        'ranked_students': len(board),
+    })
 
 def register_view(request):
     if request.method == 'POST':
@@ -44,10 +57,7 @@ def register_view(request):
                 'user': user,
                 'activation_link': activation_link,
             })
-            mail_subject = 'Activate your account'
-            email = EmailMessage(mail_subject, message, to=[form.cleaned_data['email']])
-            email.content_subtype = "html"
-            email.send()
+            queue_mail('Activate your account', message, [form.cleaned_data['email']], html=True)
 
             messages.success(request, "Verification email sent. Check your inbox.")
             return render(request, 'users/verify_sent.html')